@@ -1,25 +1,65 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 import os
 import html
-import re
+import hashlib
+import json
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
 from io import BytesIO
 
+from rsa_pipeline import (
+    MONTHLY_BUDGET, UPLOAD_DIR, REQUIRED_COLUMNS, TICKET_COLUMN, SOURCE_COLUMN, PERCENT_AGGREGATIONS, RUNNING_AGGREGATIONS,
+    process_workbook_bytes, read_snapshot, write_snapshot, snapshot_path, workbook_digest, file_digest,
+    report_files, load_report_directory, hold_snapshots, frame_footprint, lean_frame, with_text_columns,
+    append_new_cases, build_filter_index, filter_options, cascaded_options, filter_mask, filter_signature,
+    aggregate_cube, merge_cubes, build_cube, pivot_cache, build_pivot, build_sparse_pivot,
+    SKETCH_DIMENSIONS, SKETCH_FIELDS, DISTINCT_BREAKDOWNS, aggregate_sketches, merge_sketches, build_sketches,
+    write_sketches, distinct_counts, exact_distinct_counts, lru_cached, CHART_CACHE_SIZE,
+    COVERAGE_STATUS, COVERAGE_POLICY_FILTERS, coverage_index, coverage_summary, coverage_by_month,
+    month_totals, daily_totals, compute_kpis, compute_kpis_as_of, portfolio_health, chart_cache, chart_series,
+    EXPORT_FORMATS, XLSX_MAX_ROWS, export_bytes, logger,
+)
+
 
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
-MONTHLY_BUDGET = 200_000
-HEALTH_THRESHOLD_HEALTHY = 5
-HEALTH_THRESHOLD_WARNING = 15
 CACHE_TTL = 3600
 DEFAULT_DATA_FILE = "(Test) RSA Report.xlsx"
-UPLOAD_DIR = "uploaded_data"
+# Folder of monthly/quarterly RSA workbooks loaded as one dataset, ahead of DEFAULT_DATA_FILE
+REPORT_DIR = os.environ.get("RSA_REPORT_DIR", "reports")
+# Dataset built by appending monthly delta reports to the stored one
+APPENDED_DATASET = os.path.join(UPLOAD_DIR, "appended_dataset.parquet")
+# Processed datasets kept in memory beyond those pinned by active sessions
+DATASET_STORE_SIZE = 4
+# Pivot cells formatted per rerun: one page of rows x one window of value columns
+PIVOT_PAGE_ROWS = 50
+PIVOT_PAGE_COLS = 12
+# Row x column grids above this many cells are shown in long format when the layout is Auto
+PIVOT_GRID_MAX_CELLS = 200_000
+# Stage timings for every session, logged once per rerun (the sidebar panel is per session)
+PROFILE_ALL_SESSIONS = os.environ.get("RSA_PROFILE") == "1"
+# Trace allocations for the stages' peak memory. tracemalloc is process-wide and slows every
+# session, so it is chosen at startup; the peaks then include other sessions' concurrent work
+TRACE_MEMORY = os.environ.get("RSA_TRACE_MEMORY") == "1"
+# Keep free-text and contact columns out of the shared frames; exports read them back from the snapshot
+LEAN_FRAMES = os.environ.get("RSA_LEAN", "1") != "0"
+# Seconds between progress refreshes while an upload is processed in the background
+INGEST_POLL_SECONDS = 1.0
+# Background ingest steps, in order -> label under the progress bar
+INGEST_STEPS = {'sheet detection': 'Detecting the report sheet', 'parse': 'Reading rows',
+                'clean': 'Cleaning columns', 'index': 'Building filters and aggregates'}
+# Export format -> label in the Export Data menu
+EXPORT_LABELS = {'csv': 'CSV (UTF-8)', 'parquet': 'Parquet', 'xlsx': 'Excel'}
 
-pd.set_option('future.no_silent_downcasting', True)
 
 st.set_page_config(
     page_title="RSA Dashboard - Sompo Thailand",
@@ -28,6 +68,58 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# ============================================================================
+# INSTRUMENTATION (per-stage wall time, rows, traced peak memory, cache outcome)
+# ============================================================================
+_profile = dict(enabled=PROFILE_ALL_SESSIONS or st.session_state.get('profile_panel', False),
+                stages=[], current=None, finished=False, started=time.perf_counter())
+if TRACE_MEMORY and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+
+@contextmanager
+def stage(name, rows_in=None, cache=None):
+    """Record one stage of the script run when profiling is on; yields the record to fill in.
+
+    Peak memory (with RSA_TRACE_MEMORY=1 only) is the process's traced allocation
+    high-water mark above the level at stage start. Stages do not nest.
+    """
+    record = dict(stage=name, seconds=None, rows_in=rows_in, rows_out=None, peak_mb=None, cache=cache)
+    if not _profile['enabled']:
+        yield record
+        return
+    tracing = TRACE_MEMORY and tracemalloc.is_tracing()
+    if tracing:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    _profile['current'] = record
+    t0 = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = round(time.perf_counter() - t0, 4)
+        if tracing:
+            record['peak_mb'] = round((tracemalloc.get_traced_memory()[1] - base) / 2**20, 2)
+        _profile['current'] = None
+        _profile['stages'].append(record)
+        if _profile['finished']:
+            # Fragment rerun: the log line of the full run has already been written
+            log_profile('fragment', [record])
+
+
+def profile_note(**info):
+    """Attach details (e.g. cache='miss') to the stage being recorded; the first value set wins."""
+    if _profile['current'] is not None:
+        for key, value in info.items():
+            if _profile['current'].get(key) is None:
+                _profile['current'][key] = value
+
+
+def log_profile(run, stages):
+    logger.info("profile %s", json.dumps(dict(
+        session=st.session_state.get('session_id'), run=run,
+        seconds=round(sum(s['seconds'] for s in stages), 4), stages=stages), ensure_ascii=False))
+
 # ============================================================================
 # PASSWORD PROTECTION
 # ============================================================================
@@ -77,106 +169,175 @@ with open(os.path.join(os.path.dirname(__file__), 'style.css')) as _css_file:
 
 
 # ============================================================================
-# DATA LOADING
+# DATASET STORE (process-wide, content-addressed; sessions only hold a digest)
 # ============================================================================
-@st.cache_data(ttl=CACHE_TTL)
-def load_and_process(file_bytes=None, file_path=None):
-    """Load from bytes or path and process in one cached step."""
-    if file_bytes is not None:
-        source = BytesIO(file_bytes)
-    elif file_path and os.path.exists(file_path):
-        source = file_path
-    else:
-        return None
+@st.cache_resource
+def dataset_store():
+    """Processed frames by digest (LRU), source file -> digest memo, and session pins."""
+    return dict(frames=OrderedDict(), sources={}, sessions={}, lock=threading.Lock())
 
-    # Find the correct sheet: prefer header containing both 'Roadside_Plan' and 'Policy Type',
-    # fallback to any sheet containing 'Policy No.' in a header row
-    xls = pd.ExcelFile(source)
-    df_raw = None
-    fallback_raw = None
-    required_headers = {'Roadside_Plan', 'Policy Type'}
-    for sheet in xls.sheet_names:
-        candidate = pd.read_excel(xls, sheet_name=sheet, header=None)
-        for idx in range(min(len(candidate), 30)):
-            row_vals = set(str(v).strip() for v in candidate.iloc[idx].values if pd.notna(v))
-            if required_headers.issubset(row_vals):
-                df_raw = candidate
-                break
-            if fallback_raw is None and 'Policy No.' in row_vals:
-                fallback_raw = candidate
-        if df_raw is not None:
-            break
-    if df_raw is None:
-        df_raw = fallback_raw
-    if df_raw is None:
-        # Last resort: first sheet
-        df_raw = pd.read_excel(xls, sheet_name=0, header=None)
-
-    df = df_raw.copy()
-    # Find header row
-    for idx in range(min(len(df), 30)):
-        if 'Policy No.' in df.iloc[idx].values:
-            df.columns = df.iloc[idx]
-            df = df.iloc[idx + 1:].reset_index(drop=True)
-            break
-    else:
-        raise ValueError("Could not find header row containing 'Policy No.'")
 
-    # Clean Fee column name
-    fee_cols = [c for c in df.columns if isinstance(c, str) and 'Fee' in c and 'Exceed' not in c]
-    if fee_cols:
-        df = df.rename(columns={fee_cols[0]: 'Fee (Baht)'})
+def _read_dataset_bytes(file_bytes, digest):
+    return pd.read_parquet(BytesIO(file_bytes))
 
-    # Process dates
-    if '\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48' in df.columns:
-        if df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'].dtype == 'object':
-            df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'] = pd.to_datetime(df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'], format='%d/%m/%Y', errors='coerce')
-        else:
-            df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'] = pd.to_datetime(df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'], errors='coerce')
-        df = df.dropna(subset=['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'])
-        df['Day'] = df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'].dt.day.astype(int)
-        df['Month'] = df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'].dt.month.astype(int)
-        df['Year'] = df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'].dt.year.astype(int)
-        df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'] = df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'].dt.date
-
-    df = df.dropna(how='all').reset_index(drop=True)
-    df = df.replace('-', pd.NA)
-
-    # LOB
-    if 'Policy No.' in df.columns:
-        df['Policy Type'] = df['Policy No.'].str.extract(r'(A[CV]\d)', expand=False)
-    df['LOB'] = df['Policy Type'].fillna('Unverify') if 'Policy Type' in df.columns else 'Unre'
-
-    # Province extraction
-    if '\u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16' in df.columns:
-        if '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16' in df.columns:
-            df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'] = df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'].astype(str).str.replace(r'[.!@#$%^&*\d]', '', regex=True).str.strip()
-            df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'] = df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'].replace(['', 'nan', 'None', '<NA>'], pd.NA)
-        plate_province = df['\u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'].astype(str).str.extract(r'(\d)[.\s]*([ก-๙]+)\s*[.!@#$%^&*]*\s*$', expand=True)
-        extracted = plate_province[1]
-        if '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16' in df.columns:
-            df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'] = df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'].fillna(extracted)
+
+def _live_datasets(store):
+    """Number of sessions seen within CACHE_TTL that pin each digest."""
+    cutoff = time.time() - CACHE_TTL
+    counts = {}
+    for session_id, (digest, seen) in list(store['sessions'].items()):
+        if seen < cutoff:
+            del store['sessions'][session_id]
         else:
-            df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'] = extracted
-        df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'] = df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'].replace(['\u0e01\u0e23\u0e38\u0e07\u0e40\u0e17\u0e1e', '\u0e01\u0e17\u0e21'], '\u0e01\u0e23\u0e38\u0e07\u0e40\u0e17\u0e1e\u0e21\u0e2b\u0e32\u0e19\u0e04\u0e23')
+            counts[digest] = counts.get(digest, 0) + 1
+    return counts
+
+
+def _hold_snapshots(store):
+    """Keep the snapshots of frames in the store and of pinned datasets from being pruned; call with the lock held."""
+    hold_snapshots(set(store['frames']) | {digest for digest, _ in store['sessions'].values()})
+
+
+def _evict_dataset(store, digest):
+    """Drop the frame of `digest` and every source file mapped to it; call with the store lock held."""
+    store['frames'].pop(digest, None)
+    for source in [k for k, v in store['sources'].items() if v == digest]:
+        del store['sources'][source]
+
+
+def _store_frame(store, digest, df):
+    """Register `df` as the most recently used frame, evicting unpinned ones over capacity."""
+    df.attrs['digest'] = digest
+    if LEAN_FRAMES and not os.path.exists(snapshot_path(digest)):
+        # The text columns stay in the snapshot for exports, so make sure there is one
+        write_snapshot(df, digest)
+    # A frame whose snapshot could not be written keeps its text columns
+    if LEAN_FRAMES and os.path.exists(snapshot_path(digest)):
+        full_mb = frame_footprint(df) / 1e6
+        df = lean_frame(df)
+        logger.info("Dataset %s: %d rows, %.1f MB resident (%.1f MB with text columns)",
+                    digest, len(df), frame_footprint(df) / 1e6, full_mb)
+    with store['lock']:
+        store['frames'][digest] = df
+        store['frames'].move_to_end(digest)
+        live = _live_datasets(store)
+        for key in list(store['frames']):
+            if len(store['frames']) <= DATASET_STORE_SIZE:
+                break
+            if key != digest and not live.get(key):
+                _evict_dataset(store, key)
+        _hold_snapshots(store)
+    return df
 
-    if 'Fee (Baht)' in df.columns:
-        df['Fee (Baht)'] = pd.to_numeric(df['Fee (Baht)'], errors='coerce')
 
-    # Set Fee to 100 for cancellation or inquiry service types
-    if 'Fee (Baht)' in df.columns and '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23' in df.columns:
-        cancel_inquiry_mask = df['\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23'].isin(['\u0e25\u0e39\u0e01\u0e04\u0e49\u0e32\u0e41\u0e08\u0e49\u0e07\u0e22\u0e01\u0e40\u0e25\u0e34\u0e01', '\u0e2a\u0e2d\u0e1a\u0e16\u0e32\u0e21\u0e02\u0e49\u0e2d\u0e21\u0e39\u0e25'])
-        df.loc[cancel_inquiry_mask, 'Fee (Baht)'] = 100
+def load_dataset(file_bytes=None, file_path=None, loader=process_workbook_bytes):
+    """Return the digest of the processed dataset for a file, processing it at most once.
+
+    Files are identified by content; a path is only re-read and re-hashed when its
+    size or modification time changes.
+    """
+    store = dataset_store()
+    source = None
+    if file_bytes is None:
+        if not (file_path and os.path.exists(file_path)):
+            return None
+        stat = os.stat(file_path)
+        source = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        digest = store['sources'].get(source)
+        if digest is not None and get_dataset(digest) is not None:
+            return digest
+        with open(file_path, 'rb') as f:
+            file_bytes = f.read()
+
+    digest = workbook_digest(file_bytes)
+    if get_dataset(digest) is None:
+        profile_note(cache='miss')
+        _store_frame(store, digest, loader(file_bytes, digest))
+    if source is not None:
+        with store['lock']:
+            store['sources'][source] = digest
+    return digest
+
+
+def load_report_dataset(directory):
+    """Digest of the dataset merged from every workbook in `directory`.
+
+    The directory is only listed and re-merged when a workbook is added, removed or
+    modified; unchanged workbooks come from their own snapshots.
+    """
+    store = dataset_store()
+    paths = report_files(directory)
+    if not paths:
+        return None
+    source = tuple((os.path.abspath(p), os.stat(p).st_mtime_ns, os.stat(p).st_size) for p in paths)
+    digest = store['sources'].get(source)
+    if digest is not None and get_dataset(digest) is not None:
+        return digest
+    profile_note(cache='miss')
+    df = load_report_directory(directory)
+    _store_frame(store, df.attrs['digest'], df)
+    with store['lock']:
+        store['sources'][source] = df.attrs['digest']
+    return df.attrs['digest']
+
+
+def get_dataset(digest):
+    """Shared, read-only frame for `digest`, reloaded from its snapshot after eviction."""
+    store = dataset_store()
+    with store['lock']:
+        df = store['frames'].get(digest)
+        if df is not None:
+            store['frames'].move_to_end(digest)
+            profile_note(cache='hit')
+            return df
+    df = read_snapshot(digest)
+    if df is None:
+        return None
+    profile_note(cache='snapshot')
+    return _store_frame(store, digest, df)
 
-    if '\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16' in df.columns:
-        df['\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16'] = df['\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16'].astype(str).str.upper().replace('<NA>', pd.NA).replace('NAN', pd.NA)
 
-    # Convert key filter columns to category for faster isin()
-    for col in ['\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', 'LOB']:
-        if col in df.columns:
-            df[col] = df[col].astype('category')
+def load_and_process(file_bytes=None, file_path=None):
+    """Load a workbook from bytes or path through the dataset store."""
+    digest = load_dataset(file_bytes=file_bytes, file_path=file_path)
+    return get_dataset(digest) if digest else None
+
+
+def pin_dataset(digest):
+    """Record that this session is showing `digest`, protecting it from eviction."""
+    store = dataset_store()
+    session_id = st.session_state.setdefault('session_id', os.urandom(8).hex())
+    with store['lock']:
+        store['sessions'][session_id] = (digest, time.time())
+        _hold_snapshots(store)
+
+
+def release_dataset(digest):
+    """Drop `digest` and the pivots built on it, unless another session still shows it."""
+    store = dataset_store()
+    session_id = st.session_state.get('session_id')
+    with store['lock']:
+        store['sessions'].pop(session_id, None)
+        shown = bool(_live_datasets(store).get(digest))
+        if not shown:
+            _evict_dataset(store, digest)
+        _hold_snapshots(store)
+    if shown:
+        return
+    cache = pivot_cache()
+    with cache['lock']:
+        for key in [k for k in cache['entries'] if k[1] == digest]:
+            del cache['entries'][key]
 
-    return df
+
+def write_appended_dataset(df):
+    """Atomically replace the appended dataset and return its digest."""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    tmp_path = f"{APPENDED_DATASET}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    digest = file_digest(tmp_path)
+    os.replace(tmp_path, APPENDED_DATASET)
+    return digest
 
 
 def load_persisted_upload():
@@ -187,54 +348,267 @@ def load_persisted_upload():
     return None
 
 
-def persist_uploaded_file(uploaded_file):
+def persist_uploaded_file(file_bytes):
     os.makedirs(UPLOAD_DIR, exist_ok=True)
     persisted_path = os.path.join(UPLOAD_DIR, "persisted_upload.xlsx")
     with open(persisted_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+        f.write(file_bytes)
     return persisted_path
 
 
+# ============================================================================
+# PER-DATASET CACHES (shared by sessions; the unhashed `_built` argument seeds an
+# entry with a structure the ingest worker has already built)
+# ============================================================================
+@st.cache_resource(max_entries=6)
+def dataset_filter_index(_df, dataset_key, cooccurrence=False, _built=None):
+    profile_note(cache='miss')
+    return build_filter_index(_df, cooccurrence=cooccurrence) if _built is None else _built
+
+
+@st.cache_resource(max_entries=4)
+def dataset_cube(_df, dataset_key, _built=None):
+    profile_note(cache='miss')
+    return build_cube(_df, dataset_key) if _built is None else _built
+
+
+@st.cache_resource(max_entries=4)
+def dataset_month_totals(_cube, dataset_key):
+    profile_note(cache='miss')
+    return month_totals(_cube)
+
+
+@st.cache_resource(max_entries=4)
+def dataset_daily_totals(_df, dataset_key, _built=None):
+    profile_note(cache='miss')
+    return daily_totals(_df) if _built is None else _built
+
+
+@st.cache_resource(max_entries=4)
+def dataset_sketches(_df, dataset_key, _built=None):
+    profile_note(cache='miss')
+    return build_sketches(_df, dataset_key) if _built is None else _built
+
+
+@st.cache_resource(max_entries=4)
+def dataset_coverage(_df, dataset_key, _built=None):
+    profile_note(cache='miss')
+    return coverage_index(_df) if _built is None else _built
+
+
+# ============================================================================
+# BACKGROUND INGEST (uploads are processed off the script thread; the session
+# keeps showing its current dataset until the job finishes)
+# ============================================================================
+@st.cache_resource
+def ingest_jobs():
+    """Upload jobs by id. A job's dict is written only by its worker thread until it is done."""
+    return dict(jobs={}, lock=threading.Lock())
+
+
+def _run_ingest(job, file_bytes, base_df, base_cube, base_sketches):
+    """Worker thread: process, validate and index one upload, then publish the outcome on `job`.
+
+    Only plain pipeline functions run here - no Streamlit caches or profiling, as the
+    thread has no script run. The frame and the structures built on it go back in
+    job['built'] for collect_ingest to store and cache.
+    """
+    def progress(step, fraction):
+        job['step'], job['fraction'] = step, fraction
+
+    try:
+        digest = workbook_digest(file_bytes)
+        new_df = process_workbook_bytes(file_bytes, digest, progress=progress)
+        missing_check = [c for c in REQUIRED_COLUMNS if c not in new_df.columns]
+        if missing_check:
+            raise ValueError(f"Missing required columns: {missing_check}")
+
+        cube = sketches = None
+        if job['mode'] == "Append":
+            if TICKET_COLUMN not in new_df.columns or TICKET_COLUMN not in base_df.columns:
+                job['error'] = "Append needs the ticket number column in both the current data and the new report"
+                raise ValueError(job['error'])
+            try:
+                base_full = with_text_columns(base_df, base_df.attrs['digest'])
+            except FileNotFoundError:
+                job['error'] = "The stored copy of the current data is missing; reload it before appending"
+                raise
+            new_df, n_appended, n_skipped = append_new_cases(base_full, new_df)
+            digest = write_appended_dataset(new_df)
+            write_snapshot(new_df, digest)
+            # Extend the current cube and sketches with the new cases instead of rebuilding them
+            delta = new_df.iloc[len(base_df):]
+            cube = merge_cubes(base_cube, aggregate_cube(delta))
+            write_snapshot(cube, digest, 'cube')
+            sketches = merge_sketches(base_sketches, aggregate_sketches(delta))
+            write_sketches(sketches, digest)
+            job['summary'] = (f"Appended {n_appended:,} new cases from {job['name']} "
+                              f"({n_skipped:,} already loaded)")
+
+        # Build the per-dataset structures the next rerun reads, so the swap is instant
+        progress('index', 0.0)
+        built = dict(frame=new_df, filter_index=build_filter_index(new_df))
+        built['cube'] = build_cube(new_df, digest) if cube is None else cube
+        built['daily_totals'] = daily_totals(new_df)
+        progress('index', 0.4)
+        built['cube_index'] = build_filter_index(built['cube'], cooccurrence=True)
+        progress('index', 0.7)
+        built['sketches'] = build_sketches(new_df, digest) if sketches is None else sketches
+        built['sketch_index'] = build_filter_index(built['sketches']['cells'])
+        progress('index', 0.85)
+        built['coverage'] = coverage_index(new_df)
+        progress('index', 1.0)
+
+        if job['mode'] != "Append":
+            persist_uploaded_file(file_bytes)
+            if os.path.exists(APPENDED_DATASET):
+                os.remove(APPENDED_DATASET)
+        job['built'] = built
+        job['digest'] = digest
+        job['status'] = 'done'
+    except Exception:
+        logger.exception("Ingest of %s failed", job['name'])
+        job['error'] = job['error'] or "Invalid file format"
+        job['status'] = 'failed'
+    job['finished'] = time.time()
+
+
+def start_ingest(uploaded_file, mode, base_df, base_cube, base_sketches):
+    """Start processing an upload in a worker thread and return the job id."""
+    jobs = ingest_jobs()
+    job_id = os.urandom(8).hex()
+    job = dict(name=uploaded_file.name, mode=mode, status='running', step='sheet detection', fraction=0.0,
+               digest=None, built=None, summary=None, error=None, started=time.time(), finished=None)
+    with jobs['lock']:
+        # Outcomes nobody collected (the session went away) are dropped after CACHE_TTL
+        cutoff = time.time() - CACHE_TTL
+        for key in [k for k, j in jobs['jobs'].items() if j['finished'] and j['finished'] < cutoff]:
+            del jobs['jobs'][key]
+        jobs['jobs'][job_id] = job
+    threading.Thread(target=_run_ingest, args=(job, uploaded_file.getvalue(), base_df, base_cube, base_sketches),
+                     name=f"ingest-{job_id}", daemon=True).start()
+    return job_id
+
+
+def collect_ingest():
+    """Switch the session to the dataset of its finished upload job, if there is one.
+
+    Runs before the data source is chosen, so the rerun that sees the job finished
+    is the first one to show the new dataset.
+    """
+    job_id = st.session_state.get('ingest_job')
+    jobs = ingest_jobs()
+    with jobs['lock']:
+        job = jobs['jobs'].pop(job_id, None)
+        if job is not None and job['status'] == 'running':
+            jobs['jobs'][job_id] = job
+            return
+    st.session_state.pop('ingest_job', None)
+    if job is None:
+        return
+    if job['status'] == 'failed':
+        st.session_state.ingest_error = job['error']
+        return
+
+    # Store the new frame and seed the per-dataset caches with what the worker built
+    built, digest = job['built'], job['digest']
+    with stage('ingest_swap', rows_in=len(built['frame'])) as _s:
+        frame = _store_frame(dataset_store(), digest, built['frame'])
+        dataset_filter_index(frame, digest, _built=built['filter_index'])
+        dataset_cube(frame, digest, _built=built['cube'])
+        dataset_daily_totals(frame, digest, _built=built['daily_totals'])
+        dataset_filter_index(built['cube'], f"{digest}:cube", cooccurrence=True, _built=built['cube_index'])
+        dataset_sketches(frame, digest, _built=built['sketches'])
+        dataset_filter_index(built['sketches']['cells'], f"{digest}:sketch", _built=built['sketch_index'])
+        dataset_coverage(frame, digest, _built=built['coverage'])
+        _s['rows_out'] = len(frame)
+        profile_note(seconds_in_worker=round(job['finished'] - job['started'], 4))
+
+    if job['mode'] == "Append":
+        st.session_state.dataset_id = None
+        st.session_state.uploaded_file_name = None
+        st.session_state.append_summary = job['summary']
+    else:
+        st.session_state.dataset_id = job['digest']
+        st.session_state.uploaded_file_name = job['name']
+        st.session_state.pop('append_summary', None)
+    # Only the dataset being replaced is dropped; other sessions keep their caches
+    pinned = dataset_store()['sessions'].get(st.session_state.get('session_id'))
+    if pinned and pinned[0] != st.session_state.dataset_id:
+        release_dataset(pinned[0])
+    st.session_state.data_version += 1
+    logger.info("Ingest of %s finished in %.1fs", job['name'], job['finished'] - job['started'])
+
+
+@st.fragment(run_every=INGEST_POLL_SECONDS)
+def ingest_progress():
+    """Progress of this session's upload job; reruns the whole page once it has finished."""
+    job = ingest_jobs()['jobs'].get(st.session_state.get('ingest_job'))
+    if job is None or job['status'] != 'running':
+        st.rerun()
+    done = list(INGEST_STEPS).index(job['step']) + job['fraction']
+    st.progress(min(done / len(INGEST_STEPS), 1.0), text=f"{job['name']}: {INGEST_STEPS[job['step']]}")
+
+
 # ============================================================================
 # DATA SOURCE SELECTION
 # ============================================================================
-if 'uploaded_file_bytes' not in st.session_state:
-    st.session_state.uploaded_file_bytes = None
+if 'dataset_id' not in st.session_state:
+    st.session_state.dataset_id = None
     st.session_state.uploaded_file_name = None
 if 'data_version' not in st.session_state:
     st.session_state.data_version = 0
 
+collect_ingest()
+
 df = None
 data_source_label = ""
 
-if st.session_state.uploaded_file_bytes is not None:
-    try:
-        df = load_and_process(file_bytes=st.session_state.uploaded_file_bytes)
-    except Exception:
-        df = None
-    if df is None:
-        st.session_state.uploaded_file_bytes = None
-        st.session_state.uploaded_file_name = None
-        st.cache_data.clear()
-    else:
-        data_source_label = f"Uploaded: {st.session_state.uploaded_file_name}"
+with stage('load_and_process') as _s:
+    if st.session_state.dataset_id is not None:
+        df = get_dataset(st.session_state.dataset_id)
+        if df is None:
+            # Evicted and no snapshot left to reload it from - fall back to the stored sources
+            st.session_state.dataset_id = None
+            st.session_state.uploaded_file_name = None
+        else:
+            data_source_label = f"Uploaded: {st.session_state.uploaded_file_name}"
 
-if df is None and st.session_state.uploaded_file_bytes is None:
-    persisted_path = load_persisted_upload()
-    if persisted_path:
+    if df is None and os.path.exists(APPENDED_DATASET):
         try:
-            df = load_and_process(file_path=persisted_path)
+            df = get_dataset(load_dataset(file_path=APPENDED_DATASET, loader=_read_dataset_bytes))
         except Exception:
             df = None
         if df is None:
-            # Bad persisted file — auto-remove it
-            os.remove(persisted_path)
+            os.remove(APPENDED_DATASET)
         else:
-            data_source_label = "Previously uploaded file"
+            data_source_label = "Appended monthly reports"
+
     if df is None:
-        df = load_and_process(file_path=DEFAULT_DATA_FILE)
-        if df is not None:
-            data_source_label = DEFAULT_DATA_FILE
+        persisted_path = load_persisted_upload()
+        if persisted_path:
+            try:
+                df = load_and_process(file_path=persisted_path)
+            except Exception:
+                df = None
+            if df is None:
+                # Bad persisted file — auto-remove it
+                os.remove(persisted_path)
+            else:
+                data_source_label = "Previously uploaded file"
+        if df is None and os.path.isdir(REPORT_DIR):
+            try:
+                df = get_dataset(load_report_dataset(REPORT_DIR))
+            except Exception:
+                logger.exception("Could not load the reports in %s", REPORT_DIR)
+                df = None
+            if df is not None:
+                data_source_label = f"{REPORT_DIR}/ ({df[SOURCE_COLUMN].nunique()} reports)"
+        if df is None:
+            df = load_and_process(file_path=DEFAULT_DATA_FILE)
+            if df is not None:
+                data_source_label = DEFAULT_DATA_FILE
+    _s['rows_out'] = len(df) if df is not None else 0
 
 if df is None:
     st.markdown("# \U0001f697 RSA Dashboard - Sompo Thailand")
@@ -247,9 +621,10 @@ if df is None:
     """, unsafe_allow_html=True)
     st.stop()
 
+pin_dataset(df.attrs['digest'])
+
 # Validate required columns
-required_cols = ['Year', 'Month', 'Fee (Baht)', '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', 'LOB']
-missing = [c for c in required_cols if c not in df.columns]
+missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
 if missing:
     st.error(f"Missing required columns after processing: {missing}")
     st.stop()
@@ -258,9 +633,6 @@ if missing:
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
-def safe_sorted_unique(series):
-    return sorted([str(v) for v in series.dropna().unique()])
-
 PLOTLY_CONFIG = {'displayModeBar': False, 'displaylogo': False}
 CHART_FONT = dict(family='Inter, sans-serif', size=12, color='#4B5563')
 CHART_LAYOUT = dict(
@@ -275,28 +647,94 @@ CHART_LAYOUT = dict(
 CHART_TITLE = dict(font=dict(size=14, color='#1F2937', family='Inter, sans-serif'), x=0, xanchor='left')
 
 
-@st.cache_data(ttl=CACHE_TTL)
-def convert_df_to_csv(_df_csv):
-    return _df_csv.to_csv(index=False, encoding='utf-8-sig').encode('utf-8-sig')
+def export_download(frame, fmt, drop_pii):
+    """Download callable for `frame`; the file is only built when the button is clicked."""
+    def build():
+        t0 = time.perf_counter()
+        data = export_bytes(frame, fmt, drop_pii=drop_pii, digest=frame.attrs['digest'])
+        logger.info("Exported %d rows as %s (%.1f MB) in %.2fs", len(frame), fmt, len(data) / 1e6,
+                    time.perf_counter() - t0)
+        return data
+    return build
 
 
+# ============================================================================
+# FILTER INDEX & AGGREGATE CUBE - built once per dataset and shared by sessions
+# ============================================================================
+with stage('filter_index', rows_in=len(df)) as _s:
+    filter_index = dataset_filter_index(df, df.attrs.get('digest'))
+    profile_note(cache='hit')
+with stage('cube', rows_in=len(df)) as _s:
+    cube = dataset_cube(df, df.attrs.get('digest'))
+    cube_index = dataset_filter_index(cube, f"{df.attrs.get('digest')}:cube", cooccurrence=True)
+    profile_note(cache='hit')
+    _s['rows_out'] = len(cube)
+with stage('sketches', rows_in=len(df)) as _s:
+    sketches = dataset_sketches(df, df.attrs.get('digest'))
+    sketch_index = dataset_filter_index(sketches['cells'], f"{df.attrs.get('digest')}:sketch")
+    profile_note(cache='hit')
+    _s['rows_out'] = len(sketches['cells'])
+
 # ============================================================================
 # FILTERS - Using multiselect (much faster than individual checkboxes)
 # ============================================================================
-available_years = sorted([int(y) for y in df['Year'].dropna().unique()])
-available_services = safe_sorted_unique(df['\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23'])
-available_lobs = safe_sorted_unique(df['LOB'])
-available_months = sorted([int(m) for m in df['Month'].dropna().unique()])
+available_years = filter_options(filter_index, 'Year')
+available_services = filter_options(filter_index, '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23')
+available_lobs = filter_options(filter_index, 'LOB')
+available_months = filter_options(filter_index, 'Month')
 month_names = {1:'Jan',2:'Feb',3:'Mar',4:'Apr',5:'May',6:'Jun',7:'Jul',8:'Aug',9:'Sep',10:'Oct',11:'Nov',12:'Dec'}
-available_channels = safe_sorted_unique(df['\u0e23\u0e2b\u0e31\u0e2a\u0e42\u0e04\u0e23\u0e07\u0e01\u0e32\u0e23']) if '\u0e23\u0e2b\u0e31\u0e2a\u0e42\u0e04\u0e23\u0e07\u0e01\u0e32\u0e23' in df.columns else []
-available_regions = safe_sorted_unique(df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14']) if '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14' in df.columns else []
-available_makes = safe_sorted_unique(df['\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16']) if '\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16' in df.columns else []
-available_models = safe_sorted_unique(df['\u0e23\u0e38\u0e48\u0e19\u0e23\u0e16']) if '\u0e23\u0e38\u0e48\u0e19\u0e23\u0e16' in df.columns else []
+available_channels = filter_options(filter_index, '\u0e23\u0e2b\u0e31\u0e2a\u0e42\u0e04\u0e23\u0e07\u0e01\u0e32\u0e23')
+available_regions = filter_options(filter_index, '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14')
+available_makes = filter_options(filter_index, '\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16')
+available_models = filter_options(filter_index, '\u0e23\u0e38\u0e48\u0e19\u0e23\u0e16')
+
+_v = st.session_state.get('data_version', 0)
+# Filter column -> sidebar multiselect key (suffixed with the data version)
+FILTER_WIDGET_KEYS = {
+    'Year': 'sel_years', 'Month': 'sel_months', '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23': 'sel_services', 'LOB': 'sel_lobs',
+    '\u0e23\u0e2b\u0e31\u0e2a\u0e42\u0e04\u0e23\u0e07\u0e01\u0e32\u0e23': 'sel_channels', '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14': 'sel_regions', '\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16': 'sel_makes', '\u0e23\u0e38\u0e48\u0e19\u0e23\u0e16': 'sel_models',
+}
+# Filter column -> sidebar label
+FILTER_LABELS = {
+    'Year': 'Year', 'Month': 'Month', '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23': 'Service Type', 'LOB': 'LOB',
+    '\u0e23\u0e2b\u0e31\u0e2a\u0e42\u0e04\u0e23\u0e07\u0e01\u0e32\u0e23': 'Channel', '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14': 'Region', '\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16': 'Vehicle Make', '\u0e23\u0e38\u0e48\u0e19\u0e23\u0e16': 'Vehicle Model',
+}
+
+
+def _filter_key(col):
+    return f"{FILTER_WIDGET_KEYS[col]}_{_v}"
+
+
+def _filter_all(col):
+    """True while every option of `col` is selected; its options then follow the other filters."""
+    return st.session_state.get(f"{_filter_key(col)}_all", True)
+
+
+def _filter_changed(key, options):
+    st.session_state[f"{key}_all"] = set(st.session_state[key]) >= set(options)
+
+
+# Options of each filter narrowed by the selections on the others (cascading filters)
+with stage('filter_options', rows_in=len(cube)):
+    filter_choices = cascaded_options(cube_index, {
+        col: st.session_state.get(_filter_key(col), []) for col in FILTER_WIDGET_KEYS if not _filter_all(col)})
+
+
+def filter_multiselect(label, col, **kwargs):
+    """Sidebar multiselect over the options of `col` left by the other filters."""
+    key = _filter_key(col)
+    options = filter_choices.get(col, [])
+    if _filter_all(col):
+        st.session_state[key] = options
+    else:
+        st.session_state[key] = [v for v in st.session_state.get(key, []) if v in options]
+    return st.multiselect(label, options, key=key, on_change=_filter_changed, args=(key, options),
+                          label_visibility="collapsed", **kwargs)
+
 
 # ============================================================================
 # SIDEBAR - Filters & Navigation
 # ============================================================================
-_v = st.session_state.get('data_version', 0)
 
 with st.sidebar:
     # Brand Header
@@ -318,101 +756,100 @@ with st.sidebar:
     </div>
     """, unsafe_allow_html=True)
 
+    # As-of date for the KPI cards and Portfolio Health (empty: latest year, this month)
+    kpi_as_of = st.date_input("KPIs as of", value=None, key=f"kpi_as_of_{_v}", format="YYYY-MM-DD",
+                              min_value=datetime(min(available_years), 1, 1).date(),
+                              max_value=datetime(max(available_years), 12, 31).date(),
+                              help="Show the KPIs and Portfolio Health as they stood at the end of this day, "
+                                   "compared with the same date a year earlier.")
+
     st.markdown('<div class="sidebar-section">Filters</div>', unsafe_allow_html=True)
 
     # Year Filter
     with st.expander("Year", expanded=False):
-        selected_years = st.multiselect("Year", available_years, default=available_years, key=f"sel_years_{_v}", label_visibility="collapsed")
+        selected_years = filter_multiselect("Year", 'Year')
 
     # Month Filter
     with st.expander("Month", expanded=False):
-        selected_months = st.multiselect("Month", available_months, default=available_months, key=f"sel_months_{_v}",
-                                         format_func=lambda m: f"{m} - {month_names.get(m,'')}", label_visibility="collapsed")
+        selected_months = filter_multiselect("Month", 'Month', format_func=lambda m: f"{m} - {month_names.get(m,'')}")
 
     # Service Type Filter
     with st.expander("Service Type", expanded=False):
-        selected_services = st.multiselect("Service Type", available_services, default=available_services,
-                                          key=f"sel_services_{_v}", label_visibility="collapsed")
+        selected_services = filter_multiselect("Service Type", '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23')
 
     # LOB Filter
     with st.expander("LOB", expanded=False):
-        selected_lobs = st.multiselect("LOB", available_lobs, default=available_lobs,
-                                       key=f"sel_lobs_{_v}", label_visibility="collapsed")
+        selected_lobs = filter_multiselect("LOB", 'LOB')
 
     # Channel Filter
     if available_channels:
         with st.expander("Channel", expanded=False):
-            selected_channels = st.multiselect("Channel", available_channels, default=available_channels,
-                                              key=f"sel_channels_{_v}", label_visibility="collapsed")
+            selected_channels = filter_multiselect("Channel", '\u0e23\u0e2b\u0e31\u0e2a\u0e42\u0e04\u0e23\u0e07\u0e01\u0e32\u0e23')
     else:
         selected_channels = available_channels
 
     # Region Filter
     if available_regions:
         with st.expander("Region", expanded=False):
-            selected_regions = st.multiselect("Region", available_regions, default=available_regions,
-                                             key=f"sel_regions_{_v}", label_visibility="collapsed")
+            selected_regions = filter_multiselect("Region", '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14')
     else:
         selected_regions = available_regions
 
     # Vehicle Make Filter
     if available_makes:
         with st.expander("Vehicle Make", expanded=False):
-            selected_makes = st.multiselect("Vehicle Make", available_makes, default=available_makes,
-                                           key=f"sel_makes_{_v}", label_visibility="collapsed")
+            selected_makes = filter_multiselect("Vehicle Make", '\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16')
     else:
         selected_makes = available_makes
 
     # Vehicle Model Filter
     if available_models:
         with st.expander("Vehicle Model", expanded=False):
-            selected_models = st.multiselect("Vehicle Model", available_models, default=available_models,
-                                            key=f"sel_models_{_v}", label_visibility="collapsed")
+            selected_models = filter_multiselect("Vehicle Model", '\u0e23\u0e38\u0e48\u0e19\u0e23\u0e16')
     else:
         selected_models = available_models
 
     st.markdown('<div class="sidebar-section">Data Management</div>', unsafe_allow_html=True)
 
     # File Upload
+    upload_mode = st.radio("Upload mode", ["Replace", "Append"], horizontal=True, key="upload_mode",
+                           help="Replace swaps the data source; Append adds the cases of a monthly report "
+                                "whose ticket numbers are not loaded yet.")
     uploaded_file = st.file_uploader("Upload RSA Report", type=["xlsx"], key="file_uploader",
-                                     help="Upload a new Excel file to replace the current data source.")
-    if uploaded_file is not None:
-        import hashlib
-        new_bytes = uploaded_file.getvalue()
-        new_hash = hashlib.md5(new_bytes).hexdigest()
-        old_hash = st.session_state.get('uploaded_file_hash')
-        if new_hash != old_hash:
-            try:
-                test_df = load_and_process(file_bytes=new_bytes)
-                if test_df is None:
-                    raise ValueError("Could not process file")
-                required_check = ['Year', 'Month', 'Fee (Baht)', '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', 'LOB']
-                missing_check = [c for c in required_check if c not in test_df.columns]
-                if missing_check:
-                    raise ValueError(f"Missing required columns: {missing_check}")
-            except Exception:
-                st.error("Invalid file format")
-            else:
-                persist_uploaded_file(uploaded_file)
-                st.session_state.uploaded_file_bytes = new_bytes
-                st.session_state.uploaded_file_name = uploaded_file.name
-                st.session_state.uploaded_file_hash = new_hash
-                st.session_state.data_version += 1
-                st.cache_data.clear()
-                st.rerun()
+                                     help="Upload a new Excel file to replace or extend the current data source.")
+    # An upload is identified by the uploader's file id, so reruns never re-read or re-hash it
+    if uploaded_file is not None and uploaded_file.file_id != st.session_state.get('uploaded_file_id'):
+        st.session_state.uploaded_file_id = uploaded_file.file_id
+        st.session_state.pop('ingest_error', None)
+        st.session_state.ingest_job = start_ingest(uploaded_file, upload_mode, df, cube, sketches)
+    if st.session_state.get('ingest_job'):
+        ingest_progress()
+    if st.session_state.get('ingest_error'):
+        st.error(st.session_state.pop('ingest_error'))
+    if st.session_state.get('append_summary'):
+        st.caption(st.session_state.append_summary)
 
     # Clear uploaded file button
     p_path = os.path.join(UPLOAD_DIR, "persisted_upload.xlsx")
-    if os.path.exists(p_path):
+    if os.path.exists(p_path) or os.path.exists(APPENDED_DATASET):
         if st.button("Clear uploaded file", key="clear_upload", use_container_width=True):
-            os.remove(p_path)
-            st.session_state.uploaded_file_bytes = None
+            for path in (p_path, APPENDED_DATASET):
+                if os.path.exists(path):
+                    os.remove(path)
+            release_dataset(df.attrs['digest'])
+            st.session_state.dataset_id = None
             st.session_state.uploaded_file_name = None
-            st.session_state.pop('uploaded_file_hash', None)
+            st.session_state.pop('uploaded_file_id', None)
+            st.session_state.pop('append_summary', None)
             st.session_state.data_version += 1
-            st.cache_data.clear()
             st.rerun()
 
+    st.markdown('<div class="sidebar-section">Admin</div>', unsafe_allow_html=True)
+    st.toggle("Performance panel", key="profile_panel",
+              help="Time each stage of this page (wall time, rows, cache hits) and log it per rerun. "
+                   "Peak memory is traced only when the server runs with RSA_TRACE_MEMORY=1.")
+    profile_panel = st.empty()
+
 # Validate filter selection
 if not selected_years:
     st.warning("Please select at least one year from the sidebar filters.")
@@ -421,23 +858,22 @@ if not selected_years:
 # ============================================================================
 # APPLY FILTERS
 # ============================================================================
-mask = df['Year'].isin(selected_years)
-if len(selected_services) < len(available_services):
-    mask &= df['\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23'].isin(selected_services)
-if len(selected_lobs) < len(available_lobs):
-    mask &= df['LOB'].isin(selected_lobs)
-if len(selected_months) < len(available_months):
-    mask &= df['Month'].isin(selected_months)
-if len(selected_channels) < len(available_channels) and '\u0e23\u0e2b\u0e31\u0e2a\u0e42\u0e04\u0e23\u0e07\u0e01\u0e32\u0e23' in df.columns:
-    mask &= df['\u0e23\u0e2b\u0e31\u0e2a\u0e42\u0e04\u0e23\u0e07\u0e01\u0e32\u0e23'].astype(str).isin(selected_channels)
-if len(selected_regions) < len(available_regions) and '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14' in df.columns:
-    mask &= df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14'].astype(str).isin(selected_regions)
-if len(selected_makes) < len(available_makes) and '\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16' in df.columns:
-    mask &= df['\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16'].astype(str).isin(selected_makes)
-if len(selected_models) < len(available_models) and '\u0e23\u0e38\u0e48\u0e19\u0e23\u0e16' in df.columns:
-    mask &= df['\u0e23\u0e38\u0e48\u0e19\u0e23\u0e16'].astype(str).isin(selected_models)
-
-filtered_df = df[mask]
+filter_selections = {
+    'Year': selected_years, 'Month': selected_months, '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23': selected_services, 'LOB': selected_lobs,
+    '\u0e23\u0e2b\u0e31\u0e2a\u0e42\u0e04\u0e23\u0e07\u0e01\u0e32\u0e23': selected_channels, '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14': selected_regions,
+    '\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16': selected_makes, '\u0e23\u0e38\u0e48\u0e19\u0e23\u0e16': selected_models,
+}
+# A filter left at everything does not narrow, even though it only lists the options the others leave
+filter_selections = {col: filter_options(filter_index, col) if _filter_all(col) else selected
+                     for col, selected in filter_selections.items()}
+with stage('filter_mask', rows_in=len(df)) as _s:
+    mask = filter_mask(filter_index, filter_selections)
+    cube_mask = filter_mask(cube_index, filter_selections)
+    filtered_df = df if mask is None else df[mask]
+    filtered_cube = cube if cube_mask is None else cube[cube_mask]
+    # Dataset and filter selection; keys every per-filter cache (pivots, charts)
+    view_key = (df.attrs.get('digest'), filter_signature(filter_index, filter_selections))
+    _s['rows_out'] = len(filtered_df)
 
 if len(filtered_df) == 0:
     st.markdown("""
@@ -460,39 +896,34 @@ with hcol1:
     st.markdown("# Dashboard")
     st.markdown(f"Roadside Assistance Monitoring <span class='data-freshness'>Data through: {latest_date}</span>", unsafe_allow_html=True)
 with hcol2:
-    csv_data = convert_df_to_csv(filtered_df)
-    st.download_button("\U0001f4e5 Export Data", data=csv_data,
-                       file_name=f"RSA_Export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                       mime="text/csv", use_container_width=True)
+    with st.popover("\U0001f4e5 Export Data", use_container_width=True):
+        export_fmt = st.radio("Format", list(EXPORT_FORMATS), format_func=EXPORT_LABELS.get,
+                              horizontal=True, key="export_format")
+        export_drop_pii = st.checkbox("Leave out customer names, phone numbers and service reasons",
+                                      key="export_drop_pii")
+        export_too_big = export_fmt == 'xlsx' and len(filtered_df) > XLSX_MAX_ROWS
+        st.download_button(f"Download {len(filtered_df):,} rows",
+                           data=export_download(filtered_df, export_fmt, export_drop_pii),
+                           file_name=f"RSA_Export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_fmt}",
+                           mime=EXPORT_FORMATS[export_fmt], on_click='ignore', disabled=export_too_big,
+                           use_container_width=True, key="dl_export")
+        if export_too_big:
+            st.caption(f"Excel sheets hold at most {XLSX_MAX_ROWS:,} rows; narrow the filters or pick CSV/Parquet.")
 
 # ============================================================================
 # KPIs
 # ============================================================================
-current_year = max(available_years)
-prev_year = current_year - 1
-cur_df_all = df[df['Year'] == current_year]
-prev_df_all = df[df['Year'] == prev_year]
-current_month = datetime.now().month
-
-cur_fee = cur_df_all['Fee (Baht)'].sum()
-ytd_cases = len(cur_df_all)
-ytd_fee = cur_fee
-prev_ytd_cases = len(prev_df_all[prev_df_all['Month'] <= current_month])
-prev_ytd_fee = prev_df_all[prev_df_all['Month'] <= current_month]['Fee (Baht)'].sum()
-mtd_fee = cur_df_all[cur_df_all['Month'] == current_month]['Fee (Baht)'].sum()
-mtd_util = (mtd_fee / MONTHLY_BUDGET * 100) if MONTHLY_BUDGET > 0 else 0
-prev_mtd_fee = prev_df_all[prev_df_all['Month'] == current_month]['Fee (Baht)'].sum()
-cur_avg_raw = cur_df_all['Fee (Baht)'].mean()
-cur_avg = 0.0 if pd.isna(cur_avg_raw) else cur_avg_raw
-prev_avg_raw = prev_df_all['Fee (Baht)'].mean()
-prev_avg = 0.0 if pd.isna(prev_avg_raw) else prev_avg_raw
-
-def calc_trend(cur_val, prev_val):
-    if prev_val == 0:
-        return 0, "neutral"
-    pct = (cur_val - prev_val) / prev_val * 100
-    trend_type = "up" if pct > 0 else "down" if pct < 0 else "neutral"
-    return pct, trend_type
+with stage('kpis', rows_in=len(cube)):
+    if kpi_as_of is None:
+        totals = dataset_month_totals(cube, df.attrs.get('digest'))
+        profile_note(cache='hit')
+        kpis = compute_kpis(totals, max(available_years), datetime.now().month)
+    else:
+        daily = dataset_daily_totals(df, df.attrs.get('digest'))
+        profile_note(cache='hit')
+        kpis = compute_kpis_as_of(daily, kpi_as_of)
+ytd_cases, ytd_fee, cur_avg, mtd_fee = kpis['ytd_cases'], kpis['ytd_fee'], kpis['cur_avg'], kpis['mtd_fee']
+prev_ytd_cases, prev_avg = kpis['prev_ytd_cases'], kpis['prev_avg']
 
 def trend_html(pct, trend_type, compare_text, inverse_color=False):
     """Generate trend indicator HTML. inverse_color=True means up is bad (red), down is good (green)"""
@@ -506,10 +937,10 @@ def trend_html(pct, trend_type, compare_text, inverse_color=False):
     return f'<div style="font-size:13px;margin-top:8px;"><span style="color:{color};font-weight:600;">{arrow} {abs(pct):.1f}%</span> <span style="color:#9CA3AF;font-size:12px;">{compare_text}</span></div>'
 
 # Calculate trends
-cases_pct, cases_trend = calc_trend(ytd_cases, prev_ytd_cases)
-fee_pct, fee_trend = calc_trend(ytd_fee, prev_ytd_fee)
-avg_pct, avg_trend = calc_trend(cur_avg, prev_avg)
-mtd_pct, mtd_trend = calc_trend(mtd_fee, prev_mtd_fee)
+cases_pct, cases_trend = kpis['cases_trend_pct'], kpis['cases_trend']
+fee_pct, fee_trend = kpis['fee_trend_pct'], kpis['fee_trend']
+avg_pct, avg_trend = kpis['avg_trend_pct'], kpis['avg_trend']
+mtd_pct, mtd_trend = kpis['mtd_trend_pct'], kpis['mtd_trend']
 
 # KPI Icons (using emojis for simplicity)
 kpi_icons = {
@@ -554,28 +985,25 @@ kpi_html += kpi_card("Avg Fee/Case", f"{baht}{cur_avg:,.0f}", icon_avg, "rgba(24
 kpi_html += kpi_card("MTD Fee", f"{baht}{mtd_fee:,.0f}", icon_mtd, "rgba(139,92,246,0.08)", trend_mtd)
 kpi_html += '</div>'
 st.markdown(kpi_html, unsafe_allow_html=True)
+if kpi_as_of is not None:
+    st.caption(f"KPIs as of {kpis['as_of']}, compared with the same dates in {kpis['current_year'] - 1}")
 
 # ============================================================================
 # PORTFOLIO HEALTH
 # ============================================================================
 st.markdown('<div class="section-header">Portfolio Health</div>', unsafe_allow_html=True)
 
-months_in_year = cur_df_all['Month'].nunique() if len(cur_df_all) > 0 else 1
-run_rate = cur_fee / max(months_in_year, 1)
-projection = run_rate * 12
-annual_budget = MONTHLY_BUDGET * 12
-expected_cost_ytd = MONTHLY_BUDGET * months_in_year
-over_budget_pct = ((ytd_fee - expected_cost_ytd) / expected_cost_ytd * 100) if expected_cost_ytd > 0 else 0
-
-if over_budget_pct <= HEALTH_THRESHOLD_HEALTHY:
-    h_status, h_class, h_badge = "HEALTHY", "health-healthy", '<span class="health-badge badge-healthy">Healthy</span>'
-elif over_budget_pct <= HEALTH_THRESHOLD_WARNING:
-    h_status, h_class, h_badge = "WARNING", "health-warning", '<span class="health-badge badge-warning">Warning</span>'
-else:
-    h_status, h_class, h_badge = "CRITICAL", "health-critical", '<span class="health-badge badge-critical">Critical</span>'
-
-ytd_vs_expected_pct = (ytd_fee / expected_cost_ytd * 100) if expected_cost_ytd > 0 else 0
-projection_vs_budget_pct = (projection / annual_budget * 100) if annual_budget > 0 else 0
+with stage('portfolio_health'):
+    health = portfolio_health(kpis)
+h_status = health['status']
+h_class, h_badge = {
+    "HEALTHY": ("health-healthy", '<span class="health-badge badge-healthy">Healthy</span>'),
+    "WARNING": ("health-warning", '<span class="health-badge badge-warning">Warning</span>'),
+    "CRITICAL": ("health-critical", '<span class="health-badge badge-critical">Critical</span>'),
+}[h_status]
+expected_cost_ytd, run_rate = health['expected_cost_ytd'], health['run_rate']
+projection, annual_budget = health['projection'], health['annual_budget']
+ytd_vs_expected_pct, projection_vs_budget_pct = health['ytd_vs_expected_pct'], health['projection_vs_budget_pct']
 
 st.markdown(f"""
 <div class="health-indicator {h_class}">
@@ -598,7 +1026,7 @@ value_cols_available = [c for c in ['Fee (Baht)', '\u0e25\u0e39\u0e01\u0e04\u0e4
 
 # Pivot table controls - compact row
 with st.container(border=True):
-    pc1, pc2, pc3, pc4 = st.columns(4)
+    pc1, pc2, pc3, pc4, pc5 = st.columns([3, 3, 3, 3, 2])
     with pc1:
         pivot_rows_selected = st.multiselect("Rows", options=pivot_cols_available, default=['\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23'], key=f"pivot_rows_{_v}")
         pivot_rows = list(pivot_rows_selected) if pivot_rows_selected else []
@@ -607,124 +1035,82 @@ with st.container(border=True):
     with pc3:
         pivot_value = st.selectbox("Values", options=['Case Count'] + value_cols_available, index=0, key=f"pivot_value_{_v}")
     with pc4:
-        pivot_agg = st.selectbox("Aggregation", options=['Count', 'Sum', 'Mean', 'Median', 'Min', 'Max', '% of Row Total', '% of Column Total', '% of Grand Total'], index=0, key=f"pivot_agg_{_v}")
+        pivot_agg = st.selectbox("Aggregation", options=['Count', 'Sum', 'Mean', 'Median', 'Min', 'Max', '% of Row Total', '% of Column Total', '% of Grand Total', 'Running Total', 'Difference from Previous'], index=0, key=f"pivot_agg_{_v}")
+    with pc5:
+        pivot_layout = st.selectbox("Layout", options=["Auto", "Grid", "Long"], index=0, key=f"pivot_layout_{_v}",
+                                    help="Long lists only the row x column combinations that have cases, one per "
+                                         "line, with the totals after them. Auto uses it for very large grids.")
 
 # ============================================================================
 # PIVOT TABLE RENDERING
 # ============================================================================
-if pivot_rows or pivot_columns:
-    try:
-        is_pct_agg = pivot_agg in ('% of Row Total', '% of Column Total', '% of Grand Total')
-        base_agg = 'Sum' if is_pct_agg else pivot_agg
-        agg_map = {'Count': 'count', 'Sum': 'sum', 'Mean': 'mean', 'Median': 'median', 'Min': 'min', 'Max': 'max'}
-        agg_func = agg_map[base_agg]
-
-        if pivot_value == 'Case Count':
-            _pivot_src = filtered_df.assign(_count=1)
-            val_col = '_count'
-            if base_agg == 'Count':
-                agg_func = 'sum'
-        else:
-            _pivot_src = filtered_df
-            val_col = pivot_value
-
-        all_pivot_fields = list(set(pivot_rows + pivot_columns))
-        # Only convert needed columns
-        convert_needed = {col: _pivot_src[col].astype(str).fillna('(blank)') for col in all_pivot_fields}
-        if convert_needed:
-            _pivot_src = _pivot_src.assign(**convert_needed)
-
-        if val_col != '_count':
-            _pivot_src = _pivot_src.assign(**{val_col: pd.to_numeric(_pivot_src[val_col], errors='coerce').fillna(0)})
-
-        pivot_kwargs = dict(data=_pivot_src, values=val_col, aggfunc=agg_func, fill_value=0, margins=True, margins_name='Grand Total')
-        if pivot_rows:
-            pivot_kwargs['index'] = pivot_rows
-        if pivot_columns:
-            pivot_kwargs['columns'] = pivot_columns
-
-        pivot_result = pd.pivot_table(**pivot_kwargs)
-
-        # Flatten multi-level columns
-        if isinstance(pivot_result.columns, pd.MultiIndex):
-            pivot_result.columns = [
-                'Grand Total' if 'Grand Total' in (parts := [str(c) for c in col]) else ' | '.join(parts).strip(' | ')
-                for col in pivot_result.columns
-            ]
-
-        # Sort columns
-        cols = list(pivot_result.columns)
-        gt_col = next((c for c in cols if 'Grand Total' in str(c)), None)
-        non_gt_cols = [c for c in cols if c != gt_col]
-
-        def sort_key(x):
-            x_str = str(x)
-            if x_str.isdigit():
-                return (0, int(x_str))
-            m = re.match(r'^(\d+)', x_str)
-            return (0, int(m.group(1))) if m else (1, x_str)
+is_pct_agg = pivot_agg in PERCENT_AGGREGATIONS
+is_int_agg = pivot_agg in ('Sum', 'Count') or (pivot_agg in RUNNING_AGGREGATIONS and pivot_value == 'Case Count')
+pivot_key = (*view_key, tuple(pivot_rows), tuple(pivot_columns), pivot_value)
 
-        try:
-            sorted_cols = sorted(non_gt_cols, key=sort_key)
-        except Exception:
-            sorted_cols = non_gt_cols
-        if gt_col:
-            sorted_cols.append(gt_col)
-        pivot_result = pivot_result[sorted_cols]
-
-        # Reset index
-        if isinstance(pivot_result.index, pd.MultiIndex) or pivot_result.index.name:
-            pivot_result = pivot_result.reset_index()
-
-        # Apply percentage conversion if needed
-        if is_pct_agg:
-            row_id_cols_pre = [c for c in pivot_result.columns if c in pivot_rows]
-            num_cols_pre = [c for c in pivot_result.columns if c not in row_id_cols_pre]
-            gt_col_name = next((c for c in num_cols_pre if 'Grand Total' in str(c)), None)
-
-            # Exclude Grand Total row for percentage base
-            gt_mask_pre = pd.Series(False, index=pivot_result.index)
-            for rid_col in row_id_cols_pre:
-                gt_mask_pre |= pivot_result[rid_col].astype(str).str.contains('Grand Total', na=False)
-
-            if pivot_agg == '% of Row Total' and gt_col_name:
-                non_gt_num = [c for c in num_cols_pre if c != gt_col_name]
-                row_totals = pivot_result[gt_col_name].replace(0, pd.NA)
-                pivot_result[non_gt_num] = pivot_result[non_gt_num].div(row_totals, axis=0) * 100
-                pivot_result[non_gt_num] = pivot_result[non_gt_num].fillna(0.0)
-                pivot_result[gt_col_name] = pivot_result[gt_col_name].apply(lambda x: 100.0 if x != 0 else 0.0)
-            elif pivot_agg == '% of Column Total':
-                for c in num_cols_pre:
-                    col_total = pivot_result.loc[gt_mask_pre, c].iloc[0] if gt_mask_pre.any() else pivot_result[c].sum()
-                    if col_total != 0:
-                        pivot_result[c] = pivot_result[c] / col_total * 100
-                    else:
-                        pivot_result[c] = 0.0
-            elif pivot_agg == '% of Grand Total':
-                grand_total_val = None
-                if gt_col_name and gt_mask_pre.any():
-                    grand_total_val = pivot_result.loc[gt_mask_pre, gt_col_name].iloc[0]
-                else:
-                    grand_total_val = pivot_result[num_cols_pre].values[~gt_mask_pre.values].sum()
-                if grand_total_val and grand_total_val != 0:
-                    for c in num_cols_pre:
-                        pivot_result[c] = pivot_result[c] / grand_total_val * 100
-
-        fmt_pivot = pivot_result
-        is_int_agg = pivot_agg in ('Sum', 'Count')
-        if is_int_agg:
-            numeric_cols = fmt_pivot.select_dtypes(include=['float64', 'float32']).columns
-            for col in numeric_cols:
-                fmt_pivot[col] = fmt_pivot[col].astype(int)
-
-        # Separate grand total row
+# Long format (occupied cells only) when asked for, or under Auto when the grid would be too large
+long_pivot = None
+if pivot_rows and pivot_columns and pivot_layout != "Grid" and pivot_agg not in RUNNING_AGGREGATIONS:
+    try:
+        with stage('pivot_sparse', rows_in=len(filtered_cube)) as _s:
+            long_pivot = build_sparse_pivot(filtered_cube, filtered_df, pivot_rows, pivot_columns, pivot_value,
+                                            pivot_agg, cache_key=pivot_key)
+            _s['rows_out'] = len(long_pivot)
+        if (pivot_layout == "Auto"
+                and long_pivot.attrs['row_keys'] * long_pivot.attrs['column_keys'] <= PIVOT_GRID_MAX_CELLS):
+            long_pivot = None
+    except Exception:
+        long_pivot = None
+
+if long_pivot is not None:
+    n_cells = long_pivot.attrs['cells']
+    grid_cells = long_pivot.attrs['row_keys'] * long_pivot.attrs['column_keys']
+    n_pages = max(1, -(-len(long_pivot) // PIVOT_PAGE_ROWS))
+    page = 1
+    if n_pages > 1:
+        pg1, pg2 = st.columns([1, 6])
+        with pg1:
+            page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, step=1,
+                                   key=f"pivot_long_page_{_v}_{hashlib.md5(repr((pivot_key, pivot_agg)).encode()).hexdigest()[:8]}")
+    start = (page - 1) * PIVOT_PAGE_ROWS
+    page_rows = long_pivot.iloc[start:start + PIVOT_PAGE_ROWS]
+    with stage('pivot_html', rows_in=len(page_rows)):
+        parts = ['<div class="service-table-container" style="max-height:500px;overflow-y:auto;"><table class="service-table"><thead><tr>']
+        for col in page_rows.columns:
+            parts.append(f'<th>{html.escape(str(col))}</th>')
+        parts.append('</tr></thead><tbody>')
+        for pos, row_vals in enumerate(page_rows.itertuples(index=False), start=start):
+            # Rows after the occupied cells are the totals
+            style = ('background-color:#E2E8F0;color:#1B2838;font-weight:600;padding:8px 12px;' if pos >= n_cells
+                     else 'padding:8px 12px;')
+            parts.append('<tr>')
+            for val in row_vals[:-1]:
+                parts.append(f'<td style="{style}">{html.escape(str(val))}</td>')
+            val = row_vals[-1]
+            cell_text = f"{val:.1f}%" if is_pct_agg else (f"{int(val):,}" if is_int_agg else f"{val:,.2f}")
+            parts.append(f'<td style="{style}font-weight:600;">{cell_text}</td></tr>')
+        parts.append('</tbody></table></div>')
+        st.markdown(''.join(parts), unsafe_allow_html=True)
+    st.caption(f"Long format: {n_cells:,} of {grid_cells:,} row x column combinations have cases; "
+               f"lines {start + 1:,}-{start + len(page_rows):,} of {len(long_pivot):,} (totals last).")
+    csv_pivot = long_pivot.to_csv(index=False, encoding='utf-8-sig').encode('utf-8-sig')
+    st.download_button("Download Pivot CSV", data=csv_pivot, file_name="RSA_Pivot_Export.csv", mime="text/csv", key="dl_pivot")
+    _pc = pivot_cache()
+    st.caption(f"Pivot cache: {_pc['hits']:,} hits / {_pc['misses']:,} misses ({len(_pc['entries'])} cached)")
+elif pivot_rows or pivot_columns:
+    try:
+        pivot_misses = pivot_cache()['misses']
+        with stage('pivot', rows_in=len(filtered_cube)) as _s:
+            fmt_pivot = build_pivot(filtered_cube, filtered_df, pivot_rows, pivot_columns, pivot_value, pivot_agg,
+                                    cache_key=pivot_key)
+            profile_note(cache='miss' if pivot_cache()['misses'] > pivot_misses else 'hit')
+            _s['rows_out'] = len(fmt_pivot)
+
+        # Separate grand total row: build_pivot puts it last whenever there are row fields
         row_id_cols = [c for c in fmt_pivot.columns if c in pivot_rows]
-        gt_mask = pd.Series(False, index=fmt_pivot.index)
-        for rid_col in row_id_cols:
-            gt_mask |= fmt_pivot[rid_col].astype(str).str.contains('Grand Total', na=False)
-
-        data_rows = fmt_pivot[~gt_mask]
-        grand_total_rows = fmt_pivot[gt_mask]
+        n_data_rows = len(fmt_pivot) - 1 if pivot_rows else len(fmt_pivot)
+        data_rows = fmt_pivot.iloc[:n_data_rows]
+        grand_total_rows = fmt_pivot.iloc[n_data_rows:]
 
         # Compact sort controls inline
         sortable_cols = list(data_rows.columns)
@@ -737,11 +1123,35 @@ if pivot_rows or pivot_columns:
             data_rows = data_rows.sort_values(by=sort_col, ascending=(sort_order == "Ascending"), na_position='last').reset_index(drop=True)
 
         num_cols_list = list(data_rows.select_dtypes(include=['int64', 'int32', 'float64', 'float32']).columns)
-        data_bar_cols = [c for c in num_cols_list if 'Grand Total' not in str(c)]
-        global_max = max((data_rows[nc].max() for nc in data_bar_cols), default=1) if data_bar_cols else 1
-        if global_max < 1:
+        # ...and the Grand Total column last whenever there are column fields
+        data_bar_cols = num_cols_list[:-1] if pivot_columns else num_cols_list
+        # Bars are scaled over the whole table so pages stay comparable
+        global_max = np.nanmax(data_rows[data_bar_cols].to_numpy(dtype=float)) if data_bar_cols and len(data_rows) > 0 else 1
+        if not global_max >= 1:
             global_max = 1
 
+        # Page through rows and through the value columns; identifier and Grand Total
+        # columns stay visible on every page. Pages reset when the layout or sort changes.
+        page_key = hashlib.md5(repr((pivot_key, pivot_agg, sort_col, sort_order)).encode()).hexdigest()[:8]
+        n_row_pages = max(1, -(-len(data_rows) // PIVOT_PAGE_ROWS))
+        n_col_pages = max(1, -(-len(data_bar_cols) // PIVOT_PAGE_COLS))
+        row_page, col_page = 1, 1
+        if n_row_pages > 1 or n_col_pages > 1:
+            pg1, pg2, pg3 = st.columns([1, 1, 5])
+            with pg1:
+                if n_row_pages > 1:
+                    row_page = st.number_input(f"Row page (of {n_row_pages})", min_value=1, max_value=n_row_pages,
+                                               value=1, step=1, key=f"pivot_row_page_{_v}_{page_key}")
+            with pg2:
+                if n_col_pages > 1:
+                    col_page = st.number_input(f"Column page (of {n_col_pages})", min_value=1, max_value=n_col_pages,
+                                               value=1, step=1, key=f"pivot_col_page_{_v}_{page_key}")
+        row_start = (row_page - 1) * PIVOT_PAGE_ROWS
+        col_start = (col_page - 1) * PIVOT_PAGE_COLS
+        window_cols = set(data_bar_cols[col_start:col_start + PIVOT_PAGE_COLS])
+        page_cols = [c for c in data_rows.columns if c not in data_bar_cols or c in window_cols]
+        page_rows = data_rows.iloc[row_start:row_start + PIVOT_PAGE_ROWS][page_cols]
+
         if len(grand_total_rows) == 0 and len(data_rows) > 0 and num_cols_list:
             gt_row_data = {}
             for col in data_rows.columns:
@@ -753,88 +1163,229 @@ if pivot_rows or pivot_columns:
                     gt_row_data[col] = ""
             grand_total_rows = pd.DataFrame([gt_row_data])
 
-        if len(data_rows) > 0:
-            # Build HTML efficiently with list join
-            parts = ['<div class="service-table-container" style="max-height:500px;overflow-y:auto;"><table class="service-table"><thead><tr>']
-            for col in data_rows.columns:
-                parts.append(f'<th>{html.escape(str(col))}</th>')
-            parts.append('</tr></thead><tbody>')
-
-            col_list = list(data_rows.columns)
-            num_col_set = set(num_cols_list)
-            bar_col_set = set(data_bar_cols)
-            values = data_rows.values
-            for row_vals in values:
-                parts.append('<tr>')
-                for ci, col in enumerate(col_list):
-                    val = row_vals[ci]
-                    if col in num_col_set:
-                        cell_text = f"{val:.1f}%" if is_pct_agg else (f"{int(val):,}" if is_int_agg else f"{val:,.2f}")
-                        if col in bar_col_set:
-                            bar_pct = (val / global_max * 85) if global_max > 0 else 0
-                            parts.append(f'<td style="position:relative;padding:0;"><div style="position:absolute;top:4px;left:4px;bottom:4px;width:{bar_pct:.1f}%;background:linear-gradient(90deg,rgba(74,144,217,0.35),rgba(111,177,255,0.2));z-index:1;border-radius:3px;"></div><div style="position:relative;z-index:2;padding:8px 12px;">{cell_text}</div></td>')
+        with stage('pivot_html', rows_in=len(page_rows)):
+            if len(data_rows) > 0:
+                # Build HTML efficiently with list join
+                parts = ['<div class="service-table-container" style="max-height:500px;overflow-y:auto;"><table class="service-table"><thead><tr>']
+                for col in page_rows.columns:
+                    parts.append(f'<th>{html.escape(str(col))}</th>')
+                parts.append('</tr></thead><tbody>')
+
+                col_list = list(page_rows.columns)
+                num_col_set = set(num_cols_list)
+                bar_col_set = set(data_bar_cols)
+                values = page_rows.values
+                for row_vals in values:
+                    parts.append('<tr>')
+                    for ci, col in enumerate(col_list):
+                        val = row_vals[ci]
+                        if col in num_col_set:
+                            if pd.isna(val):
+                                cell_text = ""
+                            else:
+                                cell_text = f"{val:.1f}%" if is_pct_agg else (f"{int(val):,}" if is_int_agg else f"{val:,.2f}")
+                            if col in bar_col_set:
+                                bar_pct = (val / global_max * 85) if global_max > 0 and not pd.isna(val) else 0
+                                parts.append(f'<td style="position:relative;padding:0;"><div style="position:absolute;top:4px;left:4px;bottom:4px;width:{bar_pct:.1f}%;background:linear-gradient(90deg,rgba(74,144,217,0.35),rgba(111,177,255,0.2));z-index:1;border-radius:3px;"></div><div style="position:relative;z-index:2;padding:8px 12px;">{cell_text}</div></td>')
+                            else:
+                                parts.append(f'<td style="padding:8px 12px;font-weight:600;">{cell_text}</td>')
                         else:
-                            parts.append(f'<td style="padding:8px 12px;font-weight:600;">{cell_text}</td>')
-                    else:
-                        parts.append(f'<td style="padding:8px 12px;">{html.escape(str(val))}</td>')
-                parts.append('</tr>')
-
-            if len(grand_total_rows) > 0:
-                parts.append('<tr>')
-                for col in data_rows.columns:
-                    if col in grand_total_rows.columns:
-                        val = grand_total_rows[col].iloc[0]
-                        if isinstance(val, (int, float)) and col in num_cols_list:
-                            display_val = f"{val:.1f}%" if is_pct_agg else (f"{int(val):,}" if is_int_agg else f"{val:,.2f}")
+                            parts.append(f'<td style="padding:8px 12px;">{html.escape(str(val))}</td>')
+                    parts.append('</tr>')
+
+                if len(grand_total_rows) > 0:
+                    parts.append('<tr>')
+                    for col in page_rows.columns:
+                        if col in grand_total_rows.columns:
+                            val = grand_total_rows[col].iloc[0]
+                            if isinstance(val, (int, float)) and col in num_cols_list:
+                                display_val = "" if pd.isna(val) else (
+                                    f"{val:.1f}%" if is_pct_agg else (f"{int(val):,}" if is_int_agg else f"{val:,.2f}"))
+                            else:
+                                display_val = html.escape(str(val)) if val else ""
                         else:
-                            display_val = html.escape(str(val)) if val else ""
-                    else:
-                        display_val = ""
-                    parts.append(f'<td style="background-color:#E2E8F0;color:#1B2838;font-weight:600;padding:8px 12px;border-top:2px solid #CBD5E0;">{display_val}</td>')
-                parts.append('</tr>')
+                            display_val = ""
+                        parts.append(f'<td style="background-color:#E2E8F0;color:#1B2838;font-weight:600;padding:8px 12px;border-top:2px solid #CBD5E0;">{display_val}</td>')
+                    parts.append('</tr>')
 
-            parts.append('</tbody></table></div>')
-            st.markdown(''.join(parts), unsafe_allow_html=True)
+                parts.append('</tbody></table></div>')
+                st.markdown(''.join(parts), unsafe_allow_html=True)
+                if n_row_pages > 1 or n_col_pages > 1:
+                    st.caption(f"Rows {row_start + 1:,}-{row_start + len(page_rows):,} of {len(data_rows):,} | "
+                               f"value columns {col_start + 1:,}-{col_start + len(window_cols):,} of {len(data_bar_cols):,}. "
+                               f"Download the CSV for the full table.")
 
         csv_pivot = fmt_pivot.to_csv(index=False, encoding='utf-8-sig').encode('utf-8-sig')
         st.download_button("Download Pivot CSV", data=csv_pivot, file_name="RSA_Pivot_Export.csv", mime="text/csv", key="dl_pivot")
+        _pc = pivot_cache()
+        st.caption(f"Pivot cache: {_pc['hits']:,} hits / {_pc['misses']:,} misses ({len(_pc['entries'])} cached)")
     except Exception:
         st.markdown(_BLANK_BOX, unsafe_allow_html=True)
 else:
     st.info("Select at least one Row or Column dimension to build the pivot table.")
 
 # ============================================================================
-# COST ANALYSIS
+# CHART AGGREGATES - one grouping of the filtered cube shared by every chart fragment
 # ============================================================================
+chart_misses = chart_cache()['misses']
+with stage('chart_aggregates', rows_in=len(filtered_cube)) as _s:
+    charts = chart_series(filtered_cube, cache_key=view_key)
+    profile_note(cache='miss' if chart_cache()['misses'] > chart_misses else 'hit')
+    _s['rows_out'] = len(charts)
+
 _BLANK_BOX = '<div style="background:white;border-radius:10px;padding:40px 20px;text-align:center;border:1px solid #E5E7EB;color:#9CA3AF;font-size:13px;">No data to display</div>'
 
+# ============================================================================
+# CUSTOMER REACH - distinct policies, vehicles and customers of the filtered cases
+# ============================================================================
+# Filters finer than the sketch cells; while one of them narrows the data the counts are exact
+reach_exact_filters = [col for col, _ in filter_signature(filter_index, filter_selections)
+                       if col not in SKETCH_DIMENSIONS]
+REACH_BREAKDOWN_LABELS = {'month': 'Month', 'lob': 'LOB', 'province': 'Province'}
+REACH_COLUMNS = {'cases': 'Cases', 'policies': 'Unique Policies', 'vehicles': 'Unique Vehicles',
+                 'customers': 'Unique Customers', 'cases_per_policy': 'Cases per Policy'}
+
+
+def reach_tables(breakdown):
+    """Totals and per-breakdown distinct counts, from the sketches or (finer filters) the cases."""
+    by = DISTINCT_BREAKDOWNS[breakdown]
+    if reach_exact_filters:
+        frame = with_text_columns(filtered_df, df.attrs['digest'], columns=list(SKETCH_FIELDS.values()))
+        return dict(total=exact_distinct_counts(frame), by=exact_distinct_counts(frame, by))
+    mask = filter_mask(sketch_index, {c: v for c, v in filter_selections.items() if c in SKETCH_DIMENSIONS})
+    return dict(total=distinct_counts(sketches, mask), by=distinct_counts(sketches, mask, by))
+
+
+@st.fragment
+def render_customer_reach():
+    st.markdown('<div class="section-header">Customer Reach</div>', unsafe_allow_html=True)
+    rc1, _ = st.columns([1, 5])
+    with rc1:
+        breakdown = st.selectbox("Break down by", options=list(DISTINCT_BREAKDOWNS),
+                                 format_func=REACH_BREAKDOWN_LABELS.get, key=f"reach_breakdown_{_v}")
+    with stage('distinct_counts', rows_in=len(filtered_df) if reach_exact_filters else len(sketches['cells'])):
+        reach = lru_cached(chart_cache(), ('reach',) + view_key + (breakdown,), lambda: reach_tables(breakdown),
+                           CHART_CACHE_SIZE)
+    total = reach['total'].iloc[0]
+
+    def count_text(name):
+        return "N/A" if pd.isna(total[name]) else f"{total[name]:,.0f}"
+
+    note = trend_html(0, "neutral", f"of {int(total['cases']):,} cases")
+    reach_html = '<div style="display:grid;grid-template-columns:repeat(4,1fr);gap:16px;margin-bottom:12px;">'
+    reach_html += kpi_card("Unique Policies", count_text('policies'), "\U0001f4cb", "rgba(59,130,246,0.08)", note)
+    reach_html += kpi_card("Unique Vehicles", count_text('vehicles'), "\U0001f697", "rgba(16,185,129,0.08)", note)
+    reach_html += kpi_card("Unique Customers", count_text('customers'), "\U0001f464", "rgba(245,158,11,0.08)", note)
+    reach_html += kpi_card("Cases per Policy", "N/A" if pd.isna(total['cases_per_policy'])
+                           else f"{total['cases_per_policy']:.2f}", "\U0001f501", "rgba(139,92,246,0.08)",
+                           trend_html(0, "neutral", "cases / unique policies"))
+    reach_html += '</div>'
+    st.markdown(reach_html, unsafe_allow_html=True)
+    st.dataframe(reach['by'].rename(columns=REACH_COLUMNS), hide_index=True, use_container_width=True,
+                 column_config={'Cases per Policy': st.column_config.NumberColumn(format="%.2f")})
+    if reach_exact_filters:
+        st.caption("Counted exactly from the filtered cases: filtering by "
+                   + ", ".join(FILTER_LABELS[c] for c in reach_exact_filters)
+                   + " goes finer than the year, month, LOB and province the estimates are kept by.")
+    else:
+        st.caption("Estimated from HyperLogLog sketches kept per year, month, LOB and province "
+                   "(typically within 3% of the exact count).")
+
+render_customer_reach()
+
+# ============================================================================
+# COVERAGE UTILIZATION - cases against the coverage periods of their policies
+# ============================================================================
+@st.fragment
+def render_coverage():
+    st.markdown('<div class="section-header">Coverage Utilization</div>', unsafe_allow_html=True)
+    with stage('coverage', rows_in=len(df)):
+        coverage = dataset_coverage(df, df.attrs.get('digest'))
+        profile_note(cache='hit')
+        summary = coverage_summary(coverage, mask)
+        # Active policies follow the year, month and LOB filters; cases follow every filter
+        monthly = coverage_by_month(coverage, mask, filter_selections)
+    case_filters = [col for col, _ in filter_signature(filter_index, filter_selections)
+                    if col not in COVERAGE_POLICY_FILTERS]
+    status = summary['status']
+    total = int(status.sum())
+
+    def share(n):
+        return trend_html(0, "neutral", f"{n / total * 100:.1f}% of cases" if total else "of no cases")
+
+    cov_html = '<div style="display:grid;grid-template-columns:repeat(4,1fr);gap:16px;margin-bottom:12px;">'
+    for label, icon, bg in [(COVERAGE_STATUS[2], "\u2705", "rgba(16,185,129,0.08)"),
+                            (COVERAGE_STATUS[1], "\u23ea", "rgba(245,158,11,0.08)"),
+                            (COVERAGE_STATUS[3], "\u23e9", "rgba(239,68,68,0.08)"),
+                            (COVERAGE_STATUS[0], "\u2754", "rgba(156,163,175,0.12)")]:
+        cov_html += kpi_card(label, f"{int(status[label]):,}", icon, bg, share(int(status[label])))
+    cov_html += '</div>'
+    st.markdown(cov_html, unsafe_allow_html=True)
+
+    cv1, cv2 = st.columns(2)
+    with cv1:
+        position = summary['position']
+        if position.sum() > 0:
+            fig_pos = px.bar(x=position.index, y=position.values, labels={'x': 'Period elapsed', 'y': 'Cases'},
+                             title='Cases In Coverage by Point in the Coverage Period')
+            fig_pos.update_traces(marker_color='#3B82F6')
+            fig_pos.update_layout(xaxis_title='Share of coverage period elapsed', yaxis_title='Cases', height=340,
+                                  title=CHART_TITLE, **CHART_LAYOUT)
+            st.plotly_chart(fig_pos, use_container_width=True, config=PLOTLY_CONFIG)
+        else:
+            st.markdown(_BLANK_BOX, unsafe_allow_html=True)
+    with cv2:
+        if monthly['active_policies'].sum() > 0:
+            trend = monthly.assign(Date=pd.to_datetime(monthly[['Year', 'Month']].assign(Day=1)),
+                                   LOB=monthly['LOB'].astype(str))
+            fig_util = px.line(trend, x='Date', y='cases_per_policy', color='LOB', markers=True,
+                               title='Cases per Active Policy by LOB',
+                               hover_data={'active_policies': ':,', 'cases': ':,'},
+                               labels={'cases_per_policy': 'Cases per active policy', 'active_policies': 'Active policies',
+                                       'cases': 'Cases in coverage'})
+            fig_util.update_layout(xaxis_title='Month', yaxis_title='Cases per active policy', height=340,
+                                   hovermode='x unified', title=CHART_TITLE, **CHART_LAYOUT)
+            st.plotly_chart(fig_util, use_container_width=True, config=PLOTLY_CONFIG)
+        else:
+            st.markdown(_BLANK_BOX, unsafe_allow_html=True)
+    st.caption("A policy is active, and counted once, in every month its coverage periods (with renewals joined) "
+               "touch. Only policies with coverage dates in the report are known, so policies that never called are "
+               "not counted.")
+    if case_filters:
+        st.caption("Filtering by " + ", ".join(FILTER_LABELS[c] for c in case_filters)
+                   + " narrows the cases but not the active policies, which follow the year, month and LOB "
+                     "filters only.")
+
+render_coverage()
+
+# ============================================================================
+# COST ANALYSIS
+# ============================================================================
 @st.fragment
 def render_cost_analysis():
     st.markdown('<div class="section-header">Cost Analysis</div>', unsafe_allow_html=True)
-    try:
-        monthly_cost = filtered_df.groupby(['Year', 'Month'])['Fee (Baht)'].sum().reset_index()
-        if len(monthly_cost) > 0:
-            monthly_cost['Year'] = monthly_cost['Year'].astype(int)
-            monthly_cost['Month'] = monthly_cost['Month'].astype(int)
-
-            fig_trend = go.Figure()
-            year_colors = ['#3B82F6', '#10B981', '#F59E0B', '#8B5CF6', '#EF4444']
-            for i, yr in enumerate(sorted(monthly_cost['Year'].unique())):
-                yd = monthly_cost[monthly_cost['Year'] == yr]
-                c = year_colors[i % len(year_colors)]
-                fig_trend.add_trace(go.Scatter(x=yd['Month'], y=yd['Fee (Baht)'], mode='lines+markers', name=f'{yr}', line=dict(width=2, color=c), marker=dict(size=5, color=c)))
-
-            fig_trend.add_trace(go.Scatter(x=list(range(1, 13)), y=[MONTHLY_BUDGET] * 12, mode='lines', name='Budget', line=dict(color='#E74C3C', width=2, dash='dash')))
-            fig_trend.update_layout(
-                title={'text': 'Monthly Cost Trend with Budget Comparison', **CHART_TITLE},
-                xaxis_title='Month', yaxis_title='Fee (Baht)', hovermode='x unified', height=380,
-                xaxis=dict(tickmode='linear', tick0=1, dtick=1, gridcolor='#F3F4F6', showline=False),
-                yaxis=dict(gridcolor='#F3F4F6', showline=False),
-                **{k: v for k, v in CHART_LAYOUT.items() if k not in ('xaxis', 'yaxis')},
-            )
-            st.plotly_chart(fig_trend, use_container_width=True, config=PLOTLY_CONFIG)
-    except Exception:
-        st.markdown(_BLANK_BOX, unsafe_allow_html=True)
+    with stage('chart:cost_analysis'):
+        try:
+            monthly = charts['monthly_cost']
+            if len(monthly) > 0:
+                fig_trend = go.Figure()
+                year_colors = ['#3B82F6', '#10B981', '#F59E0B', '#8B5CF6', '#EF4444']
+                for i, yr in enumerate(sorted(monthly['Year'].unique())):
+                    yd = monthly[monthly['Year'] == yr]
+                    c = year_colors[i % len(year_colors)]
+                    fig_trend.add_trace(go.Scatter(x=yd['Month'], y=yd['Fee (Baht)'], mode='lines+markers', name=f'{yr}', line=dict(width=2, color=c), marker=dict(size=5, color=c)))
+
+                fig_trend.add_trace(go.Scatter(x=list(range(1, 13)), y=[MONTHLY_BUDGET] * 12, mode='lines', name='Budget', line=dict(color='#E74C3C', width=2, dash='dash')))
+                fig_trend.update_layout(
+                    title={'text': 'Monthly Cost Trend with Budget Comparison', **CHART_TITLE},
+                    xaxis_title='Month', yaxis_title='Fee (Baht)', hovermode='x unified', height=380,
+                    xaxis=dict(tickmode='linear', tick0=1, dtick=1, gridcolor='#F3F4F6', showline=False),
+                    yaxis=dict(gridcolor='#F3F4F6', showline=False),
+                    **{k: v for k, v in CHART_LAYOUT.items() if k not in ('xaxis', 'yaxis')},
+                )
+                st.plotly_chart(fig_trend, use_container_width=True, config=PLOTLY_CONFIG)
+        except Exception:
+            st.markdown(_BLANK_BOX, unsafe_allow_html=True)
 
 render_cost_analysis()
 
@@ -845,57 +1396,58 @@ render_cost_analysis()
 def render_additional_analytics():
     st.markdown('<div class="section-header">Analytics</div>', unsafe_allow_html=True)
 
-    c1, c2 = st.columns(2)
-    with c1:
-        try:
-            svc_dist = filtered_df['\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23'].value_counts()
-            fig_pie = px.pie(values=svc_dist.values, names=svc_dist.index, title='Service Type Distribution', hole=0.4,
-                             color_discrete_sequence=['#3B82F6','#10B981','#F59E0B','#EF4444','#8B5CF6','#6366F1','#EC4899'])
-            fig_pie.update_traces(textposition='inside', textinfo='percent+label', textfont_size=11)
-            fig_pie.update_layout(height=360, title=CHART_TITLE, font=CHART_FONT,
-                                  paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
-                                  margin=dict(l=16, r=16, t=40, b=16), legend=dict(font=dict(size=11)))
-            st.plotly_chart(fig_pie, use_container_width=True, config=PLOTLY_CONFIG)
-        except Exception:
-            st.markdown(_BLANK_BOX, unsafe_allow_html=True)
+    with stage('chart:analytics'):
+        c1, c2 = st.columns(2)
+        with c1:
+            try:
+                svc_dist = charts['service_cases']
+                fig_pie = px.pie(values=svc_dist.values, names=svc_dist.index, title='Service Type Distribution', hole=0.4,
+                                 color_discrete_sequence=['#3B82F6','#10B981','#F59E0B','#EF4444','#8B5CF6','#6366F1','#EC4899'])
+                fig_pie.update_traces(textposition='inside', textinfo='percent+label', textfont_size=11)
+                fig_pie.update_layout(height=360, title=CHART_TITLE, font=CHART_FONT,
+                                      paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
+                                      margin=dict(l=16, r=16, t=40, b=16), legend=dict(font=dict(size=11)))
+                st.plotly_chart(fig_pie, use_container_width=True, config=PLOTLY_CONFIG)
+            except Exception:
+                st.markdown(_BLANK_BOX, unsafe_allow_html=True)
 
-    with c2:
-        try:
-            lob_counts = filtered_df['LOB'].value_counts().sort_index()
-            fig_lob = px.bar(x=lob_counts.index, y=lob_counts.values, title='Cases by LOB',
-                             labels={'x':'LOB','y':'Cases'})
-            fig_lob.update_traces(marker_color='#3B82F6')
-            fig_lob.update_layout(height=360, showlegend=False, title=CHART_TITLE, **CHART_LAYOUT)
-            st.plotly_chart(fig_lob, use_container_width=True, config=PLOTLY_CONFIG)
-        except Exception:
-            st.markdown(_BLANK_BOX, unsafe_allow_html=True)
+        with c2:
+            try:
+                lob_counts = charts['lob_cases']
+                fig_lob = px.bar(x=lob_counts.index, y=lob_counts.values, title='Cases by LOB',
+                                 labels={'x':'LOB','y':'Cases'})
+                fig_lob.update_traces(marker_color='#3B82F6')
+                fig_lob.update_layout(height=360, showlegend=False, title=CHART_TITLE, **CHART_LAYOUT)
+                st.plotly_chart(fig_lob, use_container_width=True, config=PLOTLY_CONFIG)
+            except Exception:
+                st.markdown(_BLANK_BOX, unsafe_allow_html=True)
 
-    c3, c4 = st.columns(2)
-    with c3:
-        try:
-            top_vol = filtered_df['\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23'].value_counts().head(10)
-            fig_tv = px.bar(x=top_vol.values, y=top_vol.index, orientation='h', title='Top Services by Volume',
-                            labels={'x':'Cases','y':'Service'})
-            fig_tv.update_traces(marker_color='#10B981')
-            fig_tv.update_layout(height=360, showlegend=False, title=CHART_TITLE,
-                                 yaxis={'categoryorder':'total ascending', 'gridcolor':'#F3F4F6', 'showline':False},
-                                 **{k: v for k, v in CHART_LAYOUT.items() if k != 'yaxis'})
-            st.plotly_chart(fig_tv, use_container_width=True, config=PLOTLY_CONFIG)
-        except Exception:
-            st.markdown(_BLANK_BOX, unsafe_allow_html=True)
+        c3, c4 = st.columns(2)
+        with c3:
+            try:
+                top_vol = charts['service_cases'].head(10)
+                fig_tv = px.bar(x=top_vol.values, y=top_vol.index, orientation='h', title='Top Services by Volume',
+                                labels={'x':'Cases','y':'Service'})
+                fig_tv.update_traces(marker_color='#10B981')
+                fig_tv.update_layout(height=360, showlegend=False, title=CHART_TITLE,
+                                     yaxis={'categoryorder':'total ascending', 'gridcolor':'#F3F4F6', 'showline':False},
+                                     **{k: v for k, v in CHART_LAYOUT.items() if k != 'yaxis'})
+                st.plotly_chart(fig_tv, use_container_width=True, config=PLOTLY_CONFIG)
+            except Exception:
+                st.markdown(_BLANK_BOX, unsafe_allow_html=True)
 
-    with c4:
-        try:
-            top_cost = filtered_df.groupby('\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23')['Fee (Baht)'].sum().sort_values(ascending=False).head(10)
-            fig_tc = px.bar(x=top_cost.values, y=top_cost.index, orientation='h', title='Top Services by Cost',
-                            labels={'x':'Fee (Baht)','y':'Service'})
-            fig_tc.update_traces(marker_color='#F59E0B')
-            fig_tc.update_layout(height=360, showlegend=False, title=CHART_TITLE,
-                                 yaxis={'categoryorder':'total ascending', 'gridcolor':'#F3F4F6', 'showline':False},
-                                 **{k: v for k, v in CHART_LAYOUT.items() if k != 'yaxis'})
-            st.plotly_chart(fig_tc, use_container_width=True, config=PLOTLY_CONFIG)
-        except Exception:
-            st.markdown(_BLANK_BOX, unsafe_allow_html=True)
+        with c4:
+            try:
+                top_cost = charts['service_cost'].head(10)
+                fig_tc = px.bar(x=top_cost.values, y=top_cost.index, orientation='h', title='Top Services by Cost',
+                                labels={'x':'Fee (Baht)','y':'Service'})
+                fig_tc.update_traces(marker_color='#F59E0B')
+                fig_tc.update_layout(height=360, showlegend=False, title=CHART_TITLE,
+                                     yaxis={'categoryorder':'total ascending', 'gridcolor':'#F3F4F6', 'showline':False},
+                                     **{k: v for k, v in CHART_LAYOUT.items() if k != 'yaxis'})
+                st.plotly_chart(fig_tc, use_container_width=True, config=PLOTLY_CONFIG)
+            except Exception:
+                st.markdown(_BLANK_BOX, unsafe_allow_html=True)
 
 render_additional_analytics()
 
@@ -904,34 +1456,35 @@ render_additional_analytics()
 # ============================================================================
 @st.fragment
 def render_regional_analysis():
-    if '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14' not in filtered_df.columns:
+    if 'region_cases' not in charts:
         return
     st.markdown('<div class="section-header">Regional Analysis</div>', unsafe_allow_html=True)
-    c5, c6 = st.columns(2)
-    with c5:
-        try:
-            rc = filtered_df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14'].value_counts().head(15)
-            fig_r = px.bar(x=rc.values, y=rc.index, orientation='h', title='Top 15 Regions by Volume',
-                           labels={'x':'Cases','y':'Province'})
-            fig_r.update_traces(marker_color='#3B82F6')
-            fig_r.update_layout(height=440, showlegend=False, title=CHART_TITLE,
-                                yaxis={'categoryorder':'total ascending', 'gridcolor':'#F3F4F6', 'showline':False},
-                                **{k: v for k, v in CHART_LAYOUT.items() if k != 'yaxis'})
-            st.plotly_chart(fig_r, use_container_width=True, config=PLOTLY_CONFIG)
-        except Exception:
-            st.markdown(_BLANK_BOX, unsafe_allow_html=True)
-    with c6:
-        try:
-            rcost = filtered_df.groupby('\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14')['Fee (Baht)'].sum().sort_values(ascending=False).head(15)
-            fig_rc = px.bar(x=rcost.values, y=rcost.index, orientation='h', title='Top 15 Regions by Cost',
-                            labels={'x':'Fee (Baht)','y':'Province'})
-            fig_rc.update_traces(marker_color='#F59E0B')
-            fig_rc.update_layout(height=440, showlegend=False, title=CHART_TITLE,
-                                 yaxis={'categoryorder':'total ascending', 'gridcolor':'#F3F4F6', 'showline':False},
-                                 **{k: v for k, v in CHART_LAYOUT.items() if k != 'yaxis'})
-            st.plotly_chart(fig_rc, use_container_width=True, config=PLOTLY_CONFIG)
-        except Exception:
-            st.markdown(_BLANK_BOX, unsafe_allow_html=True)
+    with stage('chart:regional'):
+        c5, c6 = st.columns(2)
+        with c5:
+            try:
+                rc = charts['region_cases'].head(15)
+                fig_r = px.bar(x=rc.values, y=rc.index, orientation='h', title='Top 15 Regions by Volume',
+                               labels={'x':'Cases','y':'Province'})
+                fig_r.update_traces(marker_color='#3B82F6')
+                fig_r.update_layout(height=440, showlegend=False, title=CHART_TITLE,
+                                    yaxis={'categoryorder':'total ascending', 'gridcolor':'#F3F4F6', 'showline':False},
+                                    **{k: v for k, v in CHART_LAYOUT.items() if k != 'yaxis'})
+                st.plotly_chart(fig_r, use_container_width=True, config=PLOTLY_CONFIG)
+            except Exception:
+                st.markdown(_BLANK_BOX, unsafe_allow_html=True)
+        with c6:
+            try:
+                rcost = charts['region_cost'].head(15)
+                fig_rc = px.bar(x=rcost.values, y=rcost.index, orientation='h', title='Top 15 Regions by Cost',
+                                labels={'x':'Fee (Baht)','y':'Province'})
+                fig_rc.update_traces(marker_color='#F59E0B')
+                fig_rc.update_layout(height=440, showlegend=False, title=CHART_TITLE,
+                                     yaxis={'categoryorder':'total ascending', 'gridcolor':'#F3F4F6', 'showline':False},
+                                     **{k: v for k, v in CHART_LAYOUT.items() if k != 'yaxis'})
+                st.plotly_chart(fig_rc, use_container_width=True, config=PLOTLY_CONFIG)
+            except Exception:
+                st.markdown(_BLANK_BOX, unsafe_allow_html=True)
 
 render_regional_analysis()
 
@@ -941,29 +1494,25 @@ render_regional_analysis()
 @st.fragment
 def render_monthly_trend():
     st.markdown('<div class="section-header">Monthly Trend by Service Type</div>', unsafe_allow_html=True)
-    try:
-        _mst_df = filtered_df[['Year', 'Month', '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23']].copy()
-        _mst_df['\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23'] = _mst_df['\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23'].astype(str)
-        mst = _mst_df.groupby(['Year', 'Month', '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23']).size().reset_index(name='Count')
-        if len(mst) > 0:
-            mst['Year'] = mst['Year'].astype(int)
-            mst['Month'] = mst['Month'].astype(int)
-            mst['Date'] = pd.to_datetime(mst[['Year', 'Month']].assign(Day=1))
-            fig_mst = px.line(mst, x='Date', y='Count', color='\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', title='Monthly Case Volume by Service Type', markers=True)
-            fig_mst.update_layout(
-                xaxis_title='Date', yaxis_title='Cases', hovermode='x unified', height=380,
-                title=CHART_TITLE,
-                font=CHART_FONT, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
-                margin=dict(l=48, r=16, t=40, b=40),
-                xaxis=dict(gridcolor='#F3F4F6', showline=False),
-                yaxis=dict(gridcolor='#F3F4F6', showline=False),
-                legend=dict(orientation="v", yanchor="top", y=1, xanchor="left", x=1.02, font=dict(size=11))
-            )
-            st.plotly_chart(fig_mst, use_container_width=True, config=PLOTLY_CONFIG)
-        else:
-            st.markdown(_BLANK_BOX, unsafe_allow_html=True)
-    except Exception as e:
-        st.error(f"Monthly Trend error: {e}")
+    with stage('chart:monthly_trend'):
+        try:
+            mst = charts['monthly_service_cases']
+            if len(mst) > 0:
+                fig_mst = px.line(mst, x='Date', y='Count', color='\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', title='Monthly Case Volume by Service Type', markers=True)
+                fig_mst.update_layout(
+                    xaxis_title='Date', yaxis_title='Cases', hovermode='x unified', height=380,
+                    title=CHART_TITLE,
+                    font=CHART_FONT, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
+                    margin=dict(l=48, r=16, t=40, b=40),
+                    xaxis=dict(gridcolor='#F3F4F6', showline=False),
+                    yaxis=dict(gridcolor='#F3F4F6', showline=False),
+                    legend=dict(orientation="v", yanchor="top", y=1, xanchor="left", x=1.02, font=dict(size=11))
+                )
+                st.plotly_chart(fig_mst, use_container_width=True, config=PLOTLY_CONFIG)
+            else:
+                st.markdown(_BLANK_BOX, unsafe_allow_html=True)
+        except Exception as e:
+            st.error(f"Monthly Trend error: {e}")
 
 render_monthly_trend()
 
@@ -971,3 +1520,17 @@ render_monthly_trend()
 # FOOTER
 # ============================================================================
 st.markdown(f"<div class='dashboard-footer'><strong>RSA Dashboard</strong> - Sompo Thailand | {len(filtered_df):,} records | Rendered: {datetime.now().strftime('%Y-%m-%d %H:%M')}</div>", unsafe_allow_html=True)
+
+# ============================================================================
+# INSTRUMENTATION REPORT
+# ============================================================================
+if _profile['enabled']:
+    _profile['finished'] = True
+    log_profile('full', _profile['stages'])
+    if st.session_state.get('profile_panel'):
+        with profile_panel.container():
+            st.dataframe(pd.DataFrame(_profile['stages']), hide_index=True, use_container_width=True)
+            st.caption(f"Script run {time.perf_counter() - _profile['started']:.3f}s. "
+                       f"Dataset {frame_footprint(df) / 1e6:.1f} MB resident. Chart reruns are logged, not shown here. "
+                       + ("Peak MB is traced process-wide and includes other sessions' work." if TRACE_MEMORY
+                          else "Peak MB needs RSA_TRACE_MEMORY=1 at startup."))
@@ -0,0 +1,208 @@
+"""Headless RSA report runs: KPIs, Portfolio Health, a pivot and chart aggregates per workbook.
+
+    python rsa_batch.py "RSA Report.xlsx" reports/ --out output --format parquet \
+        --year 2025 --lob AV1 AC3 --pivot-rows LOB --pivot-columns Month --pivot-agg Sum
+
+Each workbook (or every .xlsx in a directory) gets its own folder under --out, named
+after the file (plus its parent directory's name when two inputs share a name), with
+kpis.json, pivot.<format>, one file per chart, distinct policies, vehicles and
+customers by month, LOB and province (distinct_<breakdown>.<format>) and active
+policies and cases per active policy by month and LOB (coverage_by_month.<format>);
+with --merge a directory is reported as one dataset, its workbooks parsed in
+parallel. As on the dashboard, the KPIs and Portfolio Health cover the whole
+dataset; the filters narrow the pivot, charts, distinct counts and coverage figures
+(active policies follow only the year, month and LOB filters).
+--as-of YYYY-MM-DD reports the KPIs as they stood at the end of that day.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+import rsa_pipeline as rp
+
+# CLI option -> (filter column, type of its values)
+FILTER_ARGUMENTS = {
+    'year': ('Year', int),
+    'month': ('Month', int),
+    'service': ('\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', str),
+    'lob': ('LOB', str),
+    'channel': ('\u0e23\u0e2b\u0e31\u0e2a\u0e42\u0e04\u0e23\u0e07\u0e01\u0e32\u0e23', str),
+    'region': ('\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14', str),
+    'make': ('\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16', str),
+    'model': ('\u0e23\u0e38\u0e48\u0e19\u0e23\u0e16', str),
+}
+OUTPUT_FORMATS = ('json', 'csv', 'parquet')
+
+
+def collect_workbooks(paths, merge=False):
+    """Expand directories to the .xlsx files they contain, or keep them whole with `merge`."""
+    workbooks = []
+    for path in paths:
+        if os.path.isdir(path) and not merge:
+            workbooks += rp.report_files(path)
+        else:
+            workbooks.append(path)
+    return workbooks
+
+
+def output_folders(workbooks):
+    """Output folder name per workbook: its file name without extension.
+
+    Names shared by several inputs get their parent directory's name appended
+    (`report_a`, `report_b` for a/report.xlsx and b/report.xlsx). Returns None when
+    names still collide.
+    """
+    stems = [os.path.splitext(os.path.basename(os.path.normpath(p)))[0] for p in workbooks]
+    names = [f"{stem}_{os.path.basename(os.path.dirname(os.path.abspath(p)))}" if stems.count(stem) > 1 else stem
+             for stem, p in zip(stems, workbooks)]
+    return names if len(set(names)) == len(names) else None
+
+
+def write_table(frame, path_stem, fmt):
+    if fmt == 'json':
+        frame.to_json(f"{path_stem}.json", orient='records', force_ascii=False, date_format='iso', indent=2)
+    elif fmt == 'csv':
+        frame.to_csv(f"{path_stem}.csv", index=False, encoding='utf-8-sig')
+    else:
+        # Parquet needs string column names; flattened pivot headers can be ints
+        frame.rename(columns=str).to_parquet(f"{path_stem}.parquet", index=False)
+
+
+def run_report(path, out_dir, selections, args):
+    """Process one workbook (or merged report directory) and write its reports to `out_dir`.
+
+    Returns the KPI document.
+    """
+    if os.path.isdir(path):
+        df = rp.load_report_directory(path, workers=args.workers)
+    else:
+        df = rp.load_workbook_file(path)
+    missing = [c for c in rp.REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required columns after processing: {missing}")
+    digest = df.attrs['digest']
+    cube = rp.build_cube(df, digest)
+
+    filter_index = rp.build_filter_index(df)
+    years = rp.filter_options(filter_index, 'Year')
+    if args.as_of:
+        kpis = rp.compute_kpis_as_of(rp.daily_totals(df), args.as_of)
+    else:
+        kpis = rp.compute_kpis(rp.month_totals(cube), args.current_year or max(years),
+                               args.current_month or datetime.now().month)
+    health = rp.portfolio_health(kpis)
+
+    mask = rp.filter_mask(filter_index, selections)
+    cube_mask = rp.filter_mask(rp.build_filter_index(cube), selections)
+    filtered_df = df if mask is None else df[mask]
+    filtered_cube = cube if cube_mask is None else cube[cube_mask]
+
+    os.makedirs(out_dir, exist_ok=True)
+    if len(filtered_df) > 0 and (args.pivot_rows or args.pivot_columns):
+        build = rp.build_sparse_pivot if args.pivot_layout == 'long' else rp.build_pivot
+        pivot = build(filtered_cube, filtered_df, args.pivot_rows, args.pivot_columns, args.pivot_value, args.pivot_agg)
+        write_table(pivot, os.path.join(out_dir, 'pivot'), args.format)
+    for name, frame in rp.chart_aggregates(filtered_cube).items():
+        write_table(frame, os.path.join(out_dir, name), args.format)
+    # Sketch estimates unless a filter is finer than the sketch cells; then exact counts
+    exact = any(col not in rp.SKETCH_DIMENSIONS for col in selections)
+    if exact:
+        distinct = rp.exact_distinct_counts(filtered_df)
+        breakdowns = {name: rp.exact_distinct_counts(filtered_df, by) for name, by in rp.DISTINCT_BREAKDOWNS.items()}
+    else:
+        sketches = rp.build_sketches(df, digest)
+        sketch_mask = rp.filter_mask(rp.build_filter_index(sketches['cells']), selections)
+        distinct = rp.distinct_counts(sketches, sketch_mask)
+        breakdowns = {name: rp.distinct_counts(sketches, sketch_mask, by)
+                      for name, by in rp.DISTINCT_BREAKDOWNS.items()}
+    for name, frame in breakdowns.items():
+        write_table(frame, os.path.join(out_dir, f'distinct_{name}'), args.format)
+    coverage = rp.coverage_index(df)
+    coverage_summary = rp.coverage_summary(coverage, mask)
+    write_table(rp.coverage_by_month(coverage, mask, selections), os.path.join(out_dir, 'coverage_by_month'),
+                args.format)
+
+    document = dict(
+        source=os.path.abspath(path),
+        digest=digest,
+        generated=datetime.now().isoformat(timespec='seconds'),
+        records=len(df),
+        workbooks=df[rp.SOURCE_COLUMN].nunique() if rp.SOURCE_COLUMN in df.columns else 1,
+        filtered_records=len(filtered_df),
+        filters={col: list(values) for col, values in selections.items()},
+        kpis=kpis,
+        portfolio_health=health,
+        distinct=dict(distinct.astype(object).iloc[0].where(distinct.iloc[0].notna(), None),
+                      method='exact' if exact else 'sketch'),
+        coverage={name: {label: int(n) for label, n in series.items()} for name, series in coverage_summary.items()},
+    )
+    with open(os.path.join(out_dir, 'kpis.json'), 'w', encoding='utf-8') as f:
+        json.dump(document, f, ensure_ascii=False, indent=2, default=float)
+    return document
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compute RSA dashboard reports without the UI.")
+    parser.add_argument('inputs', nargs='+', help="RSA report workbooks or directories of them")
+    parser.add_argument('--out', default='rsa_reports', help="output directory (default: %(default)s)")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='json',
+                        help="format of the pivot and chart tables (default: %(default)s)")
+    parser.add_argument('--merge', action='store_true',
+                        help="report each directory as one dataset merged from all its workbooks")
+    parser.add_argument('--workers', type=int,
+                        help="processes parsing a merged directory's workbooks (default: one per core)")
+    filters = parser.add_argument_group('filters (narrow the pivot and charts)')
+    for option, (col, kind) in FILTER_ARGUMENTS.items():
+        filters.add_argument(f'--{option}', nargs='+', type=kind, metavar=option.upper(), help=f"keep {col}")
+    pivot = parser.add_argument_group('pivot')
+    pivot.add_argument('--pivot-rows', nargs='*', default=['\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23'])
+    pivot.add_argument('--pivot-columns', nargs='*', default=['Year'])
+    pivot.add_argument('--pivot-value', default='Case Count', choices=['Case Count'] + rp.CUBE_VALUES)
+    pivot.add_argument('--pivot-agg', default='Count',
+                       choices=list(rp.PIVOT_AGGREGATIONS) + list(rp.PERCENT_AGGREGATIONS)
+                       + list(rp.RUNNING_AGGREGATIONS))
+    pivot.add_argument('--pivot-layout', choices=('grid', 'long'), default='grid',
+                       help="long: one line per row x column combination that has cases, totals last "
+                            "(needs row and column fields; default: %(default)s)")
+    kpi = parser.add_argument_group('KPIs')
+    kpi.add_argument('--current-year', type=int, help="year the KPIs report on (default: latest in the data)")
+    kpi.add_argument('--current-month', type=int, choices=range(1, 13), metavar='MONTH',
+                     help="month for MTD figures and the YTD cut-off (default: this month)")
+    kpi.add_argument('--as-of', type=lambda s: datetime.strptime(s, '%Y-%m-%d').date(), metavar='YYYY-MM-DD',
+                     help="report the KPIs as they stood at the end of this day (overrides the two options above)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    selections = {col: getattr(args, option) for option, (col, _) in FILTER_ARGUMENTS.items()
+                  if getattr(args, option)}
+    workbooks = collect_workbooks(args.inputs, merge=args.merge)
+    if not workbooks:
+        rp.logger.error("No workbooks found in %s", args.inputs)
+        return 1
+
+    folders = output_folders(workbooks)
+    if folders is None:
+        rp.logger.error("Inputs %s would share an output folder under %s; rename or run them separately",
+                        workbooks, args.out)
+        return 1
+
+    failed = 0
+    for path, folder in zip(workbooks, folders):
+        out_dir = os.path.join(args.out, folder)
+        try:
+            document = run_report(path, out_dir, selections, args)
+        except Exception:
+            rp.logger.exception("Failed to process %s", path)
+            failed += 1
+            continue
+        rp.logger.info("%s: %d records, %s -> %s", path, document['records'],
+                       document['portfolio_health']['status'], out_dir)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
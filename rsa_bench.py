@@ -0,0 +1,181 @@
+"""Scaling benchmark: time each dashboard stage on synthetic reports of several sizes.
+
+    python rsa_bench.py --sizes 10000 100000 1000000 --out bench_results.json
+    python rsa_bench.py --sizes 100000 --compare bench_results.json
+
+Workbooks are generated once per size and seed under --workdir and reused. Each
+stage is run --repeat times and the fastest run is reported. Results (with the
+pipeline version, git revision and library versions) go to a JSON file that a later
+run can --compare against.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import plotly
+import plotly.express as px
+
+import rsa_pipeline as rp
+import rsa_synth
+
+DEFAULT_SIZES = [10_000, 100_000]
+# Pivot layout timed for every aggregation
+BENCH_PIVOT = dict(rows=['\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', 'LOB'], columns=['Year'], value='Fee (Baht)')
+# Chart aggregate -> figure of the same kind as its dashboard chart, so timings include Plotly serialization
+CHART_FIGURES = {
+    'monthly_cost': lambda f: px.line(f, x='Month', y='Fee (Baht)', color='Year'),
+    'service_cases': lambda s: px.pie(values=s.values, names=s.index),
+    'service_cost': lambda s: px.bar(x=s.head(10).values, y=s.head(10).index, orientation='h'),
+    'lob_cases': lambda s: px.bar(x=s.index, y=s.values),
+    'region_cases': lambda s: px.bar(x=s.head(15).values, y=s.head(15).index, orientation='h'),
+    'region_cost': lambda s: px.bar(x=s.head(15).values, y=s.head(15).index, orientation='h'),
+    'monthly_service_cases': lambda f: px.line(f, x='Date', y='Count',
+                                               color='\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23'),
+}
+
+
+def bench_selections(index):
+    """A typical narrowing filter: the latest year and the busier half of the service types."""
+    years = rp.filter_options(index, 'Year')
+    services = rp.filter_options(index, '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23')
+    return {'Year': years[-1:], '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23': services[:max(1, len(services) // 2)]}
+
+
+def timed(results, size, stage, func, repeat, rows_in=None):
+    """Run `func` `repeat` times, record the fastest wall time and return its last result."""
+    best, result = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    rows_out = len(result) if hasattr(result, '__len__') and not isinstance(result, (str, bytes, dict)) else None
+    resident_mb = round(rp.frame_footprint(result) / 1e6, 3) if isinstance(result, pd.DataFrame) else None
+    results.append(dict(size=size, stage=stage, seconds=round(best, 6), repeat=repeat,
+                        rows_in=rows_in, rows_out=rows_out, resident_mb=resident_mb))
+    rp.logger.info("bench %9d %-32s %9.4fs", size, stage, best)
+    return result
+
+
+def workbook_for(size, seed, workdir):
+    path = os.path.join(workdir, f"synthetic_{size}_s{seed}.xlsx")
+    if not os.path.exists(path):
+        os.makedirs(workdir, exist_ok=True)
+        t0 = time.perf_counter()
+        rsa_synth.write_report(path, size, seed=seed)
+        rp.logger.info("Generated %s in %.1fs", path, time.perf_counter() - t0)
+    return path
+
+
+def bench_size(size, seed, workdir, repeat):
+    """Time every stage on one synthetic workbook of `size` cases."""
+    results = []
+    path = workbook_for(size, seed, workdir)
+    # Excel parsing runs once per size; it dominates and repeats would only add minutes
+    timed(results, size, 'sheet_detection', lambda: next(rp.iter_report_chunks(path, chunk_rows=1)), 1)
+    df = timed(results, size, 'load_and_process', lambda: rp.process_workbook(path), 1)
+    with open(path, 'rb') as f:
+        digest = rp.workbook_digest(f.read())
+    rp.write_snapshot(df, digest)
+    df = timed(results, size, 'snapshot_read', lambda: rp.read_snapshot(digest), repeat, len(df))
+    df = timed(results, size, 'lean_frame', lambda: rp.lean_frame(df), repeat, len(df))
+
+    index = timed(results, size, 'filter_index', lambda: rp.build_filter_index(df), repeat, len(df))
+    selections = bench_selections(index)
+    mask = timed(results, size, 'filter_mask', lambda: rp.filter_mask(index, selections), repeat, len(df))
+    filtered_df = df if mask is None else df[mask]
+    cube = timed(results, size, 'aggregate_cube', lambda: rp.aggregate_cube(df), repeat, len(df))
+    cube_index = rp.build_filter_index(cube)
+    cube_mask = rp.filter_mask(cube_index, selections)
+    filtered_cube = cube if cube_mask is None else cube[cube_mask]
+
+    years = rp.filter_options(index, 'Year')
+    totals = timed(results, size, 'month_totals', lambda: rp.month_totals(cube), repeat, len(cube))
+    timed(results, size, 'kpi_block', lambda: rp.portfolio_health(rp.compute_kpis(totals, years[-1], 12)),
+          repeat, len(cube))
+    daily = timed(results, size, 'daily_totals', lambda: rp.daily_totals(df), repeat, len(df))
+    timed(results, size, 'kpi_block_as_of',
+          lambda: rp.portfolio_health(rp.compute_kpis_as_of(daily, daily['last_case'])), repeat, len(df))
+    for agg in list(rp.PIVOT_AGGREGATIONS) + list(rp.PERCENT_AGGREGATIONS) + list(rp.RUNNING_AGGREGATIONS):
+        timed(results, size, f'pivot[{agg}]', lambda: rp.build_pivot(
+            filtered_cube, filtered_df, BENCH_PIVOT['rows'], BENCH_PIVOT['columns'], BENCH_PIVOT['value'], agg),
+            repeat, len(filtered_cube))
+    timed(results, size, 'pivot_sparse[Sum]', lambda: rp.build_sparse_pivot(
+        filtered_cube, filtered_df, BENCH_PIVOT['rows'], BENCH_PIVOT['columns'], BENCH_PIVOT['value'], 'Sum'),
+        repeat, len(filtered_cube))
+    # Distinct counts for the latest year: merged from the sketches, and counted from the cases
+    sketch_df = rp.with_text_columns(df, digest, columns=list(rp.SKETCH_FIELDS.values()))
+    sketches = timed(results, size, 'aggregate_sketches', lambda: rp.aggregate_sketches(sketch_df), repeat, len(df))
+    year_selection = {'Year': selections['Year']}
+    sketch_mask = rp.filter_mask(rp.build_filter_index(sketches['cells']), year_selection)
+    year_mask = rp.filter_mask(index, year_selection)
+    year_df = sketch_df if year_mask is None else sketch_df[year_mask]
+    timed(results, size, 'distinct_counts[sketch]', lambda: rp.distinct_counts(sketches, sketch_mask), repeat,
+          len(sketches['cells']))
+    timed(results, size, 'distinct_counts[exact]', lambda: rp.exact_distinct_counts(year_df), repeat, len(year_df))
+    coverage = timed(results, size, 'coverage_index', lambda: rp.coverage_index(df), repeat, len(df))
+    timed(results, size, 'coverage_by_month', lambda: rp.coverage_by_month(coverage, mask), repeat, len(df))
+    charts = timed(results, size, 'chart_aggregates', lambda: rp.chart_series(filtered_cube), repeat,
+                   len(filtered_cube))
+    for name, series in charts.items():
+        figure = CHART_FIGURES[name]
+        timed(results, size, f'chart[{name}]', lambda: figure(series).to_json(), repeat, len(series))
+    for fmt in rp.EXPORT_FORMATS:
+        timed(results, size, f'export[{fmt}]',
+              lambda: rp.export_bytes(filtered_df, fmt, digest=digest), repeat, len(filtered_df))
+    return results
+
+
+def environment():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        revision = None
+    return dict(pipeline_version=rp.PIPELINE_VERSION, git_revision=revision,
+                timestamp=datetime.now().isoformat(timespec='seconds'), python=platform.python_version(),
+                platform=platform.platform(), pandas=pd.__version__, numpy=np.__version__,
+                plotly=plotly.__version__)
+
+
+def compare(results, baseline_path):
+    """Log each stage's time against the same size and stage in a previous results file."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['size'], r['stage']): r['seconds'] for r in json.load(f)['results']}
+    for r in results:
+        before = baseline.get((r['size'], r['stage']))
+        if before:
+            rp.logger.info("compare %9d %-32s %9.4fs -> %9.4fs (x%.2f)", r['size'], r['stage'], before,
+                           r['seconds'], r['seconds'] / before)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the RSA pipeline on synthetic reports.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="cases per workbook")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help="runs per in-memory stage (fastest is kept)")
+    parser.add_argument('--workdir', default='bench_data', help="where synthetic workbooks are kept")
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--compare', help="previous results file to compare against")
+    args = parser.parse_args(argv)
+
+    # Keep benchmark snapshots away from the dashboard's, which are pruned to SNAPSHOT_KEEP
+    rp.SNAPSHOT_DIR = os.path.join(args.workdir, 'snapshots')
+    results = []
+    for size in args.sizes:
+        results += bench_size(size, args.seed, args.workdir, args.repeat)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(dict(environment=environment(), sizes=args.sizes, seed=args.seed, results=results), f,
+                  ensure_ascii=False, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
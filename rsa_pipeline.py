@@ -0,0 +1,1827 @@
+"""RSA report processing pipeline: ingest, cleaning, snapshots, filters, cube, pivots, KPIs and exports.
+
+Importable without Streamlit; app.py renders it and rsa_batch.py runs it headless.
+"""
+import pandas as pd
+import numpy as np
+import os
+import re
+import hashlib
+import threading
+import itertools
+import logging
+import multiprocessing
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO, TextIOWrapper
+import openpyxl
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+MONTHLY_BUDGET = 200_000
+HEALTH_THRESHOLD_HEALTHY = 5
+HEALTH_THRESHOLD_WARNING = 15
+UPLOAD_DIR = "uploaded_data"
+SNAPSHOT_DIR = os.path.join(UPLOAD_DIR, "snapshots")
+SNAPSHOT_KEEP = 8
+# Rows per snapshot row group; exports read text columns back one row-group span at a time
+SNAPSHOT_ROW_GROUP_ROWS = 65_536
+# Bump whenever the cleaning in process_workbook changes so stale snapshots are rebuilt
+PIPELINE_VERSION = 6
+HEADER_PROBE_ROWS = 30
+INGEST_CHUNK_ROWS = 20_000
+# Processes parsing the workbooks of a report directory (None: one per CPU core)
+INGEST_WORKERS = None
+# Per-column cap on remembered raw -> cleaned values before a memo table is reset
+NORMALIZE_MEMO_MAX = 200_000
+PIVOT_CACHE_SIZE = 32
+CHART_CACHE_SIZE = 16
+EXPORT_CHUNK_ROWS = 50_000
+# Exports larger than this are spooled to a temporary file while they are written
+EXPORT_SPOOL_BYTES = 32 * 2**20
+REQUIRED_HEADERS = {'Roadside_Plan', 'Policy Type'}
+# Cell texts pd.read_excel reads as missing by default; the streaming reader does the same
+EXCEL_NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                   '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+# Columns the KPIs, charts and pivots cannot do without
+REQUIRED_COLUMNS = ['Year', 'Month', 'Fee (Baht)', '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', 'LOB']
+# Ticket number; identifies a case across monthly reports
+TICKET_COLUMN = '\u0e40\u0e25\u0e02\u0e23\u0e31\u0e1a\u0e41\u0e08\u0e49\u0e07'
+# Workbook each case was read from, in datasets built from a report directory
+SOURCE_COLUMN = 'Source File'
+# Declared storage types, applied by finalize_frame: dimensions as categories, small
+# ints for the date parts and float32 for money and distance (exact to the satang
+# below 131,072 Baht; numeric_values rounds back to it)
+CATEGORY_COLUMNS = ['\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', 'LOB', 'Policy Type', 'Roadside_Plan', '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14', '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16',
+                    '\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16', '\u0e23\u0e38\u0e48\u0e19\u0e23\u0e16', '\u0e23\u0e2b\u0e31\u0e2a\u0e42\u0e04\u0e23\u0e07\u0e01\u0e32\u0e23', '\u0e41\u0e1c\u0e19\u0e01', SOURCE_COLUMN]
+COLUMN_TYPES = {'Year': 'int16', 'Month': 'int8', 'Day': 'int8', 'Fee (Baht)': 'float32',
+                '\u0e25\u0e39\u0e01\u0e04\u0e49\u0e32\u0e08\u0e48\u0e32\u0e22\u0e2a\u0e48\u0e27\u0e19\u0e15\u0e48\u0e32\u0e07': 'float32', '\u0e23\u0e30\u0e22\u0e30\u0e17\u0e32\u0e07 (KM)': 'float32'}
+# Free-text and contact columns no KPI, chart, filter or pivot reads; lean frames
+# leave them in the snapshot and exports read them back
+TEXT_COLUMNS = ['\u0e0a\u0e37\u0e48\u0e2d\u0e19\u0e32\u0e21\u0e2a\u0e01\u0e38\u0e25\u0e25\u0e39\u0e01\u0e04\u0e49\u0e32', '\u0e40\u0e1a\u0e2d\u0e23\u0e4c\u0e42\u0e17\u0e23\u0e28\u0e31\u0e1e\u0e17\u0e4c', '\u0e2a\u0e32\u0e40\u0e2b\u0e15\u0e38\u0e01\u0e32\u0e23\u0e02\u0e2d\u0e43\u0e0a\u0e49\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', '\u0e01\u0e32\u0e23\u0e43\u0e2b\u0e49\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23',
+                '\u0e2a\u0e16\u0e32\u0e19\u0e17\u0e35\u0e48\u0e40\u0e01\u0e34\u0e14\u0e40\u0e2b\u0e15\u0e38', '\u0e15\u0e49\u0e19\u0e17\u0e32\u0e07', '\u0e1b\u0e25\u0e32\u0e22\u0e17\u0e32\u0e07', '\u0e2b\u0e21\u0e32\u0e22\u0e40\u0e2b\u0e15\u0e38']
+
+pd.set_option('future.no_silent_downcasting', True)
+logger = logging.getLogger("rsa_dashboard")
+if not logger.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+    logger.addHandler(_log_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+# ============================================================================
+# DATA LOADING
+# ============================================================================
+def iter_report_chunks(source, chunk_rows=INGEST_CHUNK_ROWS, probe_rows=HEADER_PROBE_ROWS, progress=None):
+    """Stream the report sheet as DataFrames of up to `chunk_rows` rows, header applied.
+
+    The workbook is opened once in read-only mode. Only the first `probe_rows` rows of
+    each sheet are read to pick the sheet: prefer a header row containing both
+    'Roadside_Plan' and 'Policy Type', fall back to any sheet with a 'Policy No.'
+    header, then to the first sheet. Always yields at least one (possibly empty) chunk.
+    Cells holding one of EXCEL_NA_VALUES are read as missing, as pd.read_excel does.
+    `progress(step, fraction)` is told when the sheet is picked and how much of it has
+    been read.
+    """
+    progress = progress or _no_progress
+    t0 = time.perf_counter()
+    wb = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        probes = []
+        for ws in wb.worksheets:
+            header, header_row, preferred, has_policy = None, None, False, False
+            for idx, row in enumerate(ws.iter_rows(max_row=probe_rows, values_only=True)):
+                if header_row is None and 'Policy No.' in row:
+                    header, header_row = row, idx
+                row_vals = set(str(v).strip() for v in row if v is not None)
+                preferred = preferred or REQUIRED_HEADERS.issubset(row_vals)
+                has_policy = has_policy or 'Policy No.' in row_vals
+            probes.append(dict(ws=ws, header=header, header_row=header_row, preferred=preferred,
+                               has_policy=has_policy, rows=ws.max_row or 0))
+        if not probes:
+            raise ValueError("Workbook contains no worksheets")
+
+        chosen = (next((p for p in probes if p['preferred']), None)
+                  or next((p for p in probes if p['has_policy']), None)
+                  or probes[0])
+        if chosen['header_row'] is None:
+            raise ValueError("Could not find header row containing 'Policy No.'")
+        skipped = [p for p in probes if p is not chosen]
+        logger.info("Sheet detection: picked %r (header row %d) after probing %d sheet(s) in %.3fs; "
+                    "skipped %d sheet(s) / %d rows a full scan would have parsed",
+                    chosen['ws'].title, chosen['header_row'], len(probes), time.perf_counter() - t0,
+                    len(skipped), sum(p['rows'] for p in skipped))
+
+        progress('sheet detection', 1.0)
+        ws = chosen['ws']
+        width = max(len(chosen['header']), ws.max_column or 0)
+        header = list(chosen['header']) + [None] * (width - len(chosen['header']))
+        rows = ws.iter_rows(min_row=chosen['header_row'] + 2, values_only=True)
+        n_chunks, n_rows = 0, 0
+        total_rows = max(chosen['rows'] - chosen['header_row'] - 1, 1)
+        while True:
+            block = [row[:width] for row in itertools.islice(rows, chunk_rows)]
+            if not block and n_chunks:
+                break
+            n_chunks, n_rows = n_chunks + 1, n_rows + len(block)
+            progress('parse', min(n_rows / total_rows, 1.0))
+            yield pd.DataFrame(block, columns=header).replace(EXCEL_NA_VALUES, pd.NA)
+    finally:
+        wb.close()
+
+
+def _no_progress(step, fraction):
+    pass
+
+
+def _whole_float_to_int(value):
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
+def _assemble_column(parts):
+    """Concatenate one column's chunk buffers.
+
+    When chunks inferred different dtypes (e.g. a phone column that is all numbers in
+    one chunk and mixed with text in another), ints that were upcast to float by empty
+    cells are restored and the full column is re-inferred, so the result does not
+    depend on the chunk size.
+    """
+    if len(set(p.dtype for p in parts)) > 1:
+        parts = [pd.Series([_whole_float_to_int(v) for v in p], dtype=object) if p.dtype.kind == 'f' else p
+                 for p in parts]
+        return pd.concat(parts, ignore_index=True).infer_objects()
+    return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0].reset_index(drop=True)
+
+
+def process_workbook(source, chunk_rows=INGEST_CHUNK_ROWS, progress=None):
+    """Parse an RSA workbook (path or file-like) into the cleaned dashboard frame.
+
+    Rows are streamed and cleaned `chunk_rows` at a time and appended to per-column
+    buffers, so peak memory stays close to the size of the final frame instead of
+    holding several full copies of the raw sheet. `progress(step, fraction)` follows
+    the 'sheet detection', 'parse' and 'clean' steps.
+    """
+    progress = progress or _no_progress
+    t0 = time.perf_counter()
+    columns, buffers = None, None
+    for chunk in iter_report_chunks(source, chunk_rows, progress=progress):
+        chunk = clean_chunk(chunk)
+        if columns is None:
+            columns = list(chunk.columns)
+            buffers = [[] for _ in columns]
+        for i, parts in enumerate(buffers):
+            parts.append(chunk.iloc[:, i])
+        del chunk
+
+    data = {}
+    for i in range(len(columns)):
+        progress('clean', i / (len(columns) + 1))
+        data[i] = _assemble_column(buffers[i])
+        buffers[i] = None
+    df = pd.DataFrame(data, copy=False)
+    df.columns = columns
+    df = finalize_frame(df)
+    progress('clean', 1.0)
+
+    logger.info("Processed %d rows x %d columns in %.3fs (chunk size %d)",
+                len(df), len(df.columns), time.perf_counter() - t0, chunk_rows)
+    return df
+
+
+def finalize_frame(df):
+    """Apply the whole-frame dtype rules to a cleaned (or concatenated) dataset."""
+    # Give leftover object columns a single Arrow-compatible type so the frame
+    # round-trips through the columnar snapshot unchanged: numbers become numeric
+    # (nullable ints when whole), and columns mixing numbers and text (e.g. codes
+    # typed both ways) are kept as text
+    for col in df.columns[df.dtypes == object]:
+        kind = pd.api.types.infer_dtype(df[col], skipna=True)
+        if kind in ('integer', 'floating', 'mixed-integer-float'):
+            num = pd.to_numeric(df[col], errors='coerce')
+            whole = num.dropna()
+            df[col] = num.astype('Int64') if (whole == whole.round()).all() else num
+        elif kind.startswith('mixed'):
+            df[col] = df[col].astype(str).where(df[col].notna())
+
+    # Declared schema: categories for dimensions (faster isin/groupby, one copy per
+    # distinct value), then the narrow numeric types
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    for col, dtype in COLUMN_TYPES.items():
+        if col not in df.columns:
+            continue
+        values = pd.to_numeric(df[col], errors='coerce')
+        if dtype.startswith('int') and values.isna().any():
+            continue
+        df[col] = values.astype(dtype)
+    return df
+
+
+def numeric_values(series):
+    """A value column as float64 for arithmetic; float32 columns are rounded back to the satang."""
+    values = pd.to_numeric(series, errors='coerce')
+    if values.dtype == np.float32:
+        return values.astype(float).round(2)
+    return values.astype(float)
+
+
+def frame_footprint(df):
+    """Resident size of `df` in bytes, strings and categories included."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def lean_frame(df):
+    """`df` without its TEXT_COLUMNS; rows, index and attrs are unchanged."""
+    lean = df.drop(columns=[c for c in TEXT_COLUMNS if c in df.columns])
+    lean.attrs = dict(df.attrs)
+    return lean
+
+
+_NORMALIZATION_MEMOS = {}
+# Guards the memo tables; uploads are cleaned on background threads, several at once
+_NORMALIZATION_LOCK = threading.Lock()
+
+
+def normalization_memos():
+    """Process-wide raw -> cleaned value tables, kept across reruns and uploads."""
+    return _NORMALIZATION_MEMOS
+
+
+def memo_normalize(series, name, func, na_value=pd.NA):
+    """Apply the vectorized cleaning `func` once per distinct value of `series`.
+
+    The column is factorized, only values not already in the `name` memo table are
+    passed to `func`, and the results are mapped back through the integer codes.
+    Missing values map to `na_value`. The memo is only touched under a lock and the
+    codes are mapped through a table local to the call, so a concurrent reset of the
+    memo cannot break the lookup.
+    """
+    codes, uniques = pd.factorize(series)
+    with _NORMALIZATION_LOCK:
+        memo = normalization_memos().setdefault(name, {})
+        cleaned = {u: memo[u] for u in uniques if u in memo}
+    new = [u for u in uniques if u not in cleaned]
+    if new:
+        cleaned.update(zip(new, func(pd.Series(new, dtype=object)).tolist()))
+        with _NORMALIZATION_LOCK:
+            memo = normalization_memos().setdefault(name, {})
+            if len(memo) + len(new) > NORMALIZE_MEMO_MAX:
+                memo.clear()
+                memo.update(cleaned)
+            else:
+                memo.update((u, cleaned[u]) for u in new)
+    # Code -1 (missing) takes the trailing na_value
+    lookup = pd.Series([cleaned[u] for u in uniques] + [na_value])
+    return pd.Series(lookup.to_numpy()[codes], index=series.index).infer_objects()
+
+
+def _parse_report_dates(values):
+    return pd.to_datetime(values, format='%d/%m/%Y', errors='coerce')
+
+
+def _clean_plate_province(values):
+    cleaned = values.astype(str).str.replace(r'[.!@#$%^&*\d]', '', regex=True).str.strip()
+    return cleaned.replace(['', 'nan', 'None', '<NA>'], pd.NA)
+
+
+def _province_from_plate(values):
+    return values.astype(str).str.extract(r'(\d)[.\s]*([ก-๙]+)\s*[.!@#$%^&*]*\s*$', expand=True)[1]
+
+
+def _upper_brand(values):
+    return values.astype(str).str.upper()
+
+
+def clean_chunk(df):
+    """Apply the row-local cleaning rules to one chunk of the report sheet."""
+    # Clean Fee column name
+    fee_cols = [c for c in df.columns if isinstance(c, str) and 'Fee' in c and 'Exceed' not in c]
+    if fee_cols:
+        df = df.rename(columns={fee_cols[0]: 'Fee (Baht)'})
+
+    # Process dates
+    if '\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48' in df.columns:
+        if df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'].dtype == 'object':
+            df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'] = memo_normalize(df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'], 'date', _parse_report_dates, na_value=pd.NaT)
+        else:
+            df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'] = pd.to_datetime(df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'], errors='coerce')
+        df = df.dropna(subset=['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'])
+        df['Day'] = df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'].dt.day.astype(int)
+        df['Month'] = df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'].dt.month.astype(int)
+        df['Year'] = df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'].dt.year.astype(int)
+        df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'] = df['\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48'].dt.date
+
+    df = df.dropna(how='all').reset_index(drop=True)
+    df = df.replace('-', pd.NA)
+
+    # LOB
+    if 'Policy No.' in df.columns:
+        df['Policy Type'] = df['Policy No.'].astype(str).str.extract(r'(A[CV]\d)', expand=False)
+    df['LOB'] = df['Policy Type'].fillna('Unverify') if 'Policy Type' in df.columns else 'Unre'
+
+    # Province extraction
+    if '\u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16' in df.columns:
+        if '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16' in df.columns:
+            df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'] = memo_normalize(df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'], 'plate_province', _clean_plate_province)
+        extracted = memo_normalize(df['\u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'], 'plate', _province_from_plate, na_value=float('nan'))
+        if '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16' in df.columns:
+            df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'] = df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'].fillna(extracted)
+        else:
+            df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'] = extracted
+        df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'] = df['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16'].replace(['\u0e01\u0e23\u0e38\u0e07\u0e40\u0e17\u0e1e', '\u0e01\u0e17\u0e21'], '\u0e01\u0e23\u0e38\u0e07\u0e40\u0e17\u0e1e\u0e21\u0e2b\u0e32\u0e19\u0e04\u0e23')
+
+    if 'Fee (Baht)' in df.columns:
+        df['Fee (Baht)'] = pd.to_numeric(df['Fee (Baht)'], errors='coerce')
+
+    # Set Fee to 100 for cancellation or inquiry service types
+    if 'Fee (Baht)' in df.columns and '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23' in df.columns:
+        cancel_inquiry_mask = df['\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23'].isin(['\u0e25\u0e39\u0e01\u0e04\u0e49\u0e32\u0e41\u0e08\u0e49\u0e07\u0e22\u0e01\u0e40\u0e25\u0e34\u0e01', '\u0e2a\u0e2d\u0e1a\u0e16\u0e32\u0e21\u0e02\u0e49\u0e2d\u0e21\u0e39\u0e25'])
+        df.loc[cancel_inquiry_mask, 'Fee (Baht)'] = 100
+
+    if '\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16' in df.columns:
+        df['\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16'] = memo_normalize(df['\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16'], 'brand', _upper_brand)
+
+    return df
+
+
+# ============================================================================
+# PROCESSED SNAPSHOTS (columnar cache keyed by workbook hash + pipeline version)
+# ============================================================================
+def workbook_digest(file_bytes):
+    return hashlib.md5(file_bytes).hexdigest()
+
+
+def file_digest(path, block_size=2**20):
+    """workbook_digest of the file at `path`, hashed in blocks instead of read whole."""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def snapshot_path(digest, kind=None):
+    stem = f"{digest}_{kind}" if kind else digest
+    return os.path.join(SNAPSHOT_DIR, f"{stem}_v{PIPELINE_VERSION}.parquet")
+
+
+def read_snapshot(digest, kind=None):
+    path = snapshot_path(digest, kind)
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_parquet(path)
+    except Exception:
+        # Corrupt or unreadable snapshot - drop it and rebuild from the workbook
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+
+def write_snapshot(df, digest, kind=None):
+    """Persist the processed frame; failures only cost the next cold start a re-parse."""
+    path = snapshot_path(digest, kind)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        df.to_parquet(tmp_path, index=False, row_group_size=SNAPSHOT_ROW_GROUP_ROWS)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    try:
+        prune_snapshots()
+    except OSError:
+        pass
+
+
+_HELD_SNAPSHOTS = dict(digests=frozenset(), lock=threading.Lock())
+
+
+def hold_snapshots(digests):
+    """Keep every snapshot of `digests` (dataset, cube and sketch) through prune_snapshots.
+
+    Replaces the previously held set. Lean frames read their text columns back from
+    the dataset snapshot, so whoever keeps lean frames must hold their digests.
+    """
+    with _HELD_SNAPSHOTS['lock']:
+        _HELD_SNAPSHOTS['digests'] = frozenset(digests)
+
+
+def prune_snapshots(keep=SNAPSHOT_KEEP):
+    """Drop snapshots from older pipeline versions and all but the newest `keep` others.
+
+    Snapshots of held digests (see hold_snapshots) are kept and not counted.
+    """
+    suffix = f"_v{PIPELINE_VERSION}.parquet"
+    with _HELD_SNAPSHOTS['lock']:
+        held = _HELD_SNAPSHOTS['digests']
+    entries = []
+    for name in os.listdir(SNAPSHOT_DIR):
+        path = os.path.join(SNAPSHOT_DIR, name)
+        if not name.endswith(suffix):
+            if name.endswith('.parquet'):
+                os.remove(path)
+            continue
+        # Per-workbook snapshots of a report directory are only dropped with their pipeline version
+        if not name.endswith(f"_report{suffix}") and name.split('_')[0] not in held:
+            entries.append((os.path.getmtime(path), path))
+    for _, path in sorted(entries, reverse=True)[keep:]:
+        os.remove(path)
+
+
+def process_workbook_bytes(file_bytes, digest, progress=None):
+    """Processed frame for workbook bytes with content digest `digest`, via its snapshot."""
+    df = read_snapshot(digest)
+    if df is None:
+        df = process_workbook(BytesIO(file_bytes), progress=progress)
+        write_snapshot(df, digest)
+    return df
+
+
+def load_workbook_file(path):
+    """Processed frame for the workbook at `path`, tagged with its digest in `attrs`."""
+    with open(path, 'rb') as f:
+        file_bytes = f.read()
+    digest = workbook_digest(file_bytes)
+    df = process_workbook_bytes(file_bytes, digest)
+    df.attrs['digest'] = digest
+    return df
+
+
+def _missing_text_columns(df, columns=None):
+    return [c for c in TEXT_COLUMNS if c not in df.columns and (columns is None or c in columns)]
+
+
+def _join_text_columns(df, text, names):
+    """`df` with the `text` columns put back in snapshot column order (`names`)."""
+    order = [c for c in names if c in df.columns or c in text.columns]
+    full = pd.concat([df, text], axis=1)[order + [c for c in df.columns if c not in names]]
+    full.attrs = dict(df.attrs)
+    return full
+
+
+def with_text_columns(df, digest, columns=None):
+    """`df` (a lean frame or rows of one) with its TEXT_COLUMNS read back from the snapshot of `digest`.
+
+    Only the text columns (or those of them in `columns`) are read, and only the rows
+    of `df` are kept. Raises FileNotFoundError when text columns are missing and there
+    is no snapshot to read them from.
+    """
+    path = snapshot_path(digest)
+    missing = _missing_text_columns(df, columns)
+    if not missing:
+        return df
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No snapshot for {digest} to read {len(missing)} text columns back from")
+    names = pq.read_schema(path).names
+    text = pd.read_parquet(path, columns=[c for c in missing if c in names])
+    text = text.iloc[df.index.to_numpy()].set_axis(df.index)
+    return _join_text_columns(df, text, names)
+
+
+def text_column_chunks(df, digest, chunk_rows, columns=None):
+    """`df` in chunks of `chunk_rows` rows, each with its TEXT_COLUMNS read back from the snapshot of `digest`.
+
+    Returns (column order, {text column: arrow field}, chunk iterator). As
+    with_text_columns, but each chunk only reads the snapshot row groups its rows
+    fall in, so memory follows the chunk rather than the dataset.
+    """
+    chunks = (df.iloc[start:start + chunk_rows] for start in range(0, max(len(df), 1), chunk_rows))
+    missing = _missing_text_columns(df, columns)
+    if not missing:
+        return list(df.columns), {}, chunks
+    path = snapshot_path(digest)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No snapshot for {digest} to read {len(missing)} text columns back from")
+    snapshot = pq.ParquetFile(path)
+    schema = snapshot.schema_arrow
+    read = [c for c in missing if c in schema.names]
+    fields = {c: schema.field(c) for c in read}
+    # First row of each row group, and one past the last row
+    bounds = np.cumsum([0] + [snapshot.metadata.row_group(i).num_rows for i in range(snapshot.num_row_groups)])
+
+    def with_text(chunk):
+        positions = chunk.index.to_numpy()
+        if len(positions) == 0:
+            text = pd.DataFrame({c: pd.Series(dtype=object) for c in read}, index=chunk.index)
+        else:
+            first, last = np.searchsorted(bounds, [positions.min(), positions.max()], side='right') - 1
+            # Rows are picked in Arrow, so only the chunk's own rows become Python objects
+            text = (snapshot.read_row_groups(range(first, last + 1), columns=read)
+                    .take(positions - bounds[first]).to_pandas().set_axis(chunk.index))
+        return _join_text_columns(chunk, text, schema.names)
+
+    order = [c for c in schema.names if c in df.columns or c in fields] + [c for c in df.columns
+                                                                           if c not in schema.names]
+    return order, fields, (with_text(chunk) for chunk in chunks)
+
+
+def append_new_cases(base_df, delta_df):
+    """Append the cases of `delta_df` whose ticket number is not already in `base_df`.
+
+    Tickets repeated within the delta keep their first row; rows without a ticket
+    number are always appended. Returns (merged frame, appended count, skipped count).
+    """
+    tickets = delta_df[TICKET_COLUMN].astype(str).where(delta_df[TICKET_COLUMN].notna())
+    known = set(base_df[TICKET_COLUMN].dropna().astype(str))
+    fresh = tickets.isna() | (~tickets.isin(known) & ~tickets.duplicated())
+    new_rows = delta_df[fresh.to_numpy()]
+    merged = finalize_frame(pd.concat([base_df, new_rows], ignore_index=True))
+    return merged, len(new_rows), len(delta_df) - len(new_rows)
+
+
+# ============================================================================
+# REPORT DIRECTORIES - one dataset from every monthly workbook in a folder
+# ============================================================================
+def report_files(directory):
+    """The .xlsx workbooks in `directory` by name, skipping Excel lock files."""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith('.xlsx') and not name.startswith('~$'))
+
+
+def _ingest_report(path, digest, snapshot_dir):
+    """Process one workbook into its snapshot; runs in a pool worker.
+
+    The frame is only sent back when the snapshot could not be written.
+    """
+    global SNAPSHOT_DIR
+    SNAPSHOT_DIR = snapshot_dir
+    df = process_workbook(path)
+    write_snapshot(df, digest, 'report')
+    return None if os.path.exists(snapshot_path(digest, 'report')) else df
+
+
+def load_report_directory(directory, workers=INGEST_WORKERS):
+    """All workbooks in `directory` as one processed frame, with SOURCE_COLUMN naming each row's file.
+
+    Every workbook is snapshotted on its own by content hash, so adding a month
+    parses only the new file; workbooks without a snapshot are parsed in a process
+    pool with `workers` processes (default: one per core). The merged frame is
+    snapshotted too and tagged with a digest of the file names and contents.
+    """
+    paths = report_files(directory)
+    if not paths:
+        raise ValueError(f"No .xlsx reports in {directory}")
+    digests = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            digests[path] = workbook_digest(f.read())
+    digest = workbook_digest('\n'.join(f"{os.path.basename(p)}:{digests[p]}" for p in paths).encode())
+    merged = read_snapshot(digest)
+    if merged is not None:
+        merged.attrs['digest'] = digest
+        return merged
+
+    t0 = time.perf_counter()
+    todo = [p for p in paths if not os.path.exists(snapshot_path(digests[p], 'report'))]
+    workers = min(len(todo), workers or os.cpu_count() or 1)
+    if workers > 1:
+        # Spawned workers import only this module, not the (threaded) Streamlit server
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            fresh = dict(zip(todo, pool.map(_ingest_report, todo, [digests[p] for p in todo],
+                                                   [SNAPSHOT_DIR] * len(todo))))
+    else:
+        fresh = {p: _ingest_report(p, digests[p], SNAPSHOT_DIR) for p in todo}
+
+    frames = []
+    for path in paths:
+        df = fresh.get(path)
+        if df is None:
+            df = read_snapshot(digests[path], 'report')
+        if df is None:
+            df = process_workbook(path)
+        frames.append(df.assign(**{SOURCE_COLUMN: os.path.basename(path)}))
+    merged = finalize_frame(pd.concat(frames, ignore_index=True))
+    merged[SOURCE_COLUMN] = merged[SOURCE_COLUMN].astype('category')
+    logger.info("Report directory %s: %d workbooks (%d parsed, %d workers) -> %d rows in %.2fs",
+                directory, len(paths), len(todo), workers, len(merged), time.perf_counter() - t0)
+    write_snapshot(merged, digest)
+    merged.attrs['digest'] = digest
+    return merged
+
+
+# ============================================================================
+# FILTER INDEX - sorted row ids per filter value, built once per dataset
+# ============================================================================
+# Sidebar filter columns and how their values are labelled in the multiselects
+FILTER_DIMENSIONS = {
+    'Year': int, 'Month': int, '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23': str, 'LOB': str,
+    '\u0e23\u0e2b\u0e31\u0e2a\u0e42\u0e04\u0e23\u0e07\u0e01\u0e32\u0e23': str, '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14': str, '\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16': str, '\u0e23\u0e38\u0e48\u0e19\u0e23\u0e16': str,
+}
+
+
+def build_filter_index(df, cooccurrence=False):
+    """Group row ids by filter label for each sidebar dimension present in `df`.
+
+    Each dimension stores the row ids sorted by value (`rows`), the slice bounds of
+    each value (`offsets`, slot 0 holds rows with a missing value) and the label of
+    each slot, so a selection is turned into a mask without touching the column.
+    With `cooccurrence`, `pairs` also records which slots of every two dimensions
+    occur on the same row, for cascaded_options.
+    """
+    dims, slot_codes = {}, {}
+    for col, label in FILTER_DIMENSIONS.items():
+        if col not in df.columns:
+            continue
+        raw_codes, uniques = pd.factorize(df[col])
+        # Distinct raw values that render to the same label share one slot
+        label_codes, labels = pd.factorize(pd.Index([label(u) for u in uniques], dtype=object))
+        codes = np.append(label_codes, -1)[raw_codes] + 1
+        dims[col] = dict(
+            rows=np.argsort(codes, kind='stable').astype(np.int32),
+            offsets=np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(labels) + 1))]),
+            slots={v: k + 1 for k, v in enumerate(labels)},
+            options=sorted(labels),
+        )
+        slot_codes[col] = codes
+    index = dict(n_rows=len(df), dims=dims)
+    if cooccurrence:
+        index['pairs'] = {}
+        for a, b in itertools.combinations(dims, 2):
+            seen = np.zeros((len(dims[a]['slots']) + 1, len(dims[b]['slots']) + 1), dtype=bool)
+            seen[slot_codes[a], slot_codes[b]] = True
+            index['pairs'][(a, b)] = seen
+    return index
+
+
+def filter_options(index, col):
+    dim = index['dims'].get(col)
+    return list(dim['options']) if dim else []
+
+
+def cascaded_options(index, selections):
+    """Options of each dimension that occur with the narrowing selections on the other dimensions.
+
+    Answered from the co-occurrence pairs of an index built with `cooccurrence`, so
+    no rows are scanned. The check is pairwise: a value stays when it occurs with
+    some selected value of every other narrowing dimension.
+    """
+    dims, pairs = index['dims'], index['pairs']
+    picked = {col: [dims[col]['slots'][v] for v in selected if v in dims[col]['slots']]
+              for col, selected in selections.items()
+              if col in dims and len(selected) < len(dims[col]['options'])}
+    options = {}
+    for col, dim in dims.items():
+        allowed = np.ones(len(dim['slots']) + 1, dtype=bool)
+        for other, slots in picked.items():
+            if other != col:
+                seen = pairs[(col, other)] if (col, other) in pairs else pairs[(other, col)].T
+                allowed &= seen[:, slots].any(axis=1)
+        options[col] = [v for v in dim['options'] if allowed[dim['slots'][v]]]
+    return options
+
+
+def filter_mask(index, selections):
+    """Row mask for {column: selected labels}, or None when no filter narrows the data.
+
+    Dimensions with every option selected are skipped. Otherwise the selected slots
+    (or, when most options are selected, the unselected and missing slots) are
+    scattered into a boolean array, so the cost follows the rows touched, not a
+    string conversion of the column.
+    """
+    mask = None
+    for col, selected in selections.items():
+        dim = index['dims'].get(col)
+        if dim is None or len(selected) >= len(dim['options']):
+            continue
+        picked = {dim['slots'][v] for v in selected if v in dim['slots']}
+        rows, offsets = dim['rows'], dim['offsets']
+        if len(picked) * 2 <= len(dim['slots']):
+            dim_mask = np.zeros(index['n_rows'], dtype=bool)
+            slots, hit = picked, True
+        else:
+            dim_mask = np.ones(index['n_rows'], dtype=bool)
+            slots, hit = [k for k in range(len(offsets) - 1) if k not in picked], False
+        for k in slots:
+            dim_mask[rows[offsets[k]:offsets[k + 1]]] = hit
+        mask = dim_mask if mask is None else mask & dim_mask
+    return mask
+
+
+def filter_signature(index, selections):
+    """Hashable form of the selections that actually narrow the data."""
+    return tuple((col, tuple(sorted(map(str, selected)))) for col, selected in selections.items()
+                 if col in index['dims'] and len(selected) < len(index['dims'][col]['options']))
+
+
+# ============================================================================
+# AGGREGATE CUBE - case count and value measures per dimension combination
+# ============================================================================
+CUBE_DIMENSIONS = ['Year', 'Month', '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', 'LOB', '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14', '\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16',
+                   '\u0e23\u0e38\u0e48\u0e19\u0e23\u0e16', 'Policy Type', '\u0e23\u0e2b\u0e31\u0e2a\u0e42\u0e04\u0e23\u0e07\u0e01\u0e32\u0e23', '\u0e41\u0e1c\u0e19\u0e01']
+CUBE_VALUES = ['Fee (Baht)', '\u0e25\u0e39\u0e01\u0e04\u0e49\u0e32\u0e08\u0e48\u0e32\u0e22\u0e2a\u0e48\u0e27\u0e19\u0e15\u0e48\u0e32\u0e07']
+CUBE_STATS = ('sum', 'sumsq', 'n', 'min', 'max')
+
+
+def cube_measure(col, stat):
+    return f"{col} [{stat}]"
+
+
+def cube_aggregations(columns):
+    """How each cube measure present in `columns` rolls up across rows."""
+    funcs = {'sum': 'sum', 'sumsq': 'sum', 'n': 'sum', 'min': 'min', 'max': 'max'}
+    aggs = {'cases': 'sum'}
+    for col in CUBE_VALUES:
+        for stat in CUBE_STATS:
+            if cube_measure(col, stat) in columns:
+                aggs[cube_measure(col, stat)] = funcs[stat]
+    return aggs
+
+
+def aggregate_cube(df):
+    """Collapse `df` to one row per distinct combination of the cube dimensions.
+
+    Each row holds the number of cases plus, for every value column, the sum, sum of
+    squares, non-null count, min and max. KPIs, charts and most pivots aggregate
+    these rows instead of the cases themselves.
+    """
+    dims = [c for c in CUBE_DIMENSIONS if c in df.columns]
+    frame = {c: df[c] for c in dims}
+    frame['cases'] = np.ones(len(df), dtype=np.int64)
+    for col in CUBE_VALUES:
+        if col not in df.columns:
+            continue
+        values = numeric_values(df[col])
+        for stat, series in [('sum', values), ('sumsq', values ** 2), ('n', values.notna().astype(np.int64)),
+                             ('min', values), ('max', values)]:
+            frame[cube_measure(col, stat)] = series
+    frame = pd.DataFrame(frame)
+    return (frame.groupby(dims, dropna=False, observed=True, sort=False)
+            .agg(cube_aggregations(frame.columns))
+            .reset_index())
+
+
+def merge_cubes(base, delta):
+    """Roll two cubes over the same dimensions into one, as if built from both row sets."""
+    dims = [c for c in base.columns if c in CUBE_DIMENSIONS]
+    # Same dtype rules as the appended dataset, so a dimension typed differently in the
+    # two reports collapses to the same keys
+    combined = finalize_frame(pd.concat([base, delta], ignore_index=True))
+    return (combined.groupby(dims, dropna=False, observed=True, sort=False)
+            .agg(cube_aggregations(combined.columns))
+            .reset_index())
+
+
+def build_cube(df, dataset_key):
+    """Cube for the dataset `dataset_key`, from its snapshot when one was written."""
+    cube = read_snapshot(dataset_key, 'cube') if dataset_key else None
+    if cube is None:
+        cube = aggregate_cube(df)
+        if dataset_key:
+            write_snapshot(cube, dataset_key, 'cube')
+    logger.info("Cube: %d rows collapsed to %d combinations", len(df), len(cube))
+    return cube
+
+
+def pivot_labels(series):
+    """Pivot field values as text, with every kind of missing value shown as '(blank)'."""
+    return series.astype(str).where(series.notna(), '(blank)')
+
+
+PIVOT_ROLLUPS = {'cases': 'sum', '_sum': 'sum', '_min': 'min', '_max': 'max'}
+
+
+def pivot_base(cube, keys, value):
+    """Group `cube` once by the pivot fields into the measures every aggregation needs.
+
+    `value` is 'Case Count' or a CUBE_VALUES column; missing values count as 0, as in
+    the raw pivot, so min/max fold a 0 into combinations with missing values.
+    """
+    src = cube[keys + ['cases']].assign(**{k: pivot_labels(cube[k]) for k in keys})
+    if value != 'Case Count':
+        complete = cube[cube_measure(value, 'n')] == cube['cases']
+        src = src.assign(
+            _sum=cube[cube_measure(value, 'sum')],
+            _min=cube[cube_measure(value, 'min')].where(complete, np.fmin(cube[cube_measure(value, 'min')], 0)),
+            _max=cube[cube_measure(value, 'max')].where(complete, np.fmax(cube[cube_measure(value, 'max')], 0)),
+        )
+    return src.groupby(keys).agg({c: f for c, f in PIVOT_ROLLUPS.items() if c in src.columns})
+
+
+def pivot_measure(frame, value, agg):
+    if agg == 'count' or (agg == 'sum' and value == 'Case Count'):
+        return frame['cases']
+    if value == 'Case Count':
+        return (frame['cases'] > 0).astype(float if agg == 'mean' else int)
+    if agg == 'mean':
+        return (frame['_sum'] / frame['cases'].replace(0, np.nan)).fillna(0.0)
+    return frame[{'sum': '_sum', 'min': '_min', 'max': '_max'}[agg]]
+
+
+def pivot_rollup(base, levels, value, agg):
+    """`agg` of `value` per combination of the `levels` of a pivot_base aggregate (all of it when empty)."""
+    rollups = {c: f for c, f in PIVOT_ROLLUPS.items() if c in base.columns}
+    if levels:
+        return pivot_measure(base.groupby(level=levels).agg(rollups), value, agg)
+    return pivot_measure(base.groupby(np.zeros(len(base))).agg(rollups), value, agg)
+
+
+def pivot_from_base(base, index, columns, value, agg):
+    """Lay out pd.pivot_table(margins=True) from a pivot_base aggregate.
+
+    The Grand Total row, column and corner are rolled up from `base`, not from a
+    second pass over the rows.
+    """
+    name = '_count' if value == 'Case Count' else value
+
+    def rollup(levels):
+        return pivot_rollup(base, levels, value, agg)
+
+    def total_key(n_levels):
+        return 'Grand Total' if n_levels == 1 else ('Grand Total',) + ('',) * (n_levels - 1)
+
+    def with_total_row(body, totals):
+        key = total_key(body.index.nlevels)
+        row_index = (pd.MultiIndex.from_tuples([key], names=body.index.names) if body.index.nlevels > 1
+                     else pd.Index([key], name=body.index.name))
+        return pd.concat([body, pd.DataFrame([totals], columns=body.columns, index=row_index)])
+
+    cells = pivot_measure(base, value, agg)
+    grand = rollup([]).sum()
+    if index and columns:
+        body = cells.unstack(level=columns, fill_value=0).sort_index(axis=1)
+        col_totals = rollup(columns).reindex(body.columns, fill_value=0).tolist()
+        body[total_key(len(columns))] = rollup(index)
+        return with_total_row(body, col_totals + [grand])
+    if index:
+        return with_total_row(cells.to_frame(name), [grand])
+    table = cells.to_frame(name).T
+    table[total_key(len(columns))] = grand
+    return table
+
+
+def raw_pivot_table(cases, index, columns, value, agg):
+    """pd.pivot_table(margins=True) over the filtered cases, for aggregations the cube cannot answer."""
+    if value == 'Case Count':
+        src, val_col = cases.assign(_count=1), '_count'
+    else:
+        src, val_col = cases, value
+    src = src.assign(**{col: pivot_labels(src[col]) for col in set(index + columns)})
+    if val_col != '_count':
+        src = src.assign(**{val_col: numeric_values(src[val_col]).fillna(0)})
+    kwargs = dict(data=src, values=val_col, aggfunc=agg, fill_value=0, margins=True, margins_name='Grand Total')
+    if not index:
+        # pivot_table interleaves a margin after every column when there are no row
+        # fields, so lay the fields out as rows and transpose
+        return pd.pivot_table(index=columns, **kwargs).T
+    kwargs['index'] = index
+    if columns:
+        kwargs['columns'] = columns
+    return pd.pivot_table(**kwargs)
+
+
+def _lru_state():
+    return dict(entries=OrderedDict(), hits=0, misses=0, lock=threading.Lock())
+
+
+_PIVOT_CACHE = _lru_state()
+_CHART_CACHE = _lru_state()
+
+
+def pivot_cache():
+    """Process-wide LRU of pivot aggregates and tables, with hit/miss counters."""
+    return _PIVOT_CACHE
+
+
+def chart_cache():
+    """Process-wide LRU of chart aggregates per dataset and filter signature, with hit/miss counters."""
+    return _CHART_CACHE
+
+
+def lru_cached(cache, key, build, max_entries):
+    """Return a copy of the cached value for `key`, building and storing it on a miss."""
+    with cache['lock']:
+        if key in cache['entries']:
+            cache['entries'].move_to_end(key)
+            cache['hits'] += 1
+            return cache['entries'][key].copy()
+    result = build()
+    with cache['lock']:
+        cache['misses'] += 1
+        cache['entries'][key] = result
+        while len(cache['entries']) > max_entries:
+            cache['entries'].popitem(last=False)
+    return result.copy()
+
+
+def cached_pivot(key, build):
+    return lru_cached(pivot_cache(), key, build, PIVOT_CACHE_SIZE)
+
+
+def cube_pivot_table(cube, index, columns, value, agg, cache_key=None):
+    """pd.pivot_table(margins=True) over the cases, answered from `cube`.
+
+    `agg` is one of count, sum, mean, min, max. With a `cache_key` (dataset, filter
+    signature, fields, value) the grouped aggregate is shared by every aggregation
+    of the same layout and each finished table is kept too.
+    """
+    if set(index) & set(columns):
+        raise ValueError("A field cannot be both a pivot row and a pivot column")
+    keys = index + columns
+    if cache_key is None:
+        return pivot_from_base(pivot_base(cube, keys, value), index, columns, value, agg)
+    return cached_pivot(('table',) + cache_key + (agg,), lambda: pivot_from_base(
+        cached_pivot(('base',) + cache_key, lambda: pivot_base(cube, keys, value)), index, columns, value, agg))
+
+
+# ============================================================================
+# PIVOT LAYOUT - flat table as shown on the dashboard and exported to CSV
+# ============================================================================
+PIVOT_AGGREGATIONS = {'Count': 'count', 'Sum': 'sum', 'Mean': 'mean', 'Median': 'median', 'Min': 'min', 'Max': 'max'}
+PERCENT_AGGREGATIONS = ('% of Row Total', '% of Column Total', '% of Grand Total')
+# Sums accumulated, or differenced, along the value columns (down the rows without column fields)
+RUNNING_AGGREGATIONS = ('Running Total', 'Difference from Previous')
+
+
+def _pivot_column_order(x):
+    x_str = str(x)
+    if x_str.isdigit():
+        return (0, int(x_str))
+    m = re.match(r'^(\d+)', x_str)
+    return (0, int(m.group(1))) if m else (1, x_str)
+
+
+def show_values_as(matrix, agg, has_total_row, has_total_col):
+    """Apply a PERCENT_AGGREGATIONS or RUNNING_AGGREGATIONS label to a pivot of sums.
+
+    `matrix` holds the value cells with the Grand Total row last (when there are row
+    fields) and the Grand Total column last (when there are column fields). Without
+    one of them the lone row or column is its own total, so the totals of any cell
+    are always the last entry of its row and column.
+    """
+    if agg in PERCENT_AGGREGATIONS:
+        totals = {'% of Row Total': matrix[:, -1:], '% of Column Total': matrix[-1:, :],
+                  '% of Grand Total': matrix[-1:, -1:]}[agg]
+        share = np.divide(matrix, totals, out=np.zeros_like(matrix), where=totals != 0)
+        return share * 100
+
+    result = matrix.copy()
+    if has_total_col or not has_total_row:
+        # Along the value columns; every row, Grand Total included, and not the total column
+        body = result[:, :-1] if has_total_col else result
+        axis = 1
+    else:
+        # Down the rows, leaving the Grand Total row as it is
+        body = result[:-1, :]
+        axis = 0
+    if agg == 'Running Total':
+        body[...] = np.cumsum(body, axis=axis)
+    else:
+        body[...] = np.diff(body, axis=axis, prepend=np.nan)
+    return result
+
+
+def build_pivot(cube, cases, rows, columns, value, agg, cache_key=None):
+    """Flat pivot of `value` by `rows` x `columns` for an aggregation label such as 'Count'.
+
+    Row fields become leading columns, value columns are ordered numerically where
+    possible and the Grand Total row and column are kept. Percentage and running
+    labels are computed from sums. Medians come from the filtered `cases`,
+    everything else from the filtered `cube`.
+    """
+    is_derived = agg in PERCENT_AGGREGATIONS or agg in RUNNING_AGGREGATIONS
+    base_agg = 'Sum' if is_derived else agg
+    agg_func = PIVOT_AGGREGATIONS[base_agg]
+
+    if base_agg != 'Median':
+        pivot_result = cube_pivot_table(cube, rows, columns, value, agg_func, cache_key=cache_key)
+    elif cache_key is None:
+        pivot_result = raw_pivot_table(cases, rows, columns, value, agg_func)
+    else:
+        # Medians are not decomposable, so they still come from the filtered cases
+        pivot_result = cached_pivot(('table',) + cache_key + (agg_func,), lambda: raw_pivot_table(
+            cases, rows, columns, value, agg_func))
+
+    # The margins are always last: the Grand Total column when there are column
+    # fields, the Grand Total row when there are row fields
+    has_total_col, has_total_row = bool(columns), bool(rows)
+
+    # Flatten multi-level columns
+    if isinstance(pivot_result.columns, pd.MultiIndex):
+        pivot_result.columns = [' | '.join(str(c) for c in col).strip(' | ') for col in pivot_result.columns[:-1]] + [
+            'Grand Total' if has_total_col else ' | '.join(str(c) for c in pivot_result.columns[-1]).strip(' | ')]
+
+    # Sort columns
+    cols = list(pivot_result.columns)
+    gt_col = cols[-1] if has_total_col else None
+    non_gt_cols = cols[:-1] if has_total_col else cols
+    try:
+        sorted_cols = sorted(non_gt_cols, key=_pivot_column_order)
+    except Exception:
+        sorted_cols = non_gt_cols
+    if has_total_col:
+        sorted_cols.append(gt_col)
+    pivot_result = pivot_result[sorted_cols]
+
+    # Reset index
+    if isinstance(pivot_result.index, pd.MultiIndex) or pivot_result.index.name:
+        pivot_result = pivot_result.reset_index()
+
+    if is_derived:
+        value_cols = [c for c in pivot_result.columns if c not in rows]
+        matrix = show_values_as(pivot_result[value_cols].to_numpy(dtype=float), agg, has_total_row, has_total_col)
+        pivot_result[value_cols] = pd.DataFrame(matrix, index=pivot_result.index, columns=value_cols)
+
+    if agg in ('Sum', 'Count') or (agg == 'Running Total' and value == 'Case Count'):
+        for col in pivot_result.select_dtypes(include=['float64', 'float32']).columns:
+            pivot_result[col] = pivot_result[col].astype(int)
+    return pivot_result
+
+
+def _column_order_ranks(labels):
+    """Position of each label in _pivot_column_order, ranking the distinct labels only."""
+    ranks = {label: i for i, label in enumerate(sorted(labels.unique(), key=_pivot_column_order))}
+    return labels.map(ranks)
+
+
+def _sparse_median_parts(cases, rows, columns, value):
+    """Medians per occupied cell, per row key, per column key and overall, from the filtered cases."""
+    keys = rows + columns
+    values = 1 if value == 'Case Count' else numeric_values(cases[value]).fillna(0)
+    src = cases[keys].assign(**{k: pivot_labels(cases[k]) for k in keys}, _value=values)
+    return (src.groupby(keys)['_value'].median(), src.groupby(rows)['_value'].median(),
+            src.groupby(columns)['_value'].median(), float(src['_value'].median()))
+
+
+def _sparse_pivot(cube, cases, rows, columns, value, agg, base=None):
+    is_pct_agg = agg in PERCENT_AGGREGATIONS
+    agg_func = PIVOT_AGGREGATIONS['Sum' if is_pct_agg else agg]
+    if agg_func == 'median':
+        cells, row_totals, col_totals, grand = _sparse_median_parts(cases, rows, columns, value)
+    else:
+        base = pivot_base(cube, rows + columns, value) if base is None else base
+        cells = pivot_measure(base, value, agg_func)
+        row_totals = pivot_rollup(base, rows, value, agg_func)
+        col_totals = pivot_rollup(base, columns, value, agg_func)
+        grand = float(pivot_rollup(base, [], value, agg_func).sum())
+
+    sections = [cells, row_totals, col_totals, pd.Series([grand])]
+    if is_pct_agg:
+        # Same bases as show_values_as on the grid: the row total, column total or
+        # grand total of each entry, margins included
+        cell_rows = row_totals.reindex(cells.index.droplevel(columns)).to_numpy(dtype=float)
+        cell_cols = col_totals.reindex(cells.index.droplevel(rows)).to_numpy(dtype=float)
+        bases = {'% of Row Total': (cell_rows, row_totals.to_numpy(dtype=float), grand, grand),
+                     '% of Column Total': (cell_cols, grand, col_totals.to_numpy(dtype=float), grand),
+                     '% of Grand Total': (grand, grand, grand, grand)}[agg]
+        for i, (section, totals) in enumerate(zip(sections, bases)):
+            numbers = section.to_numpy(dtype=float)
+            totals = np.broadcast_to(totals, numbers.shape)
+            sections[i] = pd.Series(np.divide(numbers, totals, out=np.zeros_like(numbers), where=totals != 0) * 100,
+                                    index=section.index)
+
+    keys = rows + columns
+    frames = []
+    for section, fields in zip(sections, (keys, rows, columns, [])):
+        frame = section.rename(value).reset_index() if fields else section.rename(value).to_frame()
+        frames.append(frame.assign(**{k: 'Grand Total' for k in keys if k not in fields})[keys + [value]])
+    # Cells in grid order: row keys as grouped, column keys numerically where possible
+    frames[0] = frames[0].sort_values(keys, kind='stable', key=lambda s: _column_order_ranks(s) if s.name in columns else s)
+    frames[2] = frames[2].sort_values(columns, kind='stable', key=_column_order_ranks)
+    result = pd.concat(frames, ignore_index=True)
+    # Each key repeats across many cells; as categories the frame stays close to the size of its values
+    result = result.astype({k: 'category' for k in keys})
+    if agg in ('Sum', 'Count'):
+        result[value] = result[value].astype(int)
+    result.attrs.update(cells=len(cells), row_keys=len(row_totals), column_keys=len(col_totals))
+    return result
+
+
+def build_sparse_pivot(cube, cases, rows, columns, value, agg, cache_key=None):
+    """Long-format pivot: one row per occupied (row key, column key) cell, then the margins.
+
+    Takes the labels of build_pivot except RUNNING_AGGREGATIONS. Combinations without
+    cases are left out instead of being filled with 0, so time and memory follow the
+    occupied cells rather than the row x column grid. The first attrs['cells'] rows
+    are the cells; the row totals (column fields 'Grand Total'), column totals (row
+    fields 'Grand Total') and grand total follow. attrs['row_keys'] and
+    attrs['column_keys'] give the size of the grid the same pivot would lay out.
+    """
+    if not (rows and columns):
+        raise ValueError("A sparse pivot needs both row and column fields")
+    if set(rows) & set(columns):
+        raise ValueError("A field cannot be both a pivot row and a pivot column")
+    if agg in RUNNING_AGGREGATIONS:
+        raise ValueError(f"'{agg}' needs the grid layout")
+    if cache_key is None:
+        return _sparse_pivot(cube, cases, rows, columns, value, agg)
+    keys = rows + columns
+    return cached_pivot(('sparse',) + cache_key + (agg,), lambda: _sparse_pivot(
+        cube, cases, rows, columns, value, agg,
+        base=None if agg == 'Median' else cached_pivot(('base',) + cache_key, lambda: pivot_base(cube, keys, value))))
+
+
+# ============================================================================
+# DISTINCT COUNTS - HyperLogLog sketches of policies, vehicles and customers per
+# (Year, Month, LOB, province) cell; any selection of cells merges into one count
+# ============================================================================
+SKETCH_DIMENSIONS = ['Year', 'Month', 'LOB', '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14']
+# Count -> column whose distinct values it counts
+SKETCH_FIELDS = {'policies': 'Policy No.', 'vehicles': '\u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16', 'customers': '\u0e40\u0e1a\u0e2d\u0e23\u0e4c\u0e42\u0e17\u0e23\u0e28\u0e31\u0e1e\u0e17\u0e4c'}
+# 2**SKETCH_PRECISION one-byte registers per cell and count; standard error about
+# 1.04 / sqrt(2**SKETCH_PRECISION), 3.3% at 10
+SKETCH_PRECISION = 10
+# Snapshot kind; a new precision writes (and reads) snapshots of its own
+SKETCH_KIND = f'sketch_p{SKETCH_PRECISION}'
+# Breakdown -> the dimensions its rows are keyed by
+DISTINCT_BREAKDOWNS = {'month': ['Year', 'Month'], 'lob': ['LOB'], 'province': ['\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14']}
+
+
+def distinct_keys(series, name):
+    """`series` as comparable keys: upper case without spaces or dashes, missing when empty.
+
+    Phone numbers keep their digits only, with a +66 or leading 0 trunk prefix dropped.
+    Each distinct value is normalized once.
+    """
+    codes, uniques = pd.factorize(series)
+    keys = pd.Series(uniques, dtype=object).astype('string').str.upper().str.replace(r'[\s\-]', '', regex=True)
+    if name == 'customers':
+        keys = keys.str.replace(r'\D', '', regex=True).str.replace(r'^(?:66|0)(?=\d{9}$)', '', regex=True)
+    keys = keys.mask(keys == '')
+    return pd.Series(keys.array.take(codes, allow_fill=True), index=series.index)
+
+
+def _bit_length(values):
+    """Bit length of each uint64 in `values`."""
+    values, length = values.copy(), np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = values >> np.uint64(shift) > 0
+        values[big] >>= np.uint64(shift)
+        length[big] += shift
+    return length + (values > 0)
+
+
+def sketch_registers(cell_ids, n_cells, keys, precision=SKETCH_PRECISION):
+    """HyperLogLog registers (n_cells x 2**precision, uint8) of the `keys` in each cell.
+
+    A key's 64-bit hash picks a register with its top `precision` bits and offers the
+    position of the first set bit in the rest; each register keeps the highest offer.
+    """
+    present = keys.notna().to_numpy()
+    hashes = pd.util.hash_array(keys[present].to_numpy(dtype=object))
+    width = 64 - precision
+    slot = (hashes >> np.uint64(width)).astype(np.int64)
+    rank = width + 1 - _bit_length(hashes & np.uint64((1 << width) - 1))
+    registers = np.zeros(n_cells << precision, dtype=np.uint8)
+    np.maximum.at(registers, (cell_ids[present] << precision) + slot, rank.astype(np.uint8))
+    return registers.reshape(n_cells, 1 << precision)
+
+
+def hll_estimate(registers):
+    """Distinct count estimated from each row of `registers`, with linear counting for small ones."""
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.exp2(-registers.astype(np.float64)).sum(axis=-1)
+    zeros = (registers == 0).sum(axis=-1)
+    small = (raw <= 2.5 * m) & (zeros > 0)
+    return np.where(small, m * np.log(m / np.maximum(zeros, 1)), raw)
+
+
+def _fold_registers(cell_ids, n_cells, registers):
+    """Merge rows of `registers` into `n_cells` sketches: a register-wise max per target cell."""
+    merged = np.zeros((n_cells, registers.shape[1]), dtype=np.uint8)
+    if len(cell_ids):
+        order = np.argsort(cell_ids, kind='stable')
+        starts = np.flatnonzero(np.diff(cell_ids[order], prepend=-1))
+        merged[cell_ids[order][starts]] = np.maximum.reduceat(registers[order], starts)
+    return merged
+
+
+def _sketch_groups(frame, dims, weights=None):
+    """Group id of each row of `frame` and the groups' keys with their case counts."""
+    groups = frame.groupby(dims, dropna=False, observed=True, sort=True)
+    cases = groups.size() if weights is None else groups[weights].sum()
+    return groups.ngroup().to_numpy(), cases.rename('cases').reset_index()
+
+
+def aggregate_sketches(df, precision=SKETCH_PRECISION):
+    """Case count and one sketch per SKETCH_FIELDS count for every combination of the sketch dimensions.
+
+    Counts whose column `df` lacks are left out.
+    """
+    dims = [c for c in SKETCH_DIMENSIONS if c in df.columns]
+    cell_ids, cells = _sketch_groups(df, dims)
+    registers = {name: sketch_registers(cell_ids, len(cells), distinct_keys(df[col], name), precision)
+                 for name, col in SKETCH_FIELDS.items() if col in df.columns}
+    return dict(cells=cells, registers=registers, precision=precision)
+
+
+def merge_sketches(base, delta):
+    """Sketches of two row sets over the same dimensions combined, as if built from both."""
+    dims = [c for c in base['cells'].columns if c in SKETCH_DIMENSIONS]
+    # Same dtype rules as the appended dataset, as in merge_cubes
+    combined = finalize_frame(pd.concat([base['cells'], delta['cells']], ignore_index=True))
+    cell_ids, cells = _sketch_groups(combined, dims, weights='cases')
+    registers = {name: _fold_registers(cell_ids, len(cells), np.concatenate([regs, delta['registers'][name]]))
+                 for name, regs in base['registers'].items() if name in delta['registers']}
+    return dict(cells=cells, registers=registers, precision=base['precision'])
+
+
+def build_sketches(df, dataset_key):
+    """Sketches for the dataset `dataset_key`, from their snapshot when one was written.
+
+    A lean `df` has its phone numbers read back from the dataset snapshot first.
+    """
+    frame = read_snapshot(dataset_key, SKETCH_KIND) if dataset_key else None
+    if frame is not None:
+        cells = frame.drop(columns=list(SKETCH_FIELDS), errors='ignore')
+        registers = {name: np.frombuffer(b''.join(frame[name]), dtype=np.uint8).reshape(
+            len(frame), 1 << SKETCH_PRECISION) for name in SKETCH_FIELDS if name in frame.columns}
+        return dict(cells=cells, registers=registers, precision=SKETCH_PRECISION)
+    if dataset_key:
+        df = with_text_columns(df, dataset_key, columns=list(SKETCH_FIELDS.values()))
+    sketches = aggregate_sketches(df)
+    if dataset_key:
+        write_sketches(sketches, dataset_key)
+    logger.info("Sketches: %d rows in %d cells", len(df), len(sketches['cells']))
+    return sketches
+
+
+def write_sketches(sketches, dataset_key):
+    """Snapshot `sketches` as their cells with one binary register column per count."""
+    write_snapshot(sketches['cells'].assign(**{name: [row.tobytes() for row in regs]
+                                               for name, regs in sketches['registers'].items()}),
+                   dataset_key, SKETCH_KIND)
+
+
+def _distinct_frame(groups, counts):
+    """`groups` (keys and cases) with the distinct counts and cases per policy."""
+    frame = groups.assign(**{name: counts.get(name) for name in SKETCH_FIELDS})
+    frame['cases_per_policy'] = frame['cases'] / frame['policies'].astype(float).replace(0, np.nan)
+    return frame
+
+
+def distinct_counts(sketches, mask=None, by=None):
+    """Estimated distinct policies, vehicles and customers of the cells in `mask`.
+
+    One row per combination of the `by` dimensions (a single row without them), with
+    the case count and cases per policy. Counts the sketches lack are missing.
+    """
+    cells = sketches['cells'] if mask is None else sketches['cells'][mask]
+    by = by or []
+    if by:
+        group_ids, groups = _sketch_groups(cells, by, weights='cases')
+    else:
+        group_ids, groups = np.zeros(len(cells), dtype=np.int64), pd.DataFrame({'cases': [cells['cases'].sum()]})
+    counts = {}
+    for name, regs in sketches['registers'].items():
+        regs = regs if mask is None else regs[mask]
+        estimate = np.rint(hll_estimate(_fold_registers(group_ids, len(groups), regs))).astype(np.int64)
+        # An estimate can overshoot; no group has more distinct values than cases
+        counts[name] = np.minimum(estimate, groups['cases'].to_numpy())
+    return _distinct_frame(groups, counts)
+
+
+def exact_distinct_counts(df, by=None):
+    """distinct_counts counted exactly from the cases, for selections the sketch cells cannot express."""
+    by = by or []
+    keys = pd.DataFrame({name: distinct_keys(df[col], name) for name, col in SKETCH_FIELDS.items()
+                         if col in df.columns}, index=df.index)
+    if by:
+        groups = keys.assign(**{c: df[c] for c in by}).groupby(by, dropna=False, observed=True, sort=True)
+        return _distinct_frame(groups.size().rename('cases').reset_index(),
+                               {name: groups[name].nunique().to_numpy() for name in keys.columns})
+    return _distinct_frame(pd.DataFrame({'cases': [len(df)]}),
+                           {name: [keys[name].nunique()] for name in keys.columns})
+
+
+# ============================================================================
+# KPIs & PORTFOLIO HEALTH
+# ============================================================================
+FEE_SUM, FEE_N = cube_measure('Fee (Baht)', 'sum'), cube_measure('Fee (Baht)', 'n')
+# KPI -> (current value, comparison value) used for its trend indicator
+KPI_TRENDS = {'cases': ('ytd_cases', 'prev_ytd_cases'), 'fee': ('ytd_fee', 'prev_ytd_fee'),
+              'avg': ('cur_avg', 'prev_avg'), 'mtd': ('mtd_fee', 'prev_mtd_fee')}
+
+
+def calc_trend(cur_val, prev_val):
+    if prev_val == 0:
+        return 0, "neutral"
+    pct = (cur_val - prev_val) / prev_val * 100
+    trend_type = "up" if pct > 0 else "down" if pct < 0 else "neutral"
+    return pct, trend_type
+
+
+def month_totals(cube):
+    """Cases, fee sum and fee count as dense Year x Month arrays, plus which months have cases.
+
+    This is everything the KPI cards and Portfolio Health read; build it once per
+    dataset and every KPI is an array lookup.
+    """
+    totals = cube.groupby(['Year', 'Month'])[['cases', FEE_SUM, FEE_N]].sum()
+    years = sorted(set(totals.index.get_level_values('Year').astype(int)))
+    y = np.searchsorted(years, totals.index.get_level_values('Year').astype(int))
+    m = totals.index.get_level_values('Month').astype(int) - 1
+    grid = dict(years=years)
+    for name, col in (('cases', 'cases'), ('fee', FEE_SUM), ('fee_n', FEE_N)):
+        grid[name] = np.zeros((len(years), 12))
+        grid[name][y, m] = totals[col].to_numpy(dtype=float)
+    grid['present'] = np.zeros((len(years), 12), dtype=bool)
+    grid['present'][y, m] = True
+    return grid
+
+
+def _year_totals(totals, year):
+    """(cases, fee, fee_n, present) month arrays for `year`; zeros when it has no cases."""
+    if year in totals['years']:
+        i = totals['years'].index(year)
+        return tuple(totals[name][i] for name in ('cases', 'fee', 'fee_n', 'present'))
+    return np.zeros(12), np.zeros(12), np.zeros(12), np.zeros(12, dtype=bool)
+
+
+def daily_totals(df):
+    """Running totals of cases, fee sum and fee count per calendar day, for KPIs as of any date.
+
+    The series covers 1 January of the first year to 31 December of the last; `cum_<name>[i]`
+    holds the total of the days before day i, so any period costs two lookups.
+    """
+    days = (pd.to_datetime(pd.DataFrame(dict(year=df['Year'], month=df['Month'], day=df['Day'])))
+            .to_numpy().astype('datetime64[D]'))
+    start = np.datetime64(f"{int(df['Year'].min())}-01-01")
+    n_days = int((np.datetime64(f"{int(df['Year'].max()) + 1}-01-01") - start).astype(int))
+    day_index = (days - start).astype(int)
+    fee = numeric_values(df['Fee (Baht)'])
+    daily = dict(start=start, end=start + n_days - 1, last_case=days.max() if len(days) else start)
+    for name, weights in (('cases', None), ('fee', fee.fillna(0).to_numpy()),
+                          ('fee_n', fee.notna().to_numpy(dtype=float))):
+        per_day = np.bincount(day_index, weights=weights, minlength=n_days)
+        daily[f'cum_{name}'] = np.concatenate([[0], np.cumsum(per_day)])
+    return daily
+
+
+def _period_total(daily, name, first, last):
+    """Total of measure `name` from day `first` through day `last` (inclusive), zero outside the series."""
+    n_days = len(daily[f'cum_{name}']) - 1
+    i = int(np.clip((np.datetime64(first, 'D') - daily['start']).astype(int), 0, n_days))
+    j = int(np.clip((np.datetime64(last, 'D') - daily['start']).astype(int) + 1, 0, n_days))
+    return daily[f'cum_{name}'][j] - daily[f'cum_{name}'][i] if j > i else 0
+
+
+def _kpi_document(current_year, current_month, months_in_year, cur, prev, mtd_fee, prev_mtd_fee, prev_avg=None):
+    """KPI dict from period totals; `cur`/`prev` are (cases, fee, fee_n) of the compared periods."""
+    mtd_fee = float(mtd_fee)
+    if prev_avg is None:
+        prev_avg = prev[1] / prev[2] if prev[2] > 0 else 0.0
+    kpis = dict(
+        current_year=int(current_year),
+        current_month=int(current_month),
+        months_in_year=int(months_in_year) or 1,
+        ytd_cases=int(cur[0]),
+        ytd_fee=float(cur[1]),
+        prev_ytd_cases=int(prev[0]),
+        prev_ytd_fee=float(prev[1]),
+        mtd_fee=mtd_fee,
+        mtd_util=(mtd_fee / MONTHLY_BUDGET * 100) if MONTHLY_BUDGET > 0 else 0,
+        prev_mtd_fee=float(prev_mtd_fee),
+        cur_avg=float(cur[1] / cur[2]) if cur[2] > 0 else 0.0,
+        prev_avg=float(prev_avg),
+    )
+    for name, (cur_key, prev_key) in KPI_TRENDS.items():
+        kpis[f'{name}_trend_pct'], kpis[f'{name}_trend'] = calc_trend(kpis[cur_key], kpis[prev_key])
+    return kpis
+
+
+def compute_kpis(totals, current_year, current_month):
+    """YTD and MTD cases and fees for `current_year`, against the same period a year earlier.
+
+    `totals` comes from month_totals. Each KPI_TRENDS entry adds `<name>_trend_pct`
+    and `<name>_trend` (up/down/neutral).
+    """
+    cur_cases, cur_fees, cur_fee_n, cur_present = _year_totals(totals, current_year)
+    prev_cases, prev_fees, prev_fee_n, _ = _year_totals(totals, current_year - 1)
+    month = current_month - 1
+    return _kpi_document(
+        current_year, current_month, cur_present.sum(),
+        cur=(cur_cases.sum(), cur_fees.sum(), cur_fee_n.sum()),
+        prev=(prev_cases[:month + 1].sum(), prev_fees[:month + 1].sum(), prev_fee_n[:month + 1].sum()),
+        mtd_fee=cur_fees[month], prev_mtd_fee=prev_fees[month],
+        # The average compares with the whole previous year
+        prev_avg=prev_fees.sum() / prev_fee_n.sum() if prev_fee_n.sum() > 0 else 0.0)
+
+
+def compute_kpis_as_of(daily, as_of):
+    """compute_kpis as it stood at the end of day `as_of`, from a daily_totals series.
+
+    YTD and MTD run to `as_of` and are compared with the same dates a year earlier
+    (28 February stands in for 29 February); the average fee compares those two YTD
+    periods. The run rate divides by the months up to `as_of` that have cases.
+    """
+    as_of = pd.Timestamp(as_of).normalize()
+    prev_as_of = as_of - pd.DateOffset(years=1)
+    periods = dict(ytd=(as_of.replace(month=1, day=1), as_of), mtd=(as_of.replace(day=1), as_of),
+                   prev_ytd=(prev_as_of.replace(month=1, day=1), prev_as_of),
+                   prev_mtd=(prev_as_of.replace(day=1), prev_as_of))
+    totals = {(period, name): _period_total(daily, name, first, last)
+              for period, (first, last) in periods.items() for name in ('cases', 'fee', 'fee_n')}
+    months_with_cases = sum(
+        _period_total(daily, 'cases', as_of.replace(month=m, day=1),
+                      min(as_of, as_of.replace(month=m, day=1) + pd.offsets.MonthEnd(0))) > 0
+        for m in range(1, as_of.month + 1))
+    kpis = _kpi_document(
+        as_of.year, as_of.month, months_with_cases,
+        cur=tuple(totals['ytd', name] for name in ('cases', 'fee', 'fee_n')),
+        prev=tuple(totals['prev_ytd', name] for name in ('cases', 'fee', 'fee_n')),
+        mtd_fee=totals['mtd', 'fee'], prev_mtd_fee=totals['prev_mtd', 'fee'])
+    kpis['as_of'] = as_of.date().isoformat()
+    return kpis
+
+
+def portfolio_health(kpis):
+    """Spend against the pro-rated budget, run rate and year-end projection for compute_kpis output."""
+    months_in_year = kpis['months_in_year']
+    ytd_fee = kpis['ytd_fee']
+    run_rate = ytd_fee / max(months_in_year, 1)
+    projection = run_rate * 12
+    annual_budget = MONTHLY_BUDGET * 12
+    expected_cost_ytd = MONTHLY_BUDGET * months_in_year
+    over_budget_pct = ((ytd_fee - expected_cost_ytd) / expected_cost_ytd * 100) if expected_cost_ytd > 0 else 0
+
+    if over_budget_pct <= HEALTH_THRESHOLD_HEALTHY:
+        status = "HEALTHY"
+    elif over_budget_pct <= HEALTH_THRESHOLD_WARNING:
+        status = "WARNING"
+    else:
+        status = "CRITICAL"
+    return dict(
+        status=status,
+        over_budget_pct=over_budget_pct,
+        run_rate=run_rate,
+        projection=projection,
+        annual_budget=annual_budget,
+        expected_cost_ytd=expected_cost_ytd,
+        ytd_vs_expected_pct=(ytd_fee / expected_cost_ytd * 100) if expected_cost_ytd > 0 else 0,
+        projection_vs_budget_pct=(projection / annual_budget * 100) if annual_budget > 0 else 0,
+    )
+
+
+# ============================================================================
+# CHART AGGREGATES - the series behind each dashboard chart, from a filtered cube
+# ============================================================================
+# Every dimension a dashboard chart breaks cases or fees down by
+CHART_DIMENSIONS = ['Year', 'Month', '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', 'LOB', '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14']
+
+
+def chart_base(cube):
+    """The cube rolled up to the chart dimensions; each chart aggregate is a small groupby of it."""
+    dims = [c for c in CHART_DIMENSIONS if c in cube.columns]
+    measures = [c for c in ('cases', FEE_SUM) if c in cube.columns]
+    return cube.groupby(dims, dropna=False, observed=True, sort=False)[measures].sum().reset_index()
+
+
+def monthly_cost(cube):
+    monthly = cube.groupby(['Year', 'Month'])[FEE_SUM].sum().rename('Fee (Baht)').reset_index()
+    monthly['Year'] = monthly['Year'].astype(int)
+    monthly['Month'] = monthly['Month'].astype(int)
+    return monthly
+
+
+def service_cases(cube):
+    return cube.groupby('\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', observed=True)['cases'].sum().sort_values(ascending=False)
+
+
+def service_cost(cube):
+    return cube.groupby('\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', observed=True)[FEE_SUM].sum().rename('Fee (Baht)').sort_values(ascending=False)
+
+
+def lob_cases(cube):
+    return cube.groupby('LOB', observed=True)['cases'].sum().sort_index()
+
+
+def region_cases(cube):
+    return cube.groupby('\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14', observed=True)['cases'].sum().sort_values(ascending=False)
+
+
+def region_cost(cube):
+    return cube.groupby('\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14', observed=True)[FEE_SUM].sum().rename('Fee (Baht)').sort_values(ascending=False)
+
+
+def monthly_service_cases(cube):
+    mst_src = cube[['Year', 'Month', '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', 'cases']].assign(**{'\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23': cube['\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23'].astype(str)})
+    mst = mst_src.groupby(['Year', 'Month', '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23'])['cases'].sum().reset_index(name='Count')
+    mst['Year'] = mst['Year'].astype(int)
+    mst['Month'] = mst['Month'].astype(int)
+    mst['Date'] = pd.to_datetime(mst[['Year', 'Month']].assign(Day=1))
+    return mst
+
+
+# Chart name -> (aggregate, column it needs)
+CHART_AGGREGATES = {
+    'monthly_cost': (monthly_cost, 'Fee (Baht)'),
+    'service_cases': (service_cases, '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23'),
+    'service_cost': (service_cost, '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23'),
+    'lob_cases': (lob_cases, 'LOB'),
+    'region_cases': (region_cases, '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14'),
+    'region_cost': (region_cost, '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14'),
+    'monthly_service_cases': (monthly_service_cases, '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23'),
+}
+
+
+def chart_series(cube, cache_key=None):
+    """Every chart aggregate the cube has the columns for, by chart name, from one chart_base pass.
+
+    With a `cache_key` (dataset, filter signature) the whole set is kept in the
+    chart LRU, so reruns and fragment reruns skip the grouping.
+    """
+    def build():
+        base = chart_base(cube)
+        return {name: aggregate(base) for name, (aggregate, column) in CHART_AGGREGATES.items()
+                if column in base.columns or cube_measure(column, 'sum') in base.columns}
+    if cache_key is None:
+        return build()
+    return lru_cached(chart_cache(), cache_key, build, CHART_CACHE_SIZE)
+
+
+def chart_aggregates(cube):
+    """Every chart aggregate the cube has the columns for, as flat frames by chart name."""
+    return {name: result.reset_index() if isinstance(result, pd.Series) else result
+            for name, result in chart_series(cube).items()}
+
+
+# ============================================================================
+# COVERAGE - cases against the coverage periods of their policies
+# ============================================================================
+COVERAGE_START = '\u0e27\u0e31\u0e19\u0e40\u0e23\u0e34\u0e48\u0e21\u0e15\u0e49\u0e19\u0e04\u0e38\u0e49\u0e21\u0e04\u0e23\u0e2d\u0e07'
+COVERAGE_END = '\u0e27\u0e31\u0e19\u0e2a\u0e34\u0e49\u0e19\u0e2a\u0e38\u0e14\u0e04\u0e27\u0e32\u0e21\u0e04\u0e38\u0e49\u0e21\u0e04\u0e23\u0e2d\u0e07'
+# Case status code -> label
+COVERAGE_STATUS = {0: 'No coverage dates', 1: 'Before coverage', 2: 'In coverage', 3: 'After coverage'}
+IN_COVERAGE = 2
+# Days between two periods of a policy up to which they count as one (back-to-back renewals)
+COVERAGE_RENEWAL_GAP = 1
+# Bands of the coverage period that cases in coverage are counted in
+COVERAGE_POSITION_BANDS = 10
+# Filters that narrow the active policies as well as the cases; the rest describe cases only
+COVERAGE_POLICY_FILTERS = ['Year', 'Month', 'LOB']
+
+
+def _coverage_dates(values):
+    """A coverage column as (text dates, date cells as read, date cells with day and month exchanged).
+
+    The report writes coverage dates as m/d/yyyy text; where Excel took such text for a
+    d/m date (both parts 12 or less) it became a date cell with the two exchanged.
+    """
+    # Parsed per distinct value; a column holds a few thousand dates at most
+    codes, uniques = pd.factorize(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        cells = pd.Series(uniques)
+        text = pd.Series(pd.NaT, index=cells.index, dtype=cells.dtype)
+    else:
+        raw = pd.Series(uniques, dtype=object).astype('string')
+        text = pd.to_datetime(raw, format='%m/%d/%Y', errors='coerce')
+        cells = pd.to_datetime(raw.where(text.isna()), format='ISO8601', errors='coerce')
+    exchanged = pd.to_datetime(pd.DataFrame(dict(year=cells.dt.year, month=cells.dt.day, day=cells.dt.month)),
+                               errors='coerce').fillna(cells)
+    return tuple(pd.Series(parsed.array.take(codes, allow_fill=True), index=values.index)
+                 for parsed in (text, cells, exchanged))
+
+
+def _days(dates):
+    return dates.to_numpy().astype('datetime64[D]')
+
+
+def _months(days):
+    """Months since January 1970 of datetime64[D] values."""
+    return days.astype('datetime64[M]').astype(np.int64)
+
+
+def coverage_index(df):
+    """Coverage periods of every policy and where each case falls against them, parsed once per dataset.
+
+    Periods come from the coverage columns of every row; a policy's overlapping or
+    back-to-back periods are merged and all of them are sorted by (policy, start), so
+    each case finds the period it falls in (or last fell in) with one binary search.
+    Per row of `df` the result holds `status` (a COVERAGE_STATUS code) and, for cases
+    in coverage, `days_in` and `position` (the share of the period gone by, 0 to 1).
+    Rows without a policy number are a policy of their own.
+    """
+    n = len(df)
+    case_day = _days(pd.to_datetime(pd.DataFrame(dict(year=df['Year'], month=df['Month'], day=df['Day']))))
+    if 'LOB' in df.columns:
+        lob_codes, lob_labels = pd.factorize(df['LOB'])
+    else:
+        lob_codes, lob_labels = np.zeros(n, dtype=np.int64), ['(blank)']
+    coverage = dict(status=np.zeros(n, dtype=np.int8), days_in=np.full(n, -1, dtype=np.int32),
+                    position=np.full(n, np.nan), case_month=_months(case_day), case_lob=lob_codes,
+                    lob_labels=list(lob_labels), exchanged=False,
+                    periods=pd.DataFrame(dict(policy=pd.Series(dtype=np.int64), lob=pd.Series(dtype=np.int64),
+                                              start=pd.Series(dtype='datetime64[s]'),
+                                              end=pd.Series(dtype='datetime64[s]'))))
+    if COVERAGE_START not in df.columns or COVERAGE_END not in df.columns or n == 0:
+        return coverage
+
+    start_text, start_cells, start_exchanged = _coverage_dates(df[COVERAGE_START])
+    end_text, end_cells, end_exchanged = _coverage_dates(df[COVERAGE_END])
+    as_read = _days(start_text.fillna(start_cells)), _days(end_text.fillna(end_cells))
+    exchanged = _days(start_text.fillna(start_exchanged)), _days(end_text.fillna(end_exchanged))
+    # Read the date cells whichever way puts more cases inside the period on their own row
+    inside = [np.count_nonzero((s <= case_day) & (case_day <= e)) for s, e in (as_read, exchanged)]
+    coverage['exchanged'] = inside[1] > inside[0]
+    (start, end), (other_start, other_end) = (exchanged, as_read) if coverage['exchanged'] else (as_read, exchanged)
+    # Rows that only make a period (start on or before end) read the other way are read that way
+    flip = ~(start <= end) & (other_start <= other_end)
+    start, end = np.where(flip, other_start, start), np.where(flip, other_end, end)
+
+    policy = (distinct_keys(df['Policy No.'], 'policies') if 'Policy No.' in df.columns
+              else pd.Series(pd.NA, index=df.index, dtype='string'))
+    codes, uniques = pd.factorize(policy)
+    codes = np.where(codes < 0, len(uniques) + np.arange(n), codes)
+    valid = ~np.isnat(start) & ~np.isnat(end) & (start <= end)
+    periods = (pd.DataFrame(dict(policy=codes[valid], lob=lob_codes[valid], start=start[valid], end=end[valid]))
+               .drop_duplicates(['policy', 'start', 'end'])
+               .sort_values(['policy', 'start', 'end'], ignore_index=True))
+    # A period opens a new merged period unless it starts within the gap after the
+    # furthest end of the policy's earlier periods
+    reach = periods.groupby('policy')['end'].cummax().groupby(periods['policy']).shift()
+    opens = reach.isna() | (periods['start'] > reach + pd.Timedelta(days=COVERAGE_RENEWAL_GAP))
+    periods = (periods.groupby(opens.cumsum().to_numpy())
+               .agg(policy=('policy', 'first'), lob=('lob', 'first'), start=('start', 'min'), end=('end', 'max'))
+               .reset_index(drop=True))
+    coverage['periods'] = periods
+    if periods.empty:
+        return coverage
+
+    # Sorted (policy, start) keys; the last period at or before a case is the one it falls in or after
+    p_start, p_end = _days(periods['start']), _days(periods['end'])
+    origin = min(p_start.min(), case_day.min())
+    span = int((max(p_end.max(), case_day.max()) - origin).astype(np.int64)) + 1
+    p_policy = periods['policy'].to_numpy()
+    period_keys = p_policy * span + (p_start - origin).astype(np.int64)
+    case_keys = codes * span + (case_day - origin).astype(np.int64)
+    hit = np.searchsorted(period_keys, case_keys, side='right') - 1
+    found = hit >= 0
+    found[found] = p_policy[hit[found]] == codes[found]
+    has_period = np.zeros(codes.max() + 1, dtype=bool)
+    has_period[p_policy] = True
+
+    status = np.where(has_period[codes], 1, 0).astype(np.int8)
+    covered = found.copy()
+    covered[found] = case_day[found] <= p_end[hit[found]]
+    status[found] = 3
+    status[covered] = IN_COVERAGE
+    days_in = (case_day[covered] - p_start[hit[covered]]).astype(np.int64)
+    length = (p_end[hit[covered]] - p_start[hit[covered]]).astype(np.int64)
+    coverage['status'] = status
+    coverage['days_in'][covered] = days_in
+    coverage['position'][covered] = np.where(length > 0, days_in / np.maximum(length, 1), 1.0)
+    logger.info("Coverage: %d periods of %d policies; %d of %d cases in coverage%s", len(periods),
+                int(has_period.sum()), int(covered.sum()), n,
+                " (date cells read with day and month exchanged)" if coverage['exchanged'] else "")
+    return coverage
+
+
+def coverage_summary(coverage, mask=None, bands=COVERAGE_POSITION_BANDS):
+    """Cases per coverage status, and cases in coverage per band of their coverage period."""
+    status = coverage['status'] if mask is None else coverage['status'][mask]
+    position = coverage['position'] if mask is None else coverage['position'][mask]
+    band = np.minimum((position[status == IN_COVERAGE] * bands).astype(np.int64), bands - 1)
+    labels = [f"{100 * k // bands}-{100 * (k + 1) // bands}%" for k in range(bands)]
+    return dict(status=pd.Series(np.bincount(status, minlength=len(COVERAGE_STATUS)),
+                                 index=list(COVERAGE_STATUS.values()), name='cases'),
+                position=pd.Series(np.bincount(band, minlength=bands), index=labels, name='cases'))
+
+
+def coverage_by_month(coverage, mask=None, selections=None):
+    """Active policies, cases in coverage and cases per active policy per month and LOB.
+
+    A policy is active, and counted once, in every month one of its merged periods
+    touches; the counts come from a difference array over the months of the dataset's
+    cases. Cases follow the row `mask`; the COVERAGE_POLICY_FILTERS `selections`
+    ({column: labels}) keep their rows. Active policies only follow those, as the
+    other filters describe cases rather than policies.
+    """
+    columns = ['Year', 'Month', 'LOB', 'active_policies', 'cases', 'cases_per_policy']
+    months = coverage['case_month']
+    if len(months) == 0:
+        return pd.DataFrame(columns=columns)
+    first, n_months, n_lobs = months.min(), months.max() - months.min() + 1, len(coverage['lob_labels'])
+    periods = coverage['periods']
+    opens = np.clip(_months(_days(periods['start'])) - first, 0, n_months)
+    closes = np.clip(_months(_days(periods['end'])) - first + 1, 0, n_months)
+    # A policy's periods are sorted and disjoint, but two of them can touch the same
+    # month: each period only counts from the month after those its predecessor reached
+    policy = periods['policy'].to_numpy()
+    follows = np.zeros(len(periods), dtype=bool)
+    follows[1:] = policy[1:] == policy[:-1]
+    opens[follows] = np.maximum(opens[follows], closes[:-1][follows[1:]])
+    counted = opens < closes
+    lobs = periods['lob'].to_numpy()[counted]
+    changes = np.zeros((n_lobs, n_months + 1), dtype=np.int64)
+    np.add.at(changes, (lobs, opens[counted]), 1)
+    np.add.at(changes, (lobs, closes[counted]), -1)
+    active = changes.cumsum(axis=1)[:, :-1]
+
+    covered = coverage['status'] == IN_COVERAGE
+    if mask is not None:
+        covered &= mask
+    cases = np.bincount(coverage['case_lob'][covered] * n_months + months[covered] - first,
+                        minlength=n_lobs * n_months).reshape(n_lobs, n_months)
+    month_ids = first + np.tile(np.arange(n_months), n_lobs)
+    frame = pd.DataFrame(dict(Year=month_ids // 12 + 1970, Month=month_ids % 12 + 1,
+                              LOB=np.repeat(coverage['lob_labels'], n_months),
+                              active_policies=active.ravel(), cases=cases.ravel()))
+    keep = (frame['active_policies'] > 0) | (frame['cases'] > 0)
+    for col, selected in (selections or {}).items():
+        if col in COVERAGE_POLICY_FILTERS:
+            keep &= frame[col].astype(FILTER_DIMENSIONS[col]).isin(selected)
+    frame = frame[keep]
+    frame['cases_per_policy'] = frame['cases'] / frame['active_policies'].replace(0, np.nan)
+    return frame.sort_values(['Year', 'Month', 'LOB'], ignore_index=True)[columns]
+
+
+# ============================================================================
+# EXPORT - filtered cases written in chunks, on request
+# ============================================================================
+# Format (file extension) -> MIME type
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+# Customer names, phone numbers and free-text reasons; dropped from exports on request
+PII_COLUMNS = [
+    '\u0e0a\u0e37\u0e48\u0e2d\u0e19\u0e32\u0e21\u0e2a\u0e01\u0e38\u0e25\u0e25\u0e39\u0e01\u0e04\u0e49\u0e32',
+    '\u0e40\u0e1a\u0e2d\u0e23\u0e4c\u0e42\u0e17\u0e23\u0e28\u0e31\u0e1e\u0e17\u0e4c',
+    '\u0e2a\u0e32\u0e40\u0e2b\u0e15\u0e38\u0e01\u0e32\u0e23\u0e02\u0e2d\u0e43\u0e0a\u0e49\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23',
+]
+# One sheet, less its header row
+XLSX_MAX_ROWS = 1_048_575
+
+
+def _arrow_schema(df):
+    """Parquet schema for `df`; object columns are typed from their first non-null value."""
+    schema = pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            sample = df[field.name].dropna()
+            if len(sample):
+                schema = schema.set(i, field.with_type(pa.array(sample.iloc[:1]).type))
+    return schema
+
+
+def write_export(df, target, fmt, drop_pii=False, chunk_rows=EXPORT_CHUNK_ROWS, digest=None):
+    """Write `df` to the binary file object `target` as `fmt`, `chunk_rows` rows at a time.
+
+    With `digest`, the TEXT_COLUMNS `df` lacks (a lean frame or rows of one) are read
+    back from that dataset's snapshot a chunk at a time. Only one chunk is ever read and
+    converted at once; the file written so far is held wherever `target` keeps it.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt == 'xlsx' and len(df) > XLSX_MAX_ROWS:
+        raise ValueError(f"{len(df):,} rows do not fit on one Excel sheet ({XLSX_MAX_ROWS:,} max)")
+    if drop_pii:
+        df = df.drop(columns=[c for c in PII_COLUMNS if c in df.columns])
+    wanted = [c for c in TEXT_COLUMNS if not (drop_pii and c in PII_COLUMNS)]
+    if digest is None:
+        wanted = []
+    columns, text_fields, chunks = text_column_chunks(df, digest, chunk_rows, columns=wanted)
+
+    if fmt == 'csv':
+        # Written through to `target` rather than built up as one string per chunk
+        text = TextIOWrapper(target, encoding='utf-8', newline='')
+        text.write('\ufeff')
+        for i, chunk in enumerate(chunks):
+            chunk[columns].to_csv(text, index=False, header=i == 0)
+        text.flush()
+        text.detach()
+    elif fmt == 'parquet':
+        lean_schema = _arrow_schema(df)
+        schema = pa.schema([text_fields.get(c) or lean_schema.field(c) for c in columns])
+        with pq.ParquetWriter(target, schema) as writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pandas(chunk[columns], schema=schema, preserve_index=False))
+    else:
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet('RSA Export')
+        ws.append([str(c) for c in columns])
+        for chunk in chunks:
+            chunk = chunk[columns]
+            values = chunk.astype(object)
+            for row in values.where(chunk.notna(), None).itertuples(index=False, name=None):
+                ws.append(row)
+        wb.save(target)
+
+
+def export_bytes(df, fmt, drop_pii=False, digest=None):
+    """`df` exported as `fmt`, as bytes for a download (text columns as in write_export).
+
+    The file is written to a buffer that moves to disk past EXPORT_SPOOL_BYTES and is
+    read back once, so a large export is in memory once (the returned bytes) rather
+    than as a buffer plus its copy.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as buffer:
+        write_export(df, buffer, fmt, drop_pii=drop_pii, digest=digest)
+        buffer.seek(0)
+        return buffer.read()
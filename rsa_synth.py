@@ -0,0 +1,242 @@
+"""Synthetic RSA report workbooks with the layout and column cardinalities of the real report.
+
+    python rsa_synth.py synthetic_100k.xlsx --rows 100000 --seed 7
+
+The sheet starts with the report title rows above the header (as in the monthly
+export), followed by one case per row. Value pools follow _cols.txt: 7 service types,
+~75 incident provinces, ~27 make spellings, ~170 models, ~25 project codes and
+~22 divisions, with '-' placeholders and mixed text/number cells where the real
+report has them. A small summary sheet is put first so sheet detection has to probe.
+"""
+import argparse
+from datetime import datetime, time, timedelta
+
+import numpy as np
+import openpyxl
+
+# Data rows per sheet allowed by Excel, below the header block
+MAX_SHEET_ROWS = 1_048_576 - 8
+
+HEADER = ['\u0e25\u0e33\u0e14\u0e31\u0e1a', '\u0e40\u0e25\u0e02\u0e23\u0e31\u0e1a\u0e41\u0e08\u0e49\u0e07', '\u0e27\u0e31\u0e19\u0e17\u0e35\u0e48', '\u0e40\u0e27\u0e25\u0e32', 'Roadside_Plan', 'Policy No.', '\u0e27\u0e31\u0e19\u0e40\u0e23\u0e34\u0e48\u0e21\u0e15\u0e49\u0e19\u0e04\u0e38\u0e49\u0e21\u0e04\u0e23\u0e2d\u0e07',
+          '\u0e27\u0e31\u0e19\u0e2a\u0e34\u0e49\u0e19\u0e2a\u0e38\u0e14\u0e04\u0e27\u0e32\u0e21\u0e04\u0e38\u0e49\u0e21\u0e04\u0e23\u0e2d\u0e07', ' Preriod Days', 'Policy Type', '\u0e0a\u0e37\u0e48\u0e2d\u0e19\u0e32\u0e21\u0e2a\u0e01\u0e38\u0e25\u0e25\u0e39\u0e01\u0e04\u0e49\u0e32', '\u0e40\u0e1a\u0e2d\u0e23\u0e4c\u0e42\u0e17\u0e23\u0e28\u0e31\u0e1e\u0e17\u0e4c', '\u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16',
+          '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14 \u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19\u0e23\u0e16', '\u0e1b\u0e35\u0e17\u0e35\u0e48\u0e08\u0e14\u0e17\u0e30\u0e40\u0e1a\u0e35\u0e22\u0e19', 'MOTOR_CODE', '\u0e22\u0e35\u0e48\u0e2b\u0e49\u0e2d\u0e23\u0e16', '\u0e23\u0e38\u0e48\u0e19\u0e23\u0e16', '\u0e2a\u0e16\u0e32\u0e19\u0e17\u0e35\u0e48\u0e40\u0e01\u0e34\u0e14\u0e40\u0e2b\u0e15\u0e38', '\u0e08\u0e31\u0e07\u0e2b\u0e27\u0e31\u0e14',
+          '\u0e2a\u0e32\u0e40\u0e2b\u0e15\u0e38\u0e01\u0e32\u0e23\u0e02\u0e2d\u0e43\u0e0a\u0e49\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', '\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e32\u0e23\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', '\u0e01\u0e32\u0e23\u0e43\u0e2b\u0e49\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', '\u0e15\u0e49\u0e19\u0e17\u0e32\u0e07', '\u0e1b\u0e25\u0e32\u0e22\u0e17\u0e32\u0e07', '\u0e23\u0e30\u0e22\u0e30\u0e17\u0e32\u0e07 (KM)',
+          'Fee\n (Baht)', '\u0e25\u0e39\u0e01\u0e04\u0e49\u0e32\u0e08\u0e48\u0e32\u0e22\u0e2a\u0e48\u0e27\u0e19\u0e15\u0e48\u0e32\u0e07', 'Exceed Fee (Baht)', '\u0e23\u0e2b\u0e31\u0e2a\u0e42\u0e04\u0e23\u0e07\u0e01\u0e32\u0e23', '\u0e41\u0e1c\u0e19\u0e01', '\u0e2b\u0e21\u0e32\u0e22\u0e40\u0e2b\u0e15\u0e38']
+
+# Service type -> share of cases
+SERVICE_TYPES = {
+    '\u0e2a\u0e2d\u0e1a\u0e16\u0e32\u0e21\u0e02\u0e49\u0e2d\u0e21\u0e39\u0e25': 0.55, '\u0e43\u0e0a\u0e49\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23\u0e43\u0e19\u0e14\u0e49\u0e32\u0e19\u0e23\u0e16\u0e22\u0e01': 0.16, '\u0e43\u0e0a\u0e49\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23\u0e43\u0e19\u0e14\u0e49\u0e32\u0e19\u0e0a\u0e48\u0e32\u0e07': 0.12, '\u0e25\u0e39\u0e01\u0e04\u0e49\u0e32\u0e41\u0e08\u0e49\u0e07\u0e22\u0e01\u0e40\u0e25\u0e34\u0e01': 0.06,
+    '\u0e1b\u0e23\u0e36\u0e01\u0e29\u0e32\u0e0a\u0e48\u0e32\u0e07\u0e40\u0e17\u0e04\u0e19\u0e34\u0e04': 0.05, '\u0e43\u0e0a\u0e49\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23\u0e43\u0e19\u0e14\u0e49\u0e32\u0e19\u0e01\u0e38\u0e0d\u0e41\u0e08': 0.03, '\u0e43\u0e0a\u0e49\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23\u0e43\u0e19\u0e14\u0e49\u0e32\u0e19\u0e19\u0e49\u0e33\u0e21\u0e31\u0e19': 0.03,
+}
+POLICY_TYPES = ['AV1', 'AV5', 'AC3', 'AV9', 'AV3']
+PROVINCES = [
+    '\u0e01\u0e23\u0e38\u0e07\u0e40\u0e17\u0e1e\u0e21\u0e2b\u0e32\u0e19\u0e04\u0e23', '\u0e01\u0e23\u0e30\u0e1a\u0e35\u0e48', '\u0e01\u0e32\u0e0d\u0e08\u0e19\u0e1a\u0e38\u0e23\u0e35', '\u0e01\u0e32\u0e2c\u0e2a\u0e34\u0e19\u0e18\u0e38\u0e4c', '\u0e01\u0e33\u0e41\u0e1e\u0e07\u0e40\u0e1e\u0e0a\u0e23', '\u0e02\u0e2d\u0e19\u0e41\u0e01\u0e48\u0e19', '\u0e08\u0e31\u0e19\u0e17\u0e1a\u0e38\u0e23\u0e35', '\u0e09\u0e30\u0e40\u0e0a\u0e34\u0e07\u0e40\u0e17\u0e23\u0e32', '\u0e0a\u0e25\u0e1a\u0e38\u0e23\u0e35',
+    '\u0e0a\u0e31\u0e22\u0e19\u0e32\u0e17', '\u0e0a\u0e31\u0e22\u0e20\u0e39\u0e21\u0e34', '\u0e0a\u0e38\u0e21\u0e1e\u0e23', '\u0e40\u0e0a\u0e35\u0e22\u0e07\u0e23\u0e32\u0e22', '\u0e40\u0e0a\u0e35\u0e22\u0e07\u0e43\u0e2b\u0e21\u0e48', '\u0e15\u0e23\u0e31\u0e07', '\u0e15\u0e23\u0e32\u0e14', '\u0e15\u0e32\u0e01', '\u0e19\u0e04\u0e23\u0e19\u0e32\u0e22\u0e01', '\u0e19\u0e04\u0e23\u0e1b\u0e10\u0e21', '\u0e19\u0e04\u0e23\u0e1e\u0e19\u0e21',
+    '\u0e19\u0e04\u0e23\u0e23\u0e32\u0e0a\u0e2a\u0e35\u0e21\u0e32', '\u0e19\u0e04\u0e23\u0e28\u0e23\u0e35\u0e18\u0e23\u0e23\u0e21\u0e23\u0e32\u0e0a', '\u0e19\u0e04\u0e23\u0e2a\u0e27\u0e23\u0e23\u0e04\u0e4c', '\u0e19\u0e19\u0e17\u0e1a\u0e38\u0e23\u0e35', '\u0e19\u0e23\u0e32\u0e18\u0e34\u0e27\u0e32\u0e2a', '\u0e19\u0e48\u0e32\u0e19', '\u0e1a\u0e36\u0e07\u0e01\u0e32\u0e2c', '\u0e1a\u0e38\u0e23\u0e35\u0e23\u0e31\u0e21\u0e22\u0e4c', '\u0e1b\u0e17\u0e38\u0e21\u0e18\u0e32\u0e19\u0e35',
+    '\u0e1b\u0e23\u0e30\u0e08\u0e27\u0e1a\u0e04\u0e35\u0e23\u0e35\u0e02\u0e31\u0e19\u0e18\u0e4c', '\u0e1b\u0e23\u0e32\u0e08\u0e35\u0e19\u0e1a\u0e38\u0e23\u0e35', '\u0e1b\u0e31\u0e15\u0e15\u0e32\u0e19\u0e35', '\u0e1e\u0e23\u0e30\u0e19\u0e04\u0e23\u0e28\u0e23\u0e35\u0e2d\u0e22\u0e38\u0e18\u0e22\u0e32', '\u0e1e\u0e30\u0e40\u0e22\u0e32', '\u0e1e\u0e31\u0e07\u0e07\u0e32', '\u0e1e\u0e31\u0e17\u0e25\u0e38\u0e07', '\u0e1e\u0e34\u0e08\u0e34\u0e15\u0e23', '\u0e1e\u0e34\u0e29\u0e13\u0e38\u0e42\u0e25\u0e01',
+    '\u0e40\u0e1e\u0e0a\u0e23\u0e1a\u0e38\u0e23\u0e35', '\u0e40\u0e1e\u0e0a\u0e23\u0e1a\u0e39\u0e23\u0e13\u0e4c', '\u0e41\u0e1e\u0e23\u0e48', '\u0e20\u0e39\u0e40\u0e01\u0e47\u0e15', '\u0e21\u0e2b\u0e32\u0e2a\u0e32\u0e23\u0e04\u0e32\u0e21', '\u0e21\u0e38\u0e01\u0e14\u0e32\u0e2b\u0e32\u0e23', '\u0e41\u0e21\u0e48\u0e2e\u0e48\u0e2d\u0e07\u0e2a\u0e2d\u0e19', '\u0e22\u0e42\u0e2a\u0e18\u0e23', '\u0e22\u0e30\u0e25\u0e32', '\u0e23\u0e49\u0e2d\u0e22\u0e40\u0e2d\u0e47\u0e14',
+    '\u0e23\u0e30\u0e19\u0e2d\u0e07', '\u0e23\u0e30\u0e22\u0e2d\u0e07', '\u0e23\u0e32\u0e0a\u0e1a\u0e38\u0e23\u0e35', '\u0e25\u0e1e\u0e1a\u0e38\u0e23\u0e35', '\u0e25\u0e33\u0e1b\u0e32\u0e07', '\u0e25\u0e33\u0e1e\u0e39\u0e19', '\u0e40\u0e25\u0e22', '\u0e28\u0e23\u0e35\u0e2a\u0e30\u0e40\u0e01\u0e29', '\u0e2a\u0e01\u0e25\u0e19\u0e04\u0e23', '\u0e2a\u0e07\u0e02\u0e25\u0e32', '\u0e2a\u0e15\u0e39\u0e25',
+    '\u0e2a\u0e21\u0e38\u0e17\u0e23\u0e1b\u0e23\u0e32\u0e01\u0e32\u0e23', '\u0e2a\u0e21\u0e38\u0e17\u0e23\u0e2a\u0e07\u0e04\u0e23\u0e32\u0e21', '\u0e2a\u0e21\u0e38\u0e17\u0e23\u0e2a\u0e32\u0e04\u0e23', '\u0e2a\u0e23\u0e30\u0e41\u0e01\u0e49\u0e27', '\u0e2a\u0e23\u0e30\u0e1a\u0e38\u0e23\u0e35', '\u0e2a\u0e34\u0e07\u0e2b\u0e4c\u0e1a\u0e38\u0e23\u0e35', '\u0e2a\u0e38\u0e42\u0e02\u0e17\u0e31\u0e22', '\u0e2a\u0e38\u0e1e\u0e23\u0e23\u0e13\u0e1a\u0e38\u0e23\u0e35',
+    '\u0e2a\u0e38\u0e23\u0e32\u0e29\u0e0e\u0e23\u0e4c\u0e18\u0e32\u0e19\u0e35', '\u0e2a\u0e38\u0e23\u0e34\u0e19\u0e17\u0e23\u0e4c', '\u0e2b\u0e19\u0e2d\u0e07\u0e04\u0e32\u0e22', '\u0e2b\u0e19\u0e2d\u0e07\u0e1a\u0e31\u0e27\u0e25\u0e33\u0e20\u0e39', '\u0e2d\u0e48\u0e32\u0e07\u0e17\u0e2d\u0e07', '\u0e2d\u0e33\u0e19\u0e32\u0e08\u0e40\u0e08\u0e23\u0e34\u0e0d', '\u0e2d\u0e38\u0e14\u0e23\u0e18\u0e32\u0e19\u0e35', '\u0e2d\u0e38\u0e15\u0e23\u0e14\u0e34\u0e15\u0e16\u0e4c',
+    '\u0e2d\u0e38\u0e17\u0e31\u0e22\u0e18\u0e32\u0e19\u0e35', '\u0e2d\u0e38\u0e1a\u0e25\u0e23\u0e32\u0e0a\u0e18\u0e32\u0e19\u0e35',
+]
+# Spellings seen for Bangkok in plates and incident provinces
+BANGKOK_SPELLINGS = ['\u0e01\u0e23\u0e38\u0e07\u0e40\u0e17\u0e1e\u0e21\u0e2b\u0e32\u0e19\u0e04\u0e23', '\u0e01\u0e23\u0e38\u0e07\u0e40\u0e17\u0e1e', '\u0e01\u0e17\u0e21']
+PLATE_LETTERS = list('\u0e01\u0e02\u0e04\u0e06\u0e07\u0e08\u0e09\u0e0a\u0e0b\u0e0c\u0e0d\u0e0e\u0e0f\u0e10\u0e11\u0e12\u0e13\u0e14\u0e15\u0e16\u0e17\u0e18\u0e19\u0e1a\u0e1b\u0e1c\u0e1d\u0e1e\u0e1f\u0e20\u0e21\u0e22\u0e23\u0e25\u0e27\u0e28\u0e29\u0e2a\u0e2b\u0e2c\u0e2d\u0e2e')
+# Make -> models; makes also appear in the other spellings of MAKE_SPELLINGS
+MAKES = {
+    'TOYOTA': ['VIOS', 'YARIS', 'YARIS ATIV', 'ALTIS', 'CAMRY', 'FORTUNER', 'HILUX REVO', 'HILUX VIGO', 'CHR',
+               'COROLLA CROSS', 'INNOVA', 'AVANZA', 'SIENTA', 'COMMUTER', 'VELOZ', 'ALPHARD', 'PRIUS', 'WISH',
+               'ALTIS HYBRID', 'CROSS', 'YARIS CROSS', 'SOLUNA', 'HIACE', 'RAIZE', 'LAND CRUISER'],
+    'HONDA': ['CIVIC', 'CITY', 'ACCORD', 'JAZZ', 'HR-V', 'CR-V', 'BR-V', 'BRIO', 'MOBILIO', 'FREED', 'WR-V',
+              'CITY HATCHBACK', 'ODYSSEY', 'E:N1'],
+    'ISUZU': ['D-MAX', 'MU-X', 'MU-7', 'D-MAX SPARK', 'D-MAX HI-LANDER', 'D-MAX V-CROSS', 'DRAGON EYES'],
+    'MITSUBISHI': ['TRITON', 'PAJERO SPORT', 'XPANDER', 'MIRAGE', 'ATTRAGE', 'LANCER', 'SPACE WAGON',
+                   'OUTLANDER', 'XFORCE', 'STRADA'],
+    'NISSAN': ['ALMERA', 'NOTE', 'MARCH', 'NAVARA', 'TERRA', 'KICKS', 'SYLPHY', 'TEANA', 'X-TRAIL', 'JUKE',
+               'LEAF', 'TIIDA', 'URVAN'],
+    'MAZDA': ['MAZDA2', 'MAZDA3', 'CX-3', 'CX-30', 'CX-5', 'CX-8', 'BT-50', 'BT-50 PRO', 'MX-5'],
+    'FORD': ['RANGER', 'EVEREST', 'FIESTA', 'FOCUS', 'ECOSPORT', 'RAPTOR'],
+    'SUZUKI': ['SWIFT', 'CIAZ', 'CELERIO', 'ERTIGA', 'XL7', 'CARRY', 'VITARA'],
+    'MERCEDES-BENZ': ['C200', 'C220D', 'C300', 'E200', 'E220D', 'E300', 'GLA200', 'GLC300', 'CLA200', 'S350'],
+    'BMW': ['320D', '330E', '520D', '530E', 'X1', 'X3', 'X5', 'SERIES 3'],
+    'MG': ['MG3', 'MG5', 'ZS', 'ZS EV', 'HS', 'EXTENDER', 'VS', 'MG4'],
+    'HYUNDAI': ['H-1', 'STARIA', 'CRETA', 'TUCSON', 'ELANTRA'],
+    'CHEVROLET': ['COLORADO', 'TRAILBLAZER', 'CRUZE', 'CAPTIVA', 'SONIC'],
+    'SUBARU': ['XV', 'FORESTER', 'OUTBACK'],
+    'VOLVO': ['XC40', 'XC60', 'XC90', 'S60'],
+    'AUDI': ['A4', 'A5', 'Q3', 'Q5'],
+    'PORSCHE': ['CAYENNE', 'MACAN', 'PANAMERA'],
+    'PEUGEOT': ['2008', '3008', '5008'],
+    'PROTON': ['SAGA', 'PERSONA', 'EXORA'],
+    'MINI': ['COOPER', 'COUNTRYMAN'],
+    'OTHER': ['OTHER'],
+}
+MAKE_SPELLINGS = {'TOYOTA': ['Toyota'], 'HONDA': ['Honda'], 'SUZUKI': ['Suzuki'], 'ISUZU': ['Isuzu'],
+                  'MITSUBISHI': ['Mitsubishi', 'Mitsubishi '], 'NISSAN': ['Nissan']}
+MAKE_WEIGHTS = {'TOYOTA': 30, 'HONDA': 22, 'ISUZU': 12, 'MITSUBISHI': 8, 'NISSAN': 7, 'MAZDA': 6, 'FORD': 4,
+                'SUZUKI': 3, 'MERCEDES-BENZ': 3, 'BMW': 2, 'MG': 2}
+# Project code -> division; the codes are typed both as text and as numbers
+PROJECTS = {
+    'C17': 'B2', 'C18': 'B2', 'SKB': 'TR', 63: 'TR', 53: 'TR', 144: 'TR', 1: 'JS', 68: 'HY', 30: 'SR', 'C20': 'DM',
+    'C21': 'NM', 'C23': 'J3', 'K01': 'K1', 'K02': 'K1', 'BRK': 'BR', 'DLR': 'DL', 'DLR2': 'DL', 'ONL': 'OL',
+    'TEL': 'TM', 'AFF': 'AF', 'BNK': 'BA', 'LSG': 'LS', 'FLT': 'FL', '\u0e23\u0e2d\u0e15\u0e23\u0e27\u0e08\u0e2a\u0e2d\u0e1a': '\u0e23\u0e2d\u0e15\u0e23\u0e27\u0e08\u0e2a\u0e2d\u0e1a',
+}
+CAUSES = ['\u0e23\u0e16\u0e2a\u0e15\u0e32\u0e23\u0e4c\u0e17\u0e44\u0e21\u0e48\u0e15\u0e34\u0e14', '\u0e41\u0e1a\u0e15\u0e40\u0e15\u0e2d\u0e23\u0e35\u0e48\u0e2b\u0e21\u0e14', '\u0e22\u0e32\u0e07\u0e41\u0e1a\u0e19', '\u0e22\u0e32\u0e07\u0e23\u0e31\u0e48\u0e27', '\u0e01\u0e38\u0e0d\u0e41\u0e08\u0e2b\u0e32\u0e22', '\u0e25\u0e37\u0e21\u0e01\u0e38\u0e0d\u0e41\u0e08\u0e43\u0e19\u0e23\u0e16', '\u0e19\u0e49\u0e33\u0e21\u0e31\u0e19\u0e2b\u0e21\u0e14', '\u0e23\u0e16\u0e40\u0e2a\u0e35\u0e22\u0e01\u0e25\u0e32\u0e07\u0e17\u0e32\u0e07',
+          '\u0e40\u0e04\u0e23\u0e37\u0e48\u0e2d\u0e07\u0e22\u0e19\u0e15\u0e4c\u0e23\u0e49\u0e2d\u0e19\u0e08\u0e31\u0e14', '\u0e41\u0e08\u0e49\u0e07\u0e2d\u0e38\u0e1a\u0e31\u0e15\u0e34\u0e40\u0e2b\u0e15\u0e38', '\u0e2a\u0e2d\u0e1a\u0e16\u0e32\u0e21\u0e04\u0e27\u0e32\u0e21\u0e04\u0e38\u0e49\u0e21\u0e04\u0e23\u0e2d\u0e07', '\u0e02\u0e31\u0e1a\u0e21\u0e32\u0e41\u0e25\u0e49\u0e27\u0e14\u0e31\u0e1a', '\u0e44\u0e1f\u0e2b\u0e19\u0e49\u0e32\u0e1b\u0e31\u0e14\u0e02\u0e36\u0e49\u0e19\u0e40\u0e15\u0e37\u0e2d\u0e19', '\u0e23\u0e16\u0e15\u0e34\u0e14\u0e2b\u0e25\u0e48\u0e21',
+          '\u0e2a\u0e2d\u0e1a\u0e16\u0e32\u0e21\u0e40\u0e23\u0e37\u0e48\u0e2d\u0e07\u0e01\u0e32\u0e23\u0e40\u0e1a\u0e34\u0e01\u0e04\u0e48\u0e32\u0e22\u0e01\u0e23\u0e16', '\u0e22\u0e01\u0e40\u0e25\u0e34\u0e01\u0e01\u0e32\u0e23\u0e43\u0e0a\u0e49\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23']
+CAUSE_DETAILS = ['\u0e2b\u0e19\u0e49\u0e32\u0e02\u0e27\u0e32', '\u0e2b\u0e19\u0e49\u0e32\u0e0b\u0e49\u0e32\u0e22', '\u0e2b\u0e25\u0e31\u0e07\u0e02\u0e27\u0e32', '\u0e2b\u0e25\u0e31\u0e07\u0e0b\u0e49\u0e32\u0e22', '\u0e17\u0e35\u0e48\u0e1a\u0e49\u0e32\u0e19', '\u0e17\u0e35\u0e48\u0e17\u0e33\u0e07\u0e32\u0e19', '\u0e1a\u0e19\u0e17\u0e32\u0e07\u0e14\u0e48\u0e27\u0e19', '\u0e43\u0e19\u0e2b\u0e49\u0e32\u0e07',
+                 '\u0e25\u0e39\u0e01\u0e04\u0e49\u0e32\u0e23\u0e2d\u0e17\u0e35\u0e48\u0e23\u0e16', '\u0e44\u0e21\u0e48\u0e44\u0e14\u0e49\u0e40\u0e01\u0e34\u0e14\u0e2d\u0e38\u0e1a\u0e31\u0e15\u0e34\u0e40\u0e2b\u0e15\u0e38', '\u0e14\u0e35\u0e40\u0e0b\u0e25 B7', '\u0e40\u0e1a\u0e19\u0e0b\u0e34\u0e19 95']
+ACTIONS = ['\u0e2a\u0e48\u0e07\u0e23\u0e16\u0e22\u0e01\u0e2a\u0e44\u0e25\u0e14\u0e4c\u0e2d\u0e2d\u0e01\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', '\u0e2a\u0e48\u0e07\u0e0a\u0e48\u0e32\u0e07\u0e2d\u0e2d\u0e01\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23\u0e1e\u0e48\u0e27\u0e07\u0e41\u0e1a\u0e15', '\u0e2a\u0e48\u0e07\u0e0a\u0e48\u0e32\u0e07\u0e2d\u0e2d\u0e01\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23\u0e40\u0e1b\u0e25\u0e35\u0e48\u0e22\u0e19\u0e22\u0e32\u0e07', '\u0e2a\u0e48\u0e07\u0e0a\u0e48\u0e32\u0e07\u0e01\u0e38\u0e0d\u0e41\u0e08\u0e2d\u0e2d\u0e01\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23',
+           '\u0e2a\u0e48\u0e07\u0e19\u0e49\u0e33\u0e21\u0e31\u0e19\u0e2d\u0e2d\u0e01\u0e1a\u0e23\u0e34\u0e01\u0e32\u0e23', '\u0e41\u0e19\u0e30\u0e19\u0e33\u0e15\u0e34\u0e14\u0e15\u0e48\u0e2d \u0e41\u0e08\u0e49\u0e07\u0e2d\u0e38\u0e1a\u0e31\u0e15\u0e34\u0e40\u0e2b\u0e15\u0e38 02-118-7400', '\u0e41\u0e19\u0e30\u0e19\u0e33\u0e15\u0e34\u0e14\u0e15\u0e48\u0e2d\u0e01\u0e25\u0e31\u0e1a 02-119-3000',
+           '\u0e25\u0e39\u0e01\u0e04\u0e49\u0e32\u0e41\u0e08\u0e49\u0e07\u0e22\u0e01\u0e40\u0e25\u0e34\u0e01\u0e40\u0e19\u0e37\u0e48\u0e2d\u0e07\u0e08\u0e32\u0e01\u0e41\u0e01\u0e49\u0e44\u0e02\u0e40\u0e2d\u0e07\u0e44\u0e14\u0e49', '\u0e43\u0e2b\u0e49\u0e04\u0e33\u0e1b\u0e23\u0e36\u0e01\u0e29\u0e32\u0e17\u0e32\u0e07\u0e42\u0e17\u0e23\u0e28\u0e31\u0e1e\u0e17\u0e4c']
+FIRST_NAMES = ['\u0e2a\u0e21\u0e0a\u0e32\u0e22', '\u0e2a\u0e21\u0e28\u0e23\u0e35', '\u0e27\u0e34\u0e44\u0e25', '\u0e1b\u0e23\u0e30\u0e40\u0e2a\u0e23\u0e34\u0e10', '\u0e01\u0e34\u0e15\u0e15\u0e34\u0e14\u0e32', '\u0e1b\u0e32\u0e13\u0e31\u0e2a\u0e01\u0e23', '\u0e2d\u0e23\u0e31\u0e0d\u0e0d\u0e32', '\u0e2a\u0e34\u0e17\u0e18\u0e34\u0e19\u0e19\u0e17\u0e4c', '\u0e01\u0e32\u0e0d\u0e19\u0e32', '\u0e18\u0e34\u0e15\u0e34\u0e1e\u0e31\u0e19\u0e18\u0e34\u0e4c',
+               'Ratthanon', 'Sirisin', '\u0e1e\u0e23\u0e23\u0e13\u0e20\u0e31\u0e17\u0e23', '\u0e13\u0e31\u0e10\u0e27\u0e38\u0e12\u0e34', '\u0e08\u0e34\u0e23\u0e32\u0e1e\u0e23', '\u0e2d\u0e19\u0e38\u0e0a\u0e32', '\u0e28\u0e34\u0e23\u0e34\u0e1e\u0e23', '\u0e27\u0e23\u0e40\u0e0a\u0e29\u0e10\u0e4c', '\u0e21\u0e32\u0e25\u0e35', '\u0e0a\u0e22\u0e1e\u0e25']
+LAST_NAMES = ['\u0e17\u0e2d\u0e07\u0e04\u0e33', '\u0e41\u0e1c\u0e48\u0e19\u0e2b\u0e32', '\u0e14\u0e27\u0e07\u0e17\u0e23\u0e07\u0e01\u0e23\u0e14', '\u0e13\u0e10\u0e01\u0e23\u0e27\u0e23\u0e27\u0e31\u0e0a', '\u0e21\u0e34\u0e19\u0e18\u0e27\u0e23\u0e23\u0e13', 'Sangdee', '\u0e43\u0e08\u0e14\u0e35', '\u0e28\u0e23\u0e35\u0e2a\u0e38\u0e02', '\u0e1a\u0e38\u0e0d\u0e21\u0e32', '\u0e41\u0e01\u0e49\u0e27\u0e21\u0e13\u0e35',
+              '\u0e2a\u0e38\u0e02\u0e2a\u0e27\u0e31\u0e2a\u0e14\u0e34\u0e4c', '\u0e27\u0e07\u0e28\u0e4c\u0e43\u0e2b\u0e0d\u0e48', '']
+TITLES = ['\u0e04\u0e38\u0e13', '\u0e04\u0e38\u0e13', '\u0e04\u0e38\u0e13', '\u0e19.\u0e2a.', '\u0e19\u0e32\u0e22', '\u0e19\u0e32\u0e07', 'Mr. ', 'Ms. ']
+PLACES = ['\u0e0b\u0e2d\u0e22', '\u0e16\u0e19\u0e19', '\u0e15\u0e33\u0e1a\u0e25', '\u0e2b\u0e21\u0e39\u0e48\u0e1a\u0e49\u0e32\u0e19', '\u0e2b\u0e49\u0e32\u0e07', '\u0e1b\u0e31\u0e4a\u0e21', '\u0e41\u0e22\u0e01', '\u0e17\u0e32\u0e07\u0e14\u0e48\u0e27\u0e19']
+
+
+def _pick(rng, values, n, weights=None):
+    """Draw `n` values (any Python objects) from `values`, optionally weighted."""
+    p = None if weights is None else np.asarray(weights, dtype=float) / np.sum(weights)
+    pool = np.empty(len(values), dtype=object)
+    pool[:] = values
+    return pool[rng.choice(len(values), size=n, p=p)]
+
+
+def _thai_date(d):
+    months = ['\u0e21\u0e01\u0e23\u0e32\u0e04\u0e21', '\u0e01\u0e38\u0e21\u0e20\u0e32\u0e1e\u0e31\u0e19\u0e18\u0e4c', '\u0e21\u0e35\u0e19\u0e32\u0e04\u0e21', '\u0e40\u0e21\u0e29\u0e32\u0e22\u0e19', '\u0e1e\u0e24\u0e29\u0e20\u0e32\u0e04\u0e21', '\u0e21\u0e34\u0e16\u0e38\u0e19\u0e32\u0e22\u0e19', '\u0e01\u0e23\u0e01\u0e0e\u0e32\u0e04\u0e21', '\u0e2a\u0e34\u0e07\u0e2b\u0e32\u0e04\u0e21', '\u0e01\u0e31\u0e19\u0e22\u0e32\u0e22\u0e19',
+              '\u0e15\u0e38\u0e25\u0e32\u0e04\u0e21', '\u0e1e\u0e24\u0e28\u0e08\u0e34\u0e01\u0e32\u0e22\u0e19', '\u0e18\u0e31\u0e19\u0e27\u0e32\u0e04\u0e21']
+    return f"{d.day}  {months[d.month - 1]} {d.year + 543}"
+
+
+def generate_cases(n_rows, seed=0, start=datetime(2022, 1, 1), end=datetime(2026, 1, 18)):
+    """Return `n_rows` case rows in HEADER order, sorted by report date."""
+    rng = np.random.default_rng(seed)
+    n = n_rows
+    days = np.sort(rng.integers(0, max((end - start).days, 1) + 1, size=n))
+    dates = [start + timedelta(days=int(d)) for d in days]
+    seconds = rng.integers(0, 24 * 3600, size=n)
+    times = [time(int(s) // 3600, int(s) % 3600 // 60, int(s) % 60) for s in seconds]
+    tickets = [f"RS{d.year % 100:02d}{100_000_000 + i:09d}" for i, d in enumerate(dates)]
+
+    # Policies: about half the calls come from non-customers without a policy
+    has_policy = rng.random(n) < 0.5
+    policy_types = _pick(rng, POLICY_TYPES, n, [55, 24, 12, 5, 4])
+    policy_ids = rng.integers(1, 12_000, size=n)
+    dashed = rng.random(n) < 0.3
+    policy_no = [
+        ('-' if not has else
+         f"HQ-{pt}-{pid:07d}-00000-{d.year - 1}-{d.month:02d}" if dash else f"HQ{pt}{pid:07d}00000{d.year - 1}{d.month:02d}")
+        for has, pt, pid, dash, d in zip(has_policy, policy_types, policy_ids, dashed, dates)
+    ]
+    # Coverage dates: a year from a start before the call, as dates or mm/dd/yyyy text
+    has_cover = has_policy & (rng.random(n) < 0.35)
+    cover_start = [d - timedelta(days=int(o)) for d, o in zip(dates, rng.integers(1, 365, size=n))]
+    as_text = rng.random(n) < 0.65
+    cover_from, cover_to = [], []
+    for has, cs, txt in zip(has_cover, cover_start, as_text):
+        if not has:
+            cover_from.append(None)
+            cover_to.append(None)
+            continue
+        ce = cs.replace(year=cs.year + 1) if not (cs.month == 2 and cs.day == 29) else cs + timedelta(days=365)
+        cover_from.append(cs.strftime('%m/%d/%Y') if txt else cs)
+        cover_to.append(ce.strftime('%m/%d/%Y') if txt else ce)
+
+    names = [f"{t}{f} {l}".rstrip() for t, f, l in zip(_pick(rng, TITLES, n), _pick(rng, FIRST_NAMES, n),
+                                                      _pick(rng, LAST_NAMES, n))]
+    phones = [int(p) if s > 0.05 else f"+66{p}"
+              for p, s in zip(rng.integers(600_000_000, 999_999_999, size=n), rng.random(n))]
+
+    # Vehicles: makes and models only for policy holders
+    makes = _pick(rng, list(MAKES), n, [MAKE_WEIGHTS.get(m, 1) for m in MAKES])
+    models = [MAKES[m][int(i) % len(MAKES[m])] for m, i in zip(makes, rng.integers(0, 1_000, size=n))]
+    spelled = [MAKE_SPELLINGS[m][int(i) % len(MAKE_SPELLINGS[m])] if m in MAKE_SPELLINGS and s < 0.1 else m
+               for m, i, s in zip(makes, rng.integers(0, 10, size=n), rng.random(n))]
+    plate_province = _pick(rng, PROVINCES, n, [40 if p == '\u0e01\u0e23\u0e38\u0e07\u0e40\u0e17\u0e1e\u0e21\u0e2b\u0e32\u0e19\u0e04\u0e23' else 1 for p in PROVINCES])
+    plate_province = [_pick(rng, BANGKOK_SPELLINGS, 1)[0] if p == '\u0e01\u0e23\u0e38\u0e07\u0e40\u0e17\u0e1e\u0e21\u0e2b\u0e32\u0e19\u0e04\u0e23' else p for p in plate_province]
+    letters = _pick(rng, PLATE_LETTERS, 2 * n).reshape(n, 2)
+    plates = [f"{d}{a}{b}{num}{prov}" for d, (a, b), num, prov in
+              zip(rng.integers(1, 10, size=n), letters, rng.integers(1, 10_000, size=n), plate_province)]
+    with_vehicle = has_policy | (rng.random(n) < 0.1)
+
+    incident_province = _pick(rng, PROVINCES[:75], n, [30 if p == '\u0e01\u0e23\u0e38\u0e07\u0e40\u0e17\u0e1e\u0e21\u0e2b\u0e32\u0e19\u0e04\u0e23' else 1 for p in PROVINCES[:75]])
+    incident_province = ['\u0e01\u0e23\u0e38\u0e07\u0e40\u0e17\u0e1e' if p == '\u0e01\u0e23\u0e38\u0e07\u0e40\u0e17\u0e1e\u0e21\u0e2b\u0e32\u0e19\u0e04\u0e23' and s < 0.5 else p
+                         for p, s in zip(incident_province, rng.random(n))]
+    located = rng.random(n) < 0.55
+    places = [f"{pl} {i} {prov}" for pl, i, prov in zip(_pick(rng, PLACES, n), rng.integers(1, 400, size=n),
+                                                         incident_province)]
+    causes = [f"{c} {d}" if s < 0.6 else c for c, d, s in zip(_pick(rng, CAUSES, n), _pick(rng, CAUSE_DETAILS, n),
+                                                            rng.random(n))]
+    causes = [f"{c} ({i})" if s < 0.3 else c for c, i, s in zip(causes, rng.integers(1, 200, size=n), rng.random(n))]
+    services = _pick(rng, list(SERVICE_TYPES), n, list(SERVICE_TYPES.values()))
+    actions = [f"{a} {p}" if s < 0.4 else a for a, p, s in zip(_pick(rng, ACTIONS, n), places, rng.random(n))]
+
+    # Only dispatched services carry a distance, fee and customer top-up
+    dispatched = ~np.isin(services, ['\u0e2a\u0e2d\u0e1a\u0e16\u0e32\u0e21\u0e02\u0e49\u0e2d\u0e21\u0e39\u0e25', '\u0e25\u0e39\u0e01\u0e04\u0e49\u0e32\u0e41\u0e08\u0e49\u0e07\u0e22\u0e01\u0e40\u0e25\u0e34\u0e01', '\u0e1b\u0e23\u0e36\u0e01\u0e29\u0e32\u0e0a\u0e48\u0e32\u0e07\u0e40\u0e17\u0e04\u0e19\u0e34\u0e04'])
+    billed = dispatched | (rng.random(n) < 0.15)
+    distance = rng.integers(1, 120, size=n)
+    fee = np.clip(rng.lognormal(7.2, 0.6, size=n), 100, 9_000).astype(int)
+    topup = rng.integers(50, 1_500, size=n)
+    projects = _pick(rng, list(PROJECTS), n, [30, 5, 6, 4, 3, 6, 2, 2, 2] + [1] * (len(PROJECTS) - 9))
+    with_project = has_policy & (rng.random(n) < 0.9)
+
+    rows = []
+    for i in range(n):
+        veh = with_vehicle[i]
+        rows.append((
+            i + 1 if i % 35 == 0 else None, tickets[i], dates[i], times[i], None, policy_no[i],
+            cover_from[i], cover_to[i], None, policy_types[i] if has_policy[i] else '-', names[i], phones[i],
+            plates[i] if veh else '-', None, None, None,
+            spelled[i] if veh else '-', models[i] if veh else '-',
+            places[i] if located[i] else '-', incident_province[i] if located[i] else '-',
+            causes[i], services[i], actions[i], None, places[i] if dispatched[i] else '-',
+            int(distance[i]) if dispatched[i] else None, int(fee[i]) if billed[i] else None,
+            int(topup[i]) if billed[i] and topup[i] < 900 else None, None,
+            projects[i] if with_project[i] else '-', PROJECTS[projects[i]] if with_project[i] else '-', '-',
+        ))
+    return rows
+
+
+def write_report(path, n_rows, seed=0, summary_sheet=True):
+    """Write a synthetic report workbook with `n_rows` cases to `path`."""
+    if n_rows > MAX_SHEET_ROWS:
+        raise ValueError(f"An Excel sheet holds at most {MAX_SHEET_ROWS:,} cases")
+    rows = generate_cases(n_rows, seed=seed)
+    wb = openpyxl.Workbook(write_only=True)
+    if summary_sheet:
+        summary = wb.create_sheet('Summary')
+        summary.append(['Monthly Report EMERGENCY ROADSIDE ASSISTANCE'])
+        summary.append(['Service', 'Cases'])
+        for service in SERVICE_TYPES:
+            summary.append([service, sum(1 for r in rows if r[21] == service)])
+    ws = wb.create_sheet('3.ASP_Weekly Roadside Report')
+    width = len(HEADER)
+    first, last = (rows[0][2], rows[-1][2]) if rows else (datetime.now(), datetime.now())
+    ws.append([None] * width)
+    ws.append(['Monthly Report EMERGENCY ROADSIDE ASSISTANCE (Inbound Call)'] + [None] * (width - 1))
+    ws.append([f"\u0e08\u0e32\u0e01\u0e27\u0e31\u0e19\u0e23\u0e31\u0e1a\u0e40\u0e23\u0e37\u0e48\u0e2d\u0e07 {_thai_date(first)} - {_thai_date(last)}"] + [None] * 20
+              + ['\u0e15\u0e49\u0e2d\u0e07\u0e01\u0e32\u0e23\u0e43\u0e2b\u0e49\u0e40\u0e1b\u0e47\u0e19 Drop down Lists'] + [None] * (width - 22))
+    ws.append([None] * 9 + ['\u0e1b\u0e23\u0e30\u0e40\u0e20\u0e17\u0e01\u0e23\u0e21\u0e18\u0e23\u0e23\u0e21\u0e4c \u0e0a\u0e31\u0e49\u0e191 \u0e0a\u0e31\u0e49\u0e192...'] + [None] * 19 + ['PROJECT_CODE', 'DIVISION_CODE', None])
+    ws.append(HEADER)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic RSA report workbook.")
+    parser.add_argument('path', help="output .xlsx path")
+    parser.add_argument('--rows', type=int, default=100_000, help="number of cases (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-summary-sheet', action='store_true', help="write only the report sheet")
+    args = parser.parse_args(argv)
+    write_report(args.path, args.rows, seed=args.seed, summary_sheet=not args.no_summary_sheet)
+
+
+if __name__ == '__main__':
+    main()